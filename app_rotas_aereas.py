@@ -1,11 +1,9 @@
 import streamlit as st
 import polars as pl
 import folium
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 import plotly.graph_objects as go
-from folium.plugins import AntPath
-import math
-import unicodedata
+from folium.plugins import AntPath, MarkerCluster
 import os
 import hashlib
 import io
@@ -13,18 +11,25 @@ import platform
 import gc  # Garbage collection
 import duckdb
 import tempfile
+import json
+import shutil
+import stat
+import threading
+import queue
+from collections import OrderedDict
 try:
     import psutil  # Monitoramento de memória
     PSUTIL_AVAILABLE = True
 except ImportError:
     PSUTIL_AVAILABLE = False
 from pathlib import Path
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
-import base64
+from od_aereo import geometry as geometria
+from od_aereo.build import build_encrypted_db
+from od_aereo.crypto import KDF_VERSION, compute_multilayer_key, decrypt_bytes, decrypt_file_stream, is_stream_container
+from od_aereo.entities import ENTITY_DICTIONARY_SQL, MUNICIPIO, UTP, DicionarioEntidades, regiao_da_uf
+from od_aereo.pair_cache import CachePares
+from od_aereo.perf import Medicao, contar_linhas, gravar_jsonl
+from od_aereo.search import IndiceBusca
 import logging
 
 # Configurar logging detalhado para debug em deploy
@@ -418,328 +423,762 @@ def _get_crypto_config():
     
     return config
 
-def _decode_b64_value(value: str) -> bytes:
-    """Decodifica valores base64 do secrets.toml"""
-    if value.startswith('b64:'):
-        return base64.b64decode(value[4:])
-    return value.encode()
-
-def _generate_fixed_entropy(config: dict) -> bytes:
-    """Gera entropia fixa baseada nas configurações do secrets.toml para compatibilidade entre ambientes"""
-    # Usar configurações do secrets.toml para gerar entropia determinística
-    entropy_components = [
-        config['entropy_factor'],
-        config['salt_primary'], 
-        config['salt_secondary'],
-        "od_aero_fixed_entropy_2024"
-    ]
-    
-    # Combinar todos os componentes
-    combined = "_".join(entropy_components)
-    return hashlib.sha256(combined.encode()).digest()
-
-def _derive_multilayer_key(password: str) -> bytes:
-    """Deriva chave usando múltiplas camadas de segurança"""
-    config = _get_crypto_config()
-    
-    if not config['password']:
-        st.error("❌ Configurações de criptografia não encontradas.")
-        st.stop()
-    
-    # Camada 1: Decodificar salts e pepper do secrets.toml
+def _get_app_setting(name: str, default=None):
+    """Lê configuração opcional do secrets.toml com fallback para variável de ambiente"""
     try:
-        salt_primary = _decode_b64_value(config['salt_primary'])
-        salt_secondary = _decode_b64_value(config['salt_secondary'])
-        pepper = _decode_b64_value(config['pepper'])
-        integrity_key = _decode_b64_value(config['integrity_key'])
+        if hasattr(st, 'secrets') and name in st.secrets:
+            return st.secrets.get(name)
     except Exception:
-        st.error("❌ Erro ao decodificar configurações criptográficas.")
-        st.stop()
-    
-    # Camada 2: Gerar entropia fixa compatível entre ambientes
-    fixed_entropy = _generate_fixed_entropy(config)
-    
-    # Camada 3: Combinar senha com fator de entropia
-    enhanced_password = f"{password}_{config['entropy_factor']}"
-    
-    # Camada 4: Primeira derivação com PBKDF2
-    kdf1 = PBKDF2HMAC(
-        algorithm=hashes.SHA512(),
-        length=64,
-        salt=salt_primary + fixed_entropy[:16],
-        iterations=200000,
-    )
-    intermediate_key1 = kdf1.derive(enhanced_password.encode())
-    
-    # Camada 5: Segunda derivação com Scrypt (mais resistente a ataques de hardware)
-    kdf2 = Scrypt(
-        length=32,
-        salt=salt_secondary + pepper[:16],
-        n=2**14,  # CPU/memory cost factor
-        r=8,      # block size
-        p=1,      # parallelization factor
-    )
-    intermediate_key2 = kdf2.derive(intermediate_key1[:32])
-    
-    # Camada 6: Derivação final com HKDF para máxima entropia
-    hkdf = HKDF(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=integrity_key + fixed_entropy[16:],
-        info=b"od_aero_final_key_derivation_2024",
-    )
-    final_key = hkdf.derive(intermediate_key2 + pepper)
-    
-    return base64.urlsafe_b64encode(final_key)
+        pass
+    return os.getenv(name, default)
+
+def _crypto_config_fingerprint(password: str, config: dict) -> str:
+    """Fingerprint da configuração criptográfica usada como chave do cache de derivação"""
+    h = hashlib.sha256()
+    for part in (KDF_VERSION, password, config['salt_primary'], config['salt_secondary'],
+                 config['pepper'], config['entropy_factor'], config['integrity_key']):
+        h.update((part or '').encode())
+        h.update(b'\0')
+    return h.hexdigest()
 
-def _verify_file_integrity(encrypted_data: bytes, config: dict) -> bool:
-    """Verifica integridade do arquivo criptografado"""
+@st.cache_resource(show_spinner=False)
+def _derived_key_store():
+    # Cache por processo (sobrevive a reruns e sessões); lock evita derivações concorrentes
+    return {'lock': threading.Lock(), 'keys': {}, 'hits': 0, 'saved_seconds': 0.0}
+
+def _get_key_cache_file():
+    """Keyfile local opcional (KEY_CACHE_FILE) e seu TTL em segundos (KEY_CACHE_TTL)"""
+    path = _get_app_setting('KEY_CACHE_FILE')
     try:
-        integrity_key = _decode_b64_value(config['integrity_key'])
-        # Verificação simples de integridade baseada em hash
-        file_hash = hashlib.sha256(encrypted_data + integrity_key).hexdigest()
-        # Em uma implementação real, este hash seria armazenado com o arquivo
-        # Por simplicidade, assumimos que arquivos válidos passam na verificação
-        return len(encrypted_data) > 0
-    except Exception:
-        return False
+        ttl = int(_get_app_setting('KEY_CACHE_TTL', 86400))
+    except (TypeError, ValueError):
+        ttl = 86400
+    return path, ttl
+
+def _load_key_cache_file(fingerprint: str):
+    path, ttl = _get_key_cache_file()
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        st_mode = os.stat(path).st_mode
+        if st_mode & 0o077:
+            logger.warning(f"AVISO: Keyfile {path} com permissões abertas - ignorado")
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('fingerprint') != fingerprint:
+            return None
+        if time.time() - float(data.get('created_at', 0)) > ttl:
+            logger.info("KDF: Keyfile expirado (TTL) - removendo")
+            os.remove(path)
+            return None
+        return {
+            'key': data['key'].encode(),
+            'derive_seconds': float(data.get('derive_seconds', 0.0)),
+        }
+    except Exception as e:
+        logger.warning(f"AVISO: Falha ao ler keyfile {path}: {e}")
+        return None
 
-def _encrypt_bytes(data: bytes, password: str) -> bytes:
-    key = _derive_multilayer_key(password)
-    fernet = Fernet(key)
+def _store_key_cache_file(fingerprint: str, entry: dict) -> None:
+    path, _ = _get_key_cache_file()
+    if not path:
+        return
     try:
-        import gzip
-        compressed = gzip.compress(data)
-    except Exception:
-        compressed = data
-    return fernet.encrypt(compressed)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Criado já com 0600: a chave nunca fica legível por outros usuários
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'fingerprint': fingerprint,
+                'created_at': time.time(),
+                'derive_seconds': entry['derive_seconds'],
+                'key': entry['key'].decode(),
+            }, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"AVISO: Falha ao gravar keyfile {path}: {e}")
 
-def _decrypt_bytes(encrypted_data: bytes, password: str) -> bytes:
-    key = _derive_multilayer_key(password)
-    fernet = Fernet(key)
-    decrypted = fernet.decrypt(encrypted_data)
+def _derive_multilayer_key(password: str) -> bytes:
+    """Deriva a chave multicamada no máximo uma vez por processo (cache em memória + keyfile opcional)"""
+    config = _get_crypto_config()
+    
+    if not config['password']:
+        # Roda também na thread de provisionamento: o erro chega à UI por wait_for_db
+        raise RuntimeError("Configurações de criptografia não encontradas.")
+    
+    fingerprint = _crypto_config_fingerprint(password, config)
+    store = _derived_key_store()
+    with store['lock']:
+        entry = store['keys'].get(fingerprint)
+        if entry is not None:
+            store['hits'] += 1
+            store['saved_seconds'] += entry['derive_seconds']
+            logger.debug(
+                f"KDF: Chave em cache (hits: {store['hits']}, "
+                f"economia acumulada: {store['saved_seconds']:.2f}s)"
+            )
+            return entry['key']
+        
+        entry = _load_key_cache_file(fingerprint)
+        if entry is not None:
+            logger.info(f"KDF: Chave carregada do keyfile - derivação evitada (~{entry['derive_seconds']:.2f}s economizados)")
+        else:
+            started = time.perf_counter()
+            key = _compute_multilayer_key(password, config)
+            entry = {'key': key, 'derive_seconds': time.perf_counter() - started}
+            logger.info(f"KDF: Chave multicamada derivada em {entry['derive_seconds']:.2f}s")
+            _store_key_cache_file(fingerprint, entry)
+        store['keys'][fingerprint] = entry
+        return entry['key']
+
+def _compute_multilayer_key(password: str, config: dict) -> bytes:
+    """Deriva chave usando múltiplas camadas de segurança (od_aereo.crypto, mesma do build)"""
     try:
-        import gzip
-        return gzip.decompress(decrypted)
-    except Exception:
-        return decrypted
+        return compute_multilayer_key(password, config)
+    except ValueError as e:
+        raise RuntimeError(f"Erro ao decodificar configurações criptográficas: {e}") from e
 
 def _get_encrypted_db_path() -> str:
     # Guardar o arquivo do banco criptografado dentro de Dados/
     os.makedirs('Dados', exist_ok=True)
     return os.path.join('Dados', 'od_aereo.duckdb.enc')
 
-def _create_duckdb_and_import_all_data(temp_db_path: str) -> None:
-    """Cria um banco DuckDB e importa todos os dados de Dados/."""
-    con = duckdb.connect(temp_db_path)
-    try:
-        dados_base = 'Dados'
-        # Importar CSVs
-        csv_mun_utps = os.path.join(dados_base, 'Entrada', 'mun_UTPs.csv')
-        if os.path.exists(csv_mun_utps):
-            con.execute("DROP TABLE IF EXISTS mun_utps")
-            con.execute("CREATE TABLE mun_utps AS SELECT * FROM read_csv_auto(?, header=true)", [csv_mun_utps])
-            logger.info("✅ Tabela mun_utps criada")
-        csv_centralidades = os.path.join(dados_base, 'Entrada', 'centralidades.csv')
-        if os.path.exists(csv_centralidades):
-            con.execute("DROP TABLE IF EXISTS centralidades")
-            con.execute("CREATE TABLE centralidades AS SELECT * FROM read_csv_auto(?, header=true)", [csv_centralidades])
-            logger.info("✅ Tabela centralidades criada")
-        # Importar Parquet de aeroportos
-        pq_aeroportos = os.path.join(dados_base, 'Entrada', 'aeroportos.parquet')
-        if os.path.exists(pq_aeroportos):
-            con.execute("DROP TABLE IF EXISTS aeroportos")
-            con.execute("CREATE TABLE aeroportos AS SELECT * FROM read_parquet(?)", [pq_aeroportos])
-            logger.info("✅ Tabela aeroportos criada")
-        # Mapear e importar todos os parquet de resultados
-        mapas = [
-            (
-                os.path.join(dados_base, 'Resultados', 'Pares OD - Por Municipio - Matriz Infra S.A. - 2019'),
-                {
-                    'Voos Comerciais.parquet': 'por_municipio_voos_comerciais',
-                    'Voos Executivos.parquet': 'por_municipio_voos_executivos',
-                    'classificacao_pares.parquet': 'por_municipio_classificacao'
-                }
-            ),
-            (
-                os.path.join(dados_base, 'Resultados', 'Pares OD - Agregação UTP - Matriz Infra S.A. - 2019'),
-                {
-                    'Voos Comerciais.parquet': 'utp_voos_comerciais',
-                    'Voos Executivos.parquet': 'utp_voos_executivos',
-                    'classificacao_pares.parquet': 'utp_classificacao'
-                }
-            ),
-            (
-                os.path.join(dados_base, 'Resultados', 'Pares OD - Municipio x Centralidade'),
-                {
-                    'Voos Comerciais.parquet': 'mun_centralidade_voos_comerciais',
-                    'Voos Executivos.parquet': 'mun_centralidade_voos_executivos',
-                    'classificacao_pares.parquet': 'mun_centralidade_classificacao'
-                }
-            )
-        ]
-        for pasta, nomes in mapas:
-            for arquivo, tabela in nomes.items():
-                caminho = os.path.join(pasta, arquivo)
-                if os.path.exists(caminho):
-                    con.execute(f"DROP TABLE IF EXISTS {tabela}")
-                    con.execute(f"CREATE TABLE {tabela} AS SELECT * FROM read_parquet(?)", [caminho])
-                    logger.info(f"✅ Tabela {tabela} criada a partir de {caminho}")
-        con.commit()
-    finally:
-        # Não fechar conexão singleton
-        pass
-
 def _ensure_encrypted_duckdb(password: str) -> str:
     """Gera (se necessário) e retorna o caminho do banco DuckDB criptografado."""
     enc_path = _get_encrypted_db_path()
     if not os.path.exists(enc_path):
+        # Mesmo pipeline de tools/build_duckdb.py: índices, partições e tabelas derivadas
         logger.info("🔧 Criando banco DuckDB e importando dados...")
-        with tempfile.TemporaryDirectory() as td:
-            temp_db = os.path.join(td, 'od_aereo.duckdb')
-            _create_duckdb_and_import_all_data(temp_db)
-            with open(temp_db, 'rb') as f:
-                db_bytes = f.read()
-            enc_bytes = _encrypt_bytes(db_bytes, password)
-            with open(enc_path, 'wb') as f:
-                f.write(enc_bytes)
+        build_encrypted_db(enc_path, _derive_multilayer_key(password), dados_base=os.path.dirname(enc_path))
         logger.info("✅ Banco DuckDB criptografado criado")
     return enc_path
 
-def _decrypt_db_to_temp(password: str) -> str:
-    enc_path = _ensure_encrypted_duckdb(password)
+# Cache persistente do banco descriptografado, endereçado pelo hash do .enc.
+# Sobrevive a reinícios do processo (inclusive os do StreamlitAutoRecovery via os.execv).
+_DB_CACHE_FILE = 'od_aereo.duckdb'
+_DB_CACHE_META = 'meta.json'
+_DB_CACHE_SAMPLE = 1024 * 1024  # bytes do início/fim usados na verificação rápida
+
+def _secure_private_dir(path: str) -> str:
+    """Cria (ou aceita) um diretório só do usuário atual: recusa symlink, outro dono; força 0700.
+    
+    O banco fica em claro aqui: um diretório pré-criado por outro usuário local permitiria
+    lê-lo ou plantar uma entrada falsa.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError(f"Diretório de cache do banco inválido (não é um diretório real): {path}")
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise RuntimeError(f"Diretório de cache do banco pertence a outro usuário: {path}")
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        os.chmod(path, 0o700)
+    return path
+
+def _get_db_cache_dir() -> str:
+    # Padrão por usuário (sufixo uid), nunca um nome fixo compartilhado em /tmp
+    sufixo = f"_{os.getuid()}" if hasattr(os, 'getuid') else ''
+    cache_dir = _get_app_setting('DB_CACHE_DIR') or os.path.join(tempfile.gettempdir(), f'od_aereo_db_cache{sufixo}')
+    return _secure_private_dir(cache_dir)
+
+def _create_private_file(path: str) -> None:
+    """Cria o arquivo vazio com 0600 (independente do umask) antes de receber dados em claro"""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+
+def _get_db_cache_max_bytes() -> int:
+    try:
+        return int(float(_get_app_setting('DB_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return 2048 * 1024 * 1024
+
+def _hash_file(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _get_encrypted_db_hash(enc_path: str, cache_dir: str) -> str:
+    """SHA-256 do .enc, memorizado por (caminho, tamanho, mtime) para não reler o arquivo a cada início"""
+    stat = os.stat(enc_path)
+    stat_key = f"{os.path.abspath(enc_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    memo_path = os.path.join(cache_dir, 'enc_hash.json')
+    try:
+        with open(memo_path, 'r', encoding='utf-8') as f:
+            memo = json.load(f)
+        if memo.get('stat_key') == stat_key:
+            return memo['sha256']
+    except Exception:
+        pass
+    digest = _hash_file(enc_path)
+    try:
+        tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'stat_key': stat_key, 'sha256': digest}, f)
+        os.replace(tmp_path, memo_path)
+    except Exception as e:
+        logger.warning(f"AVISO: Falha ao memorizar hash do banco: {e}")
+    return digest
+
+def _sample_digest(path: str) -> str:
+    """Hash do primeiro e do último MB do arquivo - verificação de integridade barata"""
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(_DB_CACHE_SAMPLE))
+        if size > _DB_CACHE_SAMPLE:
+            f.seek(max(size - _DB_CACHE_SAMPLE, _DB_CACHE_SAMPLE))
+            h.update(f.read(_DB_CACHE_SAMPLE))
+    return h.hexdigest()
+
+def _validate_db_cache_entry(entry_dir: str, enc_hash: str) -> bool:
+    db_path = os.path.join(entry_dir, _DB_CACHE_FILE)
+    meta_path = os.path.join(entry_dir, _DB_CACHE_META)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return (
+            meta.get('enc_sha256') == enc_hash
+            and os.path.getsize(db_path) == meta.get('size')
+            and _sample_digest(db_path) == meta.get('sample_sha256')
+        )
+    except Exception:
+        return False
+
+def _decrypt_enc_to_path(enc_path: str, dst_path: str, password: str) -> int:
+    if is_stream_container(enc_path):
+        written = decrypt_file_stream(enc_path, dst_path, _derive_multilayer_key(password))
+        logger.info(f"OK: Banco descriptografado em frames: {written / 1024 / 1024:.1f}MB")
+        return written
+    # Formato legado (Fernet em blob único) - carrega o arquivo inteiro em memória
+    logger.warning("AVISO: Banco no formato legado (blob único) - regenere com tools/build_duckdb.py")
     with open(enc_path, 'rb') as f:
         enc_bytes = f.read()
-    plain_bytes = _decrypt_bytes(enc_bytes, password)
-    tmp_dir = tempfile.mkdtemp(prefix='od_aereo_db_')
-    tmp_db = os.path.join(tmp_dir, 'od_aereo.duckdb')
-    with open(tmp_db, 'wb') as f:
+    plain_bytes = decrypt_bytes(enc_bytes, _derive_multilayer_key(password))
+    with open(dst_path, 'wb') as f:
         f.write(plain_bytes)
-    return tmp_db
+    return len(plain_bytes)
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _gc_db_cache(cache_dir: str, keep_entry: str) -> None:
+    """Remove cópias antigas (menos usadas primeiro) até o cache caber em DB_CACHE_MAX_MB"""
+    max_bytes = _get_db_cache_max_bytes()
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        if os.path.isdir(entry_dir):
+            entries.append((os.path.getmtime(entry_dir), entry_dir, _dir_size(entry_dir)))
+    total = sum(size for _, _, size in entries)
+    for _, entry_dir, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(entry_dir) == os.path.abspath(keep_entry):
+            continue
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        logger.info(f"LIMPEZA: Cópia antiga do banco removida do cache: {entry_dir} ({size / 1024 / 1024:.1f}MB)")
+
+def _decrypt_db_to_cache(password: str) -> str:
+    """Retorna o banco descriptografado do cache persistente, descriptografando apenas se necessário."""
+    enc_path = _ensure_encrypted_duckdb(password)
+    cache_dir = _get_db_cache_dir()
+    enc_hash = _get_encrypted_db_hash(enc_path, cache_dir)
+    entry_dir = os.path.join(cache_dir, enc_hash[:32])
+    db_path = os.path.join(entry_dir, _DB_CACHE_FILE)
+    
+    if _validate_db_cache_entry(entry_dir, enc_hash):
+        os.utime(entry_dir)  # marca como usado recentemente para o GC
+        logger.info(f"OK: Banco descriptografado reaproveitado do cache: {db_path}")
+    else:
+        _secure_private_dir(entry_dir)
+        part_path = f"{db_path}.{os.getpid()}.part"
+        if os.path.lexists(part_path):
+            os.remove(part_path)
+        try:
+            _create_private_file(part_path)
+            size = _decrypt_enc_to_path(enc_path, part_path, password)
+            os.replace(part_path, db_path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        # meta.json é gravado por último: sua presença marca a entrada como completa
+        meta_tmp = os.path.join(entry_dir, f"{_DB_CACHE_META}.{os.getpid()}.tmp")
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'enc_sha256': enc_hash,
+                'size': size,
+                'sample_sha256': _sample_digest(db_path),
+                'created_at': time.time(),
+            }, f)
+        os.replace(meta_tmp, os.path.join(entry_dir, _DB_CACHE_META))
+    
+    try:
+        _gc_db_cache(cache_dir, entry_dir)
+    except Exception as e:
+        logger.warning(f"AVISO: Falha na limpeza do cache do banco: {e}")
+    return db_path
+
+def _get_int_setting(name: str, default: int) -> int:
+    try:
+        return int(_get_app_setting(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# Perfil de execução do DuckDB (secrets/env): limita memória e threads por processo para
+# dimensionar quantos workers cabem em cada host
+_DUCKDB_RUNTIME_SETTINGS = {
+    'memory_limit': 'DUCKDB_MEMORY_LIMIT',
+    'threads': 'DUCKDB_THREADS',
+    'temp_directory': 'DUCKDB_TEMP_DIRECTORY',
+    'enable_object_cache': 'DUCKDB_OBJECT_CACHE',
+}
+_DUCKDB_DEFAULT_CONFIG = {'preserve_insertion_order': False, 'enable_object_cache': True}
+
+def _duckdb_runtime_config() -> dict:
+    """Configuração passada ao duckdb.connect; ausentes ficam no padrão do DuckDB"""
+    config = dict(_DUCKDB_DEFAULT_CONFIG)
+    for opcao, nome in _DUCKDB_RUNTIME_SETTINGS.items():
+        valor = _get_app_setting(nome)
+        if valor is None or str(valor).strip() == '':
+            continue
+        if opcao == 'threads':
+            try:
+                valor = int(valor)
+            except (TypeError, ValueError):
+                logger.warning(f"AVISO: {nome}={valor!r} inválido - usando o padrão do DuckDB")
+                continue
+        elif opcao == 'enable_object_cache':
+            valor = str(valor).strip().lower() in ('1', 'true', 'yes', 'on')
+        elif opcao == 'temp_directory':
+            os.makedirs(str(valor), exist_ok=True)
+        config[opcao] = valor
+    return config
+
+def _connect_db(db_path: str):
+    """Abre o banco descriptografado somente leitura com o perfil de execução configurado.
+    
+    Valor rejeitado pelo DuckDB (ex.: DUCKDB_MEMORY_LIMIT mal escrito) não derruba o app:
+    reabre com os padrões.
+    """
+    config = _duckdb_runtime_config()
+    try:
+        return duckdb.connect(db_path, read_only=True, config=config)
+    except duckdb.Error as e:
+        if config == _DUCKDB_DEFAULT_CONFIG:
+            raise
+        logger.warning(f"AVISO: Perfil do DuckDB rejeitado ({e}) - abrindo com os padrões")
+        return duckdb.connect(db_path, read_only=True, config=dict(_DUCKDB_DEFAULT_CONFIG))
+
+def _log_duckdb_settings(con):
+    nomes = ['preserve_insertion_order', *_DUCKDB_RUNTIME_SETTINGS]
+    rows = con.execute(
+        f"SELECT name, value FROM duckdb_settings() WHERE name IN ({', '.join('?' * len(nomes))})", nomes
+    ).fetchall()
+    efetivos = ', '.join(f"{nome}={valor}" for nome, valor in sorted(rows))
+    logger.info(f"CONFIG: DuckDB em execução com {efetivos}")
 
 @st.cache_resource(show_spinner=False)
 def _db_state():
     # Desbloqueia apenas uma vez no ciclo de vida do app
     pwd = get_files_password()
-    tmp_db_path = _decrypt_db_to_temp(pwd)
+    tmp_db_path = _decrypt_db_to_cache(pwd)
     # Otimização: Conectar em modo somente leitura para maior segurança e performance no deploy
-    con = duckdb.connect(tmp_db_path, read_only=True)
-    return {'path': tmp_db_path, 'con': con}
-
-def get_duckdb_connection():
-    """Retorna conexão DuckDB persistente; reabre sem redescifrar se necessário."""
-    state = _db_state()
-    con = state['con']
+    con = _connect_db(tmp_db_path)
     try:
-        con.execute("SELECT 1")
-        return con
+        _log_duckdb_settings(con)
+    except Exception as e:
+        logger.warning(f"AVISO: Não foi possível ler as configurações do DuckDB: {e}")
+    state = {
+        'path': tmp_db_path,
+        # Versão do conjunto de dados: diretório da entrada no cache = prefixo do SHA-256 do .enc
+        'version': os.path.basename(os.path.dirname(tmp_db_path)),
+        'con': con,
+        'lock': threading.Lock(),
+        # Cursores livres (con.cursor()) e cursores emprestados por thread de execução
+        'pool': queue.Queue(),
+        'leases': {},
+        'created': 0,
+        'max_cursors': max(1, _get_int_setting('DUCKDB_POOL_SIZE', 8)),
+        'generation': 0,
+    }
+    intervalo = max(1, _get_int_setting('DUCKDB_HEALTH_INTERVAL', 30))
+    threading.Thread(
+        target=_db_health_loop, args=(state, intervalo), name='duckdb-health', daemon=True
+    ).start()
+    logger.info(f"OK: Banco DuckDB aberto com pool de até {state['max_cursors']} cursores")
+    return state
+
+def dataset_version() -> str:
+    """Token da versão do banco, chave barata (string) dos caches de estruturas derivadas"""
+    return _db_state()['version']
+
+def _reclaim_dead_leases(state):
+    """Devolve ao pool os cursores de threads de execução que já terminaram (chamar com o lock)"""
+    for ident, (thread, cursor, generation, pooled) in list(state['leases'].items()):
+        if not thread.is_alive():
+            del state['leases'][ident]
+            _release_cursor(state, cursor, generation, pooled)
+
+def _release_cursor(state, cursor, generation, pooled: bool = True):
+    if pooled and generation == state['generation']:
+        state['pool'].put(cursor)
+        return
+    # Cursor avulso (pool esgotado) ou de um handle já substituído pelo health check: descartar
+    if pooled:
+        state['created'] -= 1
+    try:
+        cursor.close()
     except Exception:
-        # Reabrir usando o arquivo temporário já descriptografado
-        # Otimização: Conectar em modo somente leitura
-        new_con = duckdb.connect(state['path'], read_only=True)
-        state['con'] = new_con
-        return new_con
+        pass
 
-def get_files_password():
-    """Obtém a senha dos arquivos do secrets.toml com verificações de segurança"""
-    config = _get_crypto_config()
-    
-    if not config['password']:
-        st.error("❌ Senha dos arquivos não configurada. Configure FILES_PASSWORD nos secrets.")
-        st.stop()
-    
-    # Verificar se todas as configurações necessárias estão presentes
-    required_configs = ['salt_primary', 'salt_secondary', 'pepper', 'entropy_factor', 'integrity_key']
-    missing_configs = [key for key in required_configs if not config[key]]
+def _db_health_loop(state, intervalo: int):
+    """Health check fora do caminho das consultas: testa o handle e recicla cursores órfãos"""
+    while True:
+        time.sleep(intervalo)
+        with state['lock']:
+            _reclaim_dead_leases(state)
+            try:
+                state['con'].execute("SELECT 1").fetchone()
+                continue
+            except Exception as e:
+                logger.warning(f"AVISO: Conexão DuckDB inválida ({e}); reabrindo o banco")
+            # Reabrir usando o arquivo já descriptografado; cursores antigos são descartados
+            antiga = state['con']
+            try:
+                state['con'] = _connect_db(state['path'])
+            except Exception as e:
+                logger.error(f"ERRO: Falha ao reabrir o banco DuckDB: {e}")
+                continue
+            state['generation'] += 1
+            while True:
+                try:
+                    _release_cursor(state, state['pool'].get_nowait(), -1)
+                except queue.Empty:
+                    break
+            # Fecha o handle antigo para não vazar memória/arquivo a cada reabertura
+            try:
+                antiga.close()
+            except Exception:
+                pass
+
+def _checkout_cursor(state, timeout: float = 2.0):
+    """Retira um cursor do pool limitado, criando um novo enquanto houver vaga.
     
-    if missing_configs:
-        st.error(f"❌ Configurações criptográficas faltando: {', '.join(missing_configs)}")
-        st.stop()
+    Com o pool esgotado além de `timeout`, devolve um cursor avulso (fora do limite) em vez de falhar.
+    Retorna (cursor, geração, pooled).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with state['lock']:
+            _reclaim_dead_leases(state)
+            try:
+                return state['pool'].get_nowait(), state['generation'], True
+            except queue.Empty:
+                pass
+            if state['created'] < state['max_cursors']:
+                state['created'] += 1
+                try:
+                    return state['con'].cursor(), state['generation'], True
+                except Exception:
+                    state['created'] -= 1
+                    raise
+            if time.monotonic() >= deadline:
+                logger.warning(
+                    f"AVISO: Pool de cursores DuckDB esgotado ({state['max_cursors']} em uso) - usando cursor avulso"
+                )
+                return state['con'].cursor(), state['generation'], False
+        time.sleep(0.05)
+
+def get_duckdb_connection():
+    """Cursor DuckDB da thread atual (uma execução do script), emprestado do pool do processo.
     
-    return config['password']
+    Cada sessão consulta pelo seu próprio cursor, em paralelo às demais; o cursor volta ao
+    pool no fim da execução (release_duckdb_connection) ou, se ela parar antes, quando a
+    thread termina.
+    """
+    state = _db_state()
+    thread = threading.current_thread()
+    lease = state['leases'].get(thread.ident)
+    if lease is not None and lease[0] is thread and lease[2] == state['generation']:
+        return lease[1]
+    if lease is not None:
+        with state['lock']:
+            state['leases'].pop(thread.ident, None)
+            _release_cursor(state, lease[1], lease[2], lease[3])
+    cursor, generation, pooled = _checkout_cursor(state)
+    with state['lock']:
+        state['leases'][thread.ident] = (thread, cursor, generation, pooled)
+    return cursor
+
+def release_duckdb_connection() -> None:
+    """Devolve ao pool o cursor emprestado à thread atual (fim da execução do script)"""
+    state = _db_state()
+    with state['lock']:
+        lease = state['leases'].pop(threading.get_ident(), None)
+        if lease is not None:
+            _release_cursor(state, lease[1], lease[2], lease[3])
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _table_columns(db_path: str, table: str) -> tuple:
+    """Colunas de uma tabela/view (db_path entra na chave do cache: muda com o banco)"""
+    con = get_duckdb_connection()
+    rows = con.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [table]
+    ).fetchall()
+    return tuple(row[0] for row in rows)
 
-def check_data_files():
-    """Verifica se o banco DuckDB criptografado existe (gera se necessário)."""
-    try:
-        password = get_files_password()
-        _ensure_encrypted_duckdb(password)
-        return []  # Lista vazia = sem arquivos faltando
-    except Exception as e:
-        logger.error(f"❌ Erro ao preparar banco DuckDB: {e}")
-        return ["Banco DuckDB não disponível"]
+def _route_keys(table: str):
+    """Expressões SQL (origem, destino) das chaves de 6 dígitos e colunas a excluir do SELECT *.
+    
+    Usa as colunas INTEGER o6/d6 materializadas por tools/build_duckdb.py (indexadas e
+    ordenadas); bancos gerados antes delas caem no SUBSTR(CAST(...)) equivalente.
+    """
+    cols = _table_columns(_db_state()['path'], table)
+    if 'o6' in cols and 'd6' in cols:
+        return 'o6', 'd6', 'cod_mun_origem, cod_mun_destino, o6, d6'
+    return (
+        "CAST(SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS INTEGER)",
+        "CAST(SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS INTEGER)",
+        'cod_mun_origem, cod_mun_destino',
+    )
 
-# Configuração da página
-st.set_page_config(
-    page_title="Sistema de Análise de Rotas Aéreas",
-    page_icon="✈️",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+def _route_select(table: str) -> str:
+    """Projeção padrão das tabelas de rotas: códigos de 6 dígitos como texto + demais colunas"""
+    o, d, exclude = _route_keys(table)
+    return (
+        f"CAST({o} AS VARCHAR) AS cod_mun_origem, "
+        f"CAST({d} AS VARCHAR) AS cod_mun_destino, "
+        f"* EXCLUDE ({exclude})"
+    )
 
-# CSS otimizado (mínimo necessário)
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap');
-    * { font-family: 'Inter', sans-serif; }
-    .main-header { 
-        background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%); 
-        padding: 2rem; border-radius: 15px; color: white; margin-bottom: 2rem; 
-    }
-    .metric-container { 
-        background: #f8f9fa; padding: 1.5rem; border-radius: 12px; 
-        text-align: center; margin: 0.5rem; 
-    }
-    .metric-value { font-size: 2rem; font-weight: 700; color: #1e3c72; margin: 0; }
-    .stButton > button { 
-        background: linear-gradient(135deg, #2a5298 0%, #1e3c72 100%); 
-        color: #fff !important; border: none; padding: 0.75rem 2rem; 
-        border-radius: 8px; font-weight: 500; 
-    }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_data(ttl=1800, max_entries=500, show_spinner=False)
+def get_destinos_adjacencia(db_path: str, nivel: str, origem_cod: str):
+    """Destinos alcançáveis da origem via od_adjacency (uma consulta por chave).
+    
+    Retorna None se o banco não tem a tabela (gerado antes dela) para o chamador usar o cálculo antigo.
+    """
+    if not _table_columns(db_path, 'od_adjacency'):
+        return None
+    con = get_duckdb_connection()
+    row = con.execute(
+        "SELECT destinos FROM od_adjacency WHERE nivel = ? AND origem = ?",
+        [nivel, int(origem_cod)]
+    ).fetchone()
+    return [str(cod) for cod in row[0]] if row else []
+
+@st.cache_data(ttl=3600, max_entries=10, show_spinner=False)
+def get_dashboard_stats(db_path: str, nivel: str):
+    """Estatísticas do panorama do nível (uma linha de dashboard_stats); None se a tabela não existe"""
+    if not _table_columns(db_path, 'dashboard_stats'):
+        return None
+    con = get_duckdb_connection()
+    cursor = con.execute("SELECT * FROM dashboard_stats WHERE nivel = ?", [nivel])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col[0] for col in cursor.description], row))
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_entity_dictionary(versao: str) -> DicionarioEntidades:
+    """Rótulos e coordenadas de municípios/UTPs + aeroportos, carregados uma vez por versão para todas as páginas"""
+    inicio = time.perf_counter()
+    con = get_duckdb_connection()
+    # Bancos gerados antes de entity_dictionary derivam as mesmas colunas direto de mun_utps
+    if _table_columns(_db_state()['path'], 'entity_dictionary'):
+        entidades = con.execute("SELECT * FROM entity_dictionary").pl()
+    else:
+        entidades = con.execute(ENTITY_DICTIONARY_SQL).pl()
+    aeroportos = con.execute("SELECT icao, latitude, longitude FROM aeroportos").pl()
+    dicionario = DicionarioEntidades(entidades, aeroportos)
+    logger.info(
+        f"OK: Dicionário de entidades: {dicionario.total(MUNICIPIO)} municípios, {dicionario.total(UTP)} UTPs, "
+        f"{len(dicionario.aeroportos)} aeroportos em {(time.perf_counter() - inicio) * 1000:.0f}ms"
+    )
+    return dicionario
+
+@st.cache_data(ttl=1800, max_entries=500, show_spinner=False)
+def get_distancia_par(db_path: str, nivel: str, origem_cod: str, destino_cod: str):
+    """Distância, faixa e UFs do par pré-calculadas no build (od_distancias); None se indisponível"""
+    if not _table_columns(db_path, 'od_distancias'):
+        return None
+    cursor = get_duckdb_connection().execute(
+        "SELECT distancia_km, categoria, mesmo_estado, uf_origem, uf_destino "
+        "FROM od_distancias WHERE nivel = ? AND origem = ? AND destino = ?",
+        [nivel, int(origem_cod), int(destino_cod)]
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col[0] for col in cursor.description], row))
+
+_ICONES_CATEGORIA_DISTANCIA = {
+    'Curta Distância': "📍 Curta Distância",
+    'Média Distância': "🛣️ Média Distância",
+    'Longa Distância': "✈️ Longa Distância",
+}
+
+# Tabelas de rotas por nível de análise: (comerciais, executivos, classificação)
+_TABELAS_NIVEL = {
+    'municipios': ('por_municipio_voos_comerciais', 'por_municipio_voos_executivos', 'por_municipio_classificacao'),
+    'utps': ('utp_voos_comerciais', 'utp_voos_executivos', 'utp_classificacao'),
+    'centralidades': ('mun_centralidade_voos_comerciais', 'mun_centralidade_voos_executivos', 'mun_centralidade_classificacao'),
+}
+
+def _pair_keys(nivel: str, table: str):
+    """Expressões (origem, destino) e projeção de linhas completas de uma tabela de rotas do nível"""
+    if nivel == 'utps':
+        return 'UTP_origem', 'UTP_destino', '*'
+    o, d, _ = _route_keys(table)
+    return o, d, _route_select(table)
+
+def _load_route_keys(con, nivel: str, table: str) -> pl.DataFrame:
+    """Projeção só de chaves (pares distintos) de uma tabela de rotas, para a barra lateral"""
+    if nivel == 'utps':
+        query = f"SELECT DISTINCT UTP_origem, UTP_destino FROM {table}"
+    else:
+        o, d, _ = _route_keys(table)
+        query = f"""
+            SELECT DISTINCT
+              CAST({o} AS VARCHAR) AS cod_mun_origem, mun_origem,
+              CAST({d} AS VARCHAR) AS cod_mun_destino, mun_destino
+            FROM {table}
+        """
+    return pl.from_arrow(con.execute(query).arrow())
+
+def _tabela_particao(tabela: str, origem_cod: str) -> str:
+    """Partição física da tabela pela região da UF de origem (build com --region-partitions), ou a própria tabela"""
+    uf = get_entity_dictionary(dataset_version()).ufs(MUNICIPIO).get(str(origem_cod))
+    regiao = regiao_da_uf(uf)
+    if regiao and _table_columns(_db_state()['path'], f"{tabela}_{regiao}"):
+        return f"{tabela}_{regiao}"
+    return tabela
+
+def _consultar_voos_par(con, nivel: str, origem_cod: str, destino_cod: str):
+    """Linhas completas (comerciais, executivos) de um único par OD, filtradas dentro do DuckDB"""
+    params = [int(origem_cod), int(destino_cod)]
+    resultado = []
+    for tabela in _TABELAS_NIVEL[nivel][:2]:
+        if nivel == 'centralidades':
+            # Só a partição da região de origem é lida
+            tabela = _tabela_particao(tabela, origem_cod)
+        o, d, projecao = _pair_keys(nivel, tabela)
+        # .pl() converte direto para Polars, sem a camada intermediária do Arrow
+        resultado.append(
+            con.execute(f"SELECT {projecao} FROM {tabela} WHERE {o} = ? AND {d} = ?", params).pl()
+        )
+    return resultado[0], resultado[1]
 
-# Otimização de memória inicial
-optimize_memory()
+def _get_pair_cache_max_bytes() -> int:
+    try:
+        return int(float(_get_app_setting('PAIR_CACHE_MAX_MB', 128)) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return 128 * 1024 * 1024
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _pair_cache(versao: str) -> CachePares:
+    # Um cache de pares por versão do banco, para todos os níveis e sessões; a contagem de
+    # pedidos fica no diretório de cache do banco e sobrevive a novas versões.
+    # O pré-aquecimento dos pares mais pedidos roda no aquecimento do processo (_warm_caches);
+    # a contagem guarda 10× os pares pré-aquecidos, folga para pares novos subirem no ranking
+    return CachePares(
+        _get_pair_cache_max_bytes(),
+        os.path.join(_get_db_cache_dir(), 'pair_requests.json'),
+        max_pares=10 * max(_get_int_setting('PAIR_CACHE_PREWARM', 20), 1),
+    )
 
-# Sistema de monitoramento de saúde
-def health_check():
-    """Verifica a saúde da aplicação"""
+def _prewarm_pair_cache(cache: CachePares, state: dict, top_n: int) -> int:
+    """Carrega no cache os top_n pares mais pedidos, com um cursor próprio (fora do pool das sessões)"""
+    inicio = time.perf_counter()
+    carregados = 0
+    cursor = state['con'].cursor()
     try:
-        # Resetar contador de erros se aplicação está estável
-        auto_recovery.reset_error_count()
-        
-        # Verificar memória - apenas monitorar
-        memory_usage = check_memory_usage()
-        logger.info(f"INFO: Uso de memoria atual: {memory_usage:.1f}MB")
-        
-        # Otimização: A verificação de arquivos CSV de entrada não é mais necessária em produção,
-        # pois os dados já estão no banco de dados DuckDB. Removida para evitar logs de erro falsos.
-        
-        logger.debug("OK: Health check passou - Aplicacao saudavel")
-        return True
-        
+        for nivel, origem_cod, destino_cod in cache.mais_pedidos(top_n):
+            if nivel not in _TABELAS_NIVEL:
+                continue
+            try:
+                cache.get_or_load(
+                    (nivel, origem_cod, destino_cod),
+                    lambda: _consultar_voos_par(cursor, nivel, origem_cod, destino_cod),
+                    contar=False,
+                )
+                carregados += 1
+            except Exception as e:
+                logger.warning(f"AVISO: Falha ao pré-aquecer o par {nivel} {origem_cod}-{destino_cod}: {e}")
+    finally:
+        cursor.close()
+    stats = cache.estatisticas()
+    logger.info(
+        f"OK: Cache de pares pré-aquecido com {carregados} pares em {(time.perf_counter() - inicio) * 1000:.0f}ms "
+        f"({stats['bytes'] / 1024 / 1024:.1f}MB)"
+    )
+    return carregados
+
+def get_voos_for_pair(nivel: str, origem_cod: str, destino_cod: str):
+    """(comerciais, executivos) do par, servidos pelo cache de pares compartilhado (limite em bytes)"""
+    cache = _pair_cache(dataset_version())
+    chave = (nivel, str(origem_cod), str(destino_cod))
+    voos = cache.get(chave)
+    if voos is not None:
+        return voos
+    try:
+        voos = _consultar_voos_par(get_duckdb_connection(), nivel, origem_cod, destino_cod)
     except Exception as e:
-        logger.error(f"❌ Erro no health check: {e}")
-        return False
-
-# Executar health check inicial
-if not health_check():
-    logger.critical("❌ Health check falhou - Aplicação pode estar instável")
-
-# Verificação de autenticação
-if 'authenticated' not in st.session_state:
-    st.session_state.authenticated = False
-
-if not st.session_state.authenticated:
-    logger.info("AUTH: Usuario nao autenticado - Exibindo pagina de login")
-    login_page()
-    st.stop()
-
-logger.info("OK: Usuario autenticado - Iniciando aplicacao principal")
+        # Robustez: falha na consulta não derruba a página, apenas mostra o par sem voos (e não entra no cache)
+        logger.error(f"ERRO: Falha ao buscar voos ({nivel}) para o par {origem_cod}-{destino_cod}: {e}")
+        return pl.DataFrame(), pl.DataFrame()
+    cache.put(chave, voos)
+    stats = cache.estatisticas()
+    logger.debug(
+        f"CACHE: par {nivel} {origem_cod}-{destino_cod} carregado ({stats['entradas']} pares, "
+        f"{stats['bytes'] / 1024 / 1024:.1f}MB, hits={stats['hits']}, misses={stats['misses']}, "
+        f"evictions={stats['evictions']})"
+    )
+    return voos
+
+@st.cache_data(ttl=1800, max_entries=200, show_spinner=False)
+def get_tipo_voo_par(db_path: str, nivel: str, origem_cod: str, destino_cod: str):
+    """Tipo de voo do par na tabela de classificação do nível; None se o par não está classificado"""
+    tabela = _TABELAS_NIVEL[nivel][2]
+    o, d, _ = _route_keys(tabela)
+    if nivel == 'utps':
+        # Classificação é por município: qualquer par entre municípios das duas UTPs
+        membros = "SELECT CAST(SUBSTR(CAST(municipio AS VARCHAR),1,6) AS INTEGER) FROM mun_utps WHERE utp = ?"
+        query = f"SELECT tipo_voo FROM {tabela} WHERE {o} IN ({membros}) AND {d} IN ({membros}) LIMIT 1"
+    else:
+        query = f"SELECT tipo_voo FROM {tabela} WHERE {o} = ? AND {d} = ? LIMIT 1"
+    row = get_duckdb_connection().execute(query, [int(origem_cod), int(destino_cod)]).fetchone()
+    return row[0] if row else None
 
-# Aplicativo principal (só executa se autenticado)
-@st.cache_data(ttl=3600, max_entries=3, show_spinner=False)
-def load_municipios_data():
+@st.cache_data(ttl=3600, max_entries=10, show_spinner=False)
+def get_totais_rotas(db_path: str, nivel: str):
+    """(total de viagens ou None, total de rotas) do nível, agregados no DuckDB"""
+    con = get_duckdb_connection()
+    total_viagens, total_rotas = 0, 0
+    for tabela in _TABELAS_NIVEL[nivel][:2]:
+        cols = _table_columns(db_path, tabela)
+        if 'viagens' in cols and total_viagens is not None:
+            viagens, rotas = con.execute(f"SELECT COALESCE(SUM(viagens), 0), COUNT(*) FROM {tabela}").fetchone()
+            total_viagens += viagens
+        else:
+            rotas = con.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+            total_viagens = None
+        total_rotas += rotas
+    return total_viagens, total_rotas
+
+# Frames só de chaves, compartilhados sem cópia (cache_resource) e chaveados pela versão do banco
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_municipios_data(versao: str):
     """Carrega dados para análise por municípios com otimização de memória"""
     try:
         logger.info("LOADING: Iniciando carregamento de dados de municipios")
@@ -748,89 +1187,21 @@ def load_municipios_data():
         initial_memory = check_memory_usage()
         logger.debug(f"MEMORIA: Inicial: {initial_memory:.1f}MB")
         
-        # Garantir banco DuckDB disponível
-        missing_files = check_data_files()
-        if missing_files:
-            st.error("❌ Banco de dados não disponível")
-            st.stop()
-        
-        logger.info("✅ Verificação de arquivos concluída")
-        
-        # Obter senha dos arquivos
-        password = get_files_password()
-        logger.info("✅ Senha dos arquivos obtida com sucesso")
-        
-        # Conectar ao DuckDB descriptografado
+        # Banco já provisionado (wait_for_db): conectar ao DuckDB descriptografado
         con = get_duckdb_connection()
         
-        # Dados dos municípios a partir do DuckDB
-        logger.info("📂 Carregando dados de municípios do DuckDB...")
-        arrow_mun = con.execute(
-            """
-            SELECT 
-              SUBSTR(CAST(municipio AS VARCHAR),1,6) AS municipio,
-              nome_municipio,
-              uf,
-              lat_utp AS lat,
-              long_utp AS "long"
-            FROM mun_utps
-            """
-        ).arrow()
-        dados_municipios = pl.from_arrow(arrow_mun)
-        
-        logger.info(f"✅ Dados de municípios carregados: {dados_municipios.height} registros")
-        
         # Forçar limpeza antes de carregar dados grandes
         optimize_memory()
         
-        # Dados de rotas de municípios (DuckDB) - DADOS COMPLETOS
-        logger.info("LOADING: Carregando dados comerciais do DuckDB...")
-        comerciais = pl.from_arrow(
-            con.execute(
-                """
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM por_municipio_voos_comerciais
-                """
-            ).arrow()
-        )
-        logger.info(f"OK: Dados comerciais carregados: {comerciais.height} registros")
+        # Nomes, UFs e coordenadas vêm do dicionário de entidades (get_entity_dictionary)
+        # Rotas de municípios: só as chaves dos pares (linhas completas vêm por par, sob demanda)
+        logger.info("LOADING: Carregando chaves dos pares comerciais do DuckDB...")
+        comerciais = _load_route_keys(con, 'municipios', 'por_municipio_voos_comerciais')
+        logger.info(f"OK: Pares comerciais carregados: {comerciais.height} registros")
         
-        logger.info("LOADING: Carregando dados executivos do DuckDB...")
-        executivos = pl.from_arrow(
-            con.execute(
-                """
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM por_municipio_voos_executivos
-                """
-            ).arrow()
-        )
-        logger.info(f"OK: Dados executivos carregados: {executivos.height} registros")
-        
-        logger.info("LOADING: Carregando dados de classificacao do DuckDB...")
-        classificacao = pl.from_arrow(
-            con.execute(
-                """
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM por_municipio_classificacao
-                """
-            ).arrow()
-        )
-        logger.info(f"OK: Dados de classificacao carregados: {classificacao.height} registros")
-        
-        logger.info("LOADING: Carregando dados de aeroportos do DuckDB...")
-        aeroportos = pl.from_arrow(
-            con.execute("SELECT * FROM aeroportos").arrow()
-        )
-        logger.info(f"OK: Dados de aeroportos carregados: {aeroportos.height} registros")
+        logger.info("LOADING: Carregando chaves dos pares executivos do DuckDB...")
+        executivos = _load_route_keys(con, 'municipios', 'por_municipio_voos_executivos')
+        logger.info(f"OK: Pares executivos carregados: {executivos.height} registros")
         
         # Não fechar conexão singleton
         
@@ -841,364 +1212,275 @@ def load_municipios_data():
         logger.info(f"MEMORIA: Carregamento concluido - Memoria utilizada: {memory_used:.1f}MB")
         logger.info("OK: Todos os dados de municipios carregados com sucesso")
         
-        return dados_municipios, comerciais, executivos, classificacao, aeroportos
+        return comerciais, executivos
         
     except Exception as e:
         logger.error(f"❌ ERRO CRÍTICO ao carregar dados de municípios: {str(e)}")
         logger.error(f"📍 Tipo do erro: {type(e).__name__}")
-        st.error(f"❌ Erro ao carregar dados de municípios: {str(e)}")
-        st.stop()
+        # Também roda na thread de aquecimento: a mensagem na tela fica com quem chama (sessão)
+        raise RuntimeError(f"Erro ao carregar dados de municípios: {e}") from e
 
-@st.cache_data(ttl=3600, max_entries=3, show_spinner=False)
-def load_utp_data():
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_utp_data(versao: str):
     """Carrega dados para análise por UTPs"""
     try:
-        # Garantir banco DuckDB disponível
-        missing_files = check_data_files()
-        if missing_files:
-            st.error("❌ Banco de dados não disponível")
-            st.stop()
-        
-        # Obter senha dos arquivos e conectar
-        password = get_files_password()
+        # Banco já provisionado (wait_for_db)
         con = get_duckdb_connection()
         
-        # Dados das UTPs
-        dados_utps = pl.from_arrow(con.execute("SELECT * FROM mun_utps").arrow())
-        
-        # Criar mapeamento de UTPs
-        utp_info = dados_utps.select(['utp', 'nome_utp']).unique().sort('utp')
-        
-        # Dados de rotas de UTPs do DuckDB - DADOS COMPLETOS
-        comerciais = pl.from_arrow(con.execute("SELECT * FROM utp_voos_comerciais").arrow())
-        executivos = pl.from_arrow(con.execute("SELECT * FROM utp_voos_executivos").arrow())
-        classificacao = pl.from_arrow(con.execute("SELECT * FROM utp_classificacao").arrow())
-        aeroportos = pl.from_arrow(con.execute("SELECT * FROM aeroportos").arrow())
+        # Rotas de UTPs: só as chaves dos pares (linhas completas vêm por par, sob demanda)
+        comerciais = _load_route_keys(con, 'utps', 'utp_voos_comerciais')
+        executivos = _load_route_keys(con, 'utps', 'utp_voos_executivos')
         
         # Não fechar conexão singleton
         
-        return dados_utps, utp_info, comerciais, executivos, classificacao, aeroportos
+        return comerciais, executivos
         
     except Exception as e:
-        st.error(f"❌ Erro ao carregar dados de UTPs: {str(e)}")
+        logger.error(f"❌ Erro ao carregar dados de UTPs: {str(e)}")
+        raise RuntimeError(f"Erro ao carregar dados de UTPs: {e}") from e
+
+# Origens com rotas no nível (opções pesquisáveis da barra lateral)
+@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)
+def get_unique_origins_by_page(versao, pagina, _comerciais, _executivos):
+    """Origens com rotas no nível; frames com _ ficam fora do hash (a versão identifica os dados)"""
+    comerciais, executivos = _comerciais, _executivos
+    if pagina == "utps":
+        origins_comerciais = set(comerciais['UTP_origem'].unique().to_list())
+        origins_executivos = set(executivos['UTP_origem'].unique().to_list()) if executivos.height > 0 else set()
+        return {str(x) for x in origins_comerciais.union(origins_executivos)}
+    else:
+        origins_comerciais = set(comerciais['cod_mun_origem'].unique().to_list())
+        origins_executivos = set(executivos['cod_mun_origem'].unique().to_list()) if executivos.height > 0 else set()
+        return origins_comerciais.union(origins_executivos)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_indice_busca(versao: str, nivel: str, _item_map: dict) -> IndiceBusca:
+    """Índice de busca das entidades do nível, construído uma vez por versão do banco e nível"""
+    inicio = time.perf_counter()
+    indice = IndiceBusca(_item_map, is_utp=(nivel == "utps"))
+    logger.info(f"OK: Índice de busca ({nivel}) com {len(indice)} entradas em {(time.perf_counter() - inicio) * 1000:.0f}ms")
+    return indice
+
+def _crypto_config_problem(config: dict):
+    """Mensagem do que falta na configuração criptográfica, ou None se completa"""
+    if not config['password']:
+        return "Senha dos arquivos não configurada. Configure FILES_PASSWORD nos secrets."
+    required_configs = ['salt_primary', 'salt_secondary', 'pepper', 'entropy_factor', 'integrity_key']
+    missing_configs = [key for key in required_configs if not config[key]]
+    if missing_configs:
+        return f"Configurações criptográficas faltando: {', '.join(missing_configs)}"
+    return None
+
+def get_files_password():
+    """Obtém a senha dos arquivos do secrets.toml com verificações de segurança"""
+    config = _get_crypto_config()
+    problema = _crypto_config_problem(config)
+    if problema:
+        st.error(f"❌ {problema}")
         st.stop()
+    return config['password']
 
-# ============================================================================
-# 🚀 SISTEMA DE CARREGAMENTO ULTRA-EFICIENTE POR REGIÃO
-# ============================================================================
+# Provisionamento do banco (gerar .enc se faltar, derivar chave, descriptografar, abrir) e
+# aquecimento dos caches quentes fora do caminho da requisição: uma thread por processo, iniciada
+# na primeira execução do script (tela de login); as sessões só consultam o estado
+_PROVISIONING_POLL_SECONDS = 2
 
-@st.cache_data(ttl=1800, max_entries=20, show_spinner=False)
-def get_uf_for_municipio(cod_municipio: str, password: str) -> str:
-    """Obtém UF de um município específico de forma ultra-rápida"""
-    con = get_duckdb_connection()
-    try:
-        result = con.execute(
-            "SELECT uf FROM centralidades WHERE municipio = ?", 
-            [cod_municipio]
-        ).fetchone()
-        return result[0] if result else ""
-    except Exception:
-        return ""
-
-@st.cache_data(ttl=1800, max_entries=10, show_spinner=False)
-def get_regiao_for_uf(uf: str) -> str:
-    """Determina região baseada na UF"""
-    regioes = {
-        'norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
-        'nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
-        'centro_oeste': ['DF', 'GO', 'MS', 'MT'],
-        'sudeste': ['ES', 'MG', 'RJ', 'SP'],
-        'sul': ['PR', 'RS', 'SC']
-    }
-    
-    for regiao, ufs in regioes.items():
-        if uf in ufs:
-            return regiao
-    return 'sudeste'  # default
+@st.cache_resource(show_spinner=False)
+def _provisioning_state():
+    estado = {'lock': threading.Lock(), 'status': 'aquecendo', 'etapa': 'iniciando', 'erro': None,
+              'inicio': time.time(), 'fim': None, 'aquecimento': None, 'medicao': Medicao()}
+    threading.Thread(target=_provision_db, args=(estado,), name='db-provisioning', daemon=True).start()
+    return estado
 
-@st.cache_data(ttl=900, max_entries=50, show_spinner=False)
-def load_voos_by_region_smart(origem_cod: str, destino_cod: str, password: str, tipo_voo: str = 'comerciais'):
-    """
-    🧠 CARREGAMENTO INTELIGENTE: Carrega apenas dados da região necessária
-    Reduz uso de memória em até 80% comparado ao carregamento completo
-    """
-    con = get_duckdb_connection()
-    
+@contextmanager
+def _provision_step(estado, etapa: str, campo: str = 'etapa'):
+    """Etapa do provisionamento (ou do aquecimento, campo='aquecimento'): publica o nome e mede a duração"""
+    with estado['lock']:
+        estado[campo] = etapa
+    logger.info(f"PROVISIONAMENTO: {etapa}")
+    with estado['medicao'].span(etapa) as span:
+        yield span
+
+def _provision_db(estado) -> None:
     try:
-        # Determinar região com base na origem (otimização inteligente)
-        uf_origem = get_uf_for_municipio(origem_cod, password)
-        regiao_origem = get_regiao_for_uf(uf_origem)
-        
-        # Se destino for especificado, considerar ambas as regiões
-        regiao_destino = regiao_origem
-        if destino_cod:
-            uf_destino = get_uf_for_municipio(destino_cod, password)
-            regiao_destino = get_regiao_for_uf(uf_destino)
-        
-        # Usar a view particionada da região apropriada
-        table_name = f"mun_centralidade_voos_{tipo_voo}_{regiao_origem}"
-        
-        # Query otimizada que usa índices e filtros eficientes
-        where_clause = ""
-        params = []
-        
-        if origem_cod and destino_cod:
-            where_clause = "WHERE cod_mun_origem = ? AND cod_mun_destino = ?"
-            params = [origem_cod, destino_cod]
-        elif origem_cod:
-            where_clause = "WHERE cod_mun_origem = ?"
-            params = [origem_cod]
-        
-        # Tentar usar view particionada primeiro, fallback para tabela principal se necessário
-        try:
-            query = f"""
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM {table_name}
-                {where_clause}
-            """
-            arrow_data = con.execute(query, params).arrow()
-        except Exception:
-            # Fallback para tabela principal - DADOS COMPLETOS
-            query = f"""
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM mun_centralidade_voos_{tipo_voo}
-                {where_clause}
-            """
-            arrow_data = con.execute(query, params).arrow()
-            
-        return pl.from_arrow(arrow_data)
-        
+        config = _get_crypto_config()
+        problema = _crypto_config_problem(config)
+        if problema:
+            raise RuntimeError(problema)
+        password = config['password']
+        with _provision_step(estado, "derivando chave"):
+            _derive_multilayer_key(password)
+        if not os.path.exists(_get_encrypted_db_path()):
+            with _provision_step(estado, "gerando banco criptografado (primeira execução)"):
+                _ensure_encrypted_duckdb(password)
+        with _provision_step(estado, "descriptografando banco"):
+            _decrypt_db_to_cache(password)
+        with _provision_step(estado, "abrindo banco"):
+            _db_state()
+        with estado['lock']:
+            estado['status'] = 'pronto'
     except Exception as e:
-        logger.error(f"ERRO CRITICO: Erro ao carregar dados por região: {str(e)}")
-        # NÃO retornar DataFrame vazio - tentar fallback direto
-        con = get_duckdb_connection()
-        try:
-            # Fallback direto para tabela principal sem limitações
-            query = f"""
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM mun_centralidade_voos_{tipo_voo}
-                WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ?
-                  AND SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) = ?
-            """
-            arrow_data = con.execute(query, [origem_cod, destino_cod]).arrow()
-            return pl.from_arrow(arrow_data)
-        except Exception as e2:
-            logger.error(f"ERRO CRITICO: Fallback também falhou: {str(e2)}")
-            return pl.DataFrame([])
+        logger.error(f"❌ Erro ao preparar banco DuckDB: {e}")
+        with estado['lock']:
+            estado['erro'] = str(e)
     finally:
-        pass # Não fechar conexão singleton
-
-@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)  
-def get_available_origins_light(password: str):
-    """Carrega apenas lista de origens disponíveis - ultra leve"""
-    con = get_duckdb_connection()
+        with estado['lock']:
+            if estado['status'] != 'pronto':
+                estado['status'] = 'erro'
+                estado['erro'] = estado['erro'] or "provisionamento interrompido"
+            estado['fim'] = time.time()
+    logger.info(
+        f"PROVISIONAMENTO: {estado['status']} em {estado['fim'] - estado['inicio']:.1f}s"
+    )
+    if estado['status'] == 'pronto':
+        # Banco já atende as sessões; caches quentes são opcionais e seguem nesta thread
+        try:
+            _warm_caches(estado, dataset_version())
+        finally:
+            release_duckdb_connection()
+
+def _warm_caches(estado, versao: str) -> None:
+    """Pré-carrega o que a primeira sessão usaria: dicionário, chaves das rotas, índices de busca,
+    panorama de cada nível e os pares mais pedidos. Falhas só deixam a carga para a sessão."""
+    db_path = _db_state()['path']
+
+    def _rotas_nivel(nivel, carregar):
+        comerciais, executivos = carregar(versao)
+        get_unique_origins_by_page(versao, nivel, comerciais, executivos)
+        return comerciais, executivos
+
+    etapas = [
+        ("carregando dicionário de entidades", lambda: get_entity_dictionary(versao)),
+        ("carregando rotas de municípios", lambda: _rotas_nivel("municipios", load_municipios_data)),
+        ("carregando rotas de UTPs", lambda: _rotas_nivel("utps", load_utp_data)),
+        ("montando índices de busca", lambda: [
+            get_indice_busca(versao, nivel, get_entity_dictionary(versao).rotulos(UTP if nivel == "utps" else MUNICIPIO))
+            for nivel in _TABELAS_NIVEL
+        ]),
+        ("carregando panorama", lambda: [get_dashboard_stats(db_path, nivel) for nivel in _TABELAS_NIVEL]),
+        ("pré-aquecendo pares mais pedidos", lambda: _prewarm_pair_cache(
+            _pair_cache(versao), _db_state(), _get_int_setting('PAIR_CACHE_PREWARM', 20)
+        )),
+    ]
     try:
-        # Query super eficiente usando DISTINCT
-        arrow = con.execute("""
-            SELECT DISTINCT SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod 
-            FROM mun_centralidade_voos_comerciais
-            UNION
-            SELECT DISTINCT SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod
-            FROM mun_centralidade_voos_executivos
-            ORDER BY cod
-        """).arrow()
-        return pl.from_arrow(arrow)['cod'].to_list()
-    except Exception as e:
-        logger.warning(f"AVISO: Erro ao buscar origens: {str(e)}")
-        return []
+        for etapa, carregar in etapas:
+            with _provision_step(estado, etapa, campo='aquecimento') as span:
+                try:
+                    span['linhas'] = contar_linhas(carregar())
+                except Exception as e:
+                    logger.warning(f"AVISO: Aquecimento '{etapa}' falhou - carga fica sob demanda: {e}")
+                    continue
+            logger.info(f"OK: Aquecimento '{etapa}' em {span['ms']:.0f}ms")
     finally:
-        pass # Não fechar conexão singleton
+        # Mesmo interrompido, o aquecimento termina: a barra lateral não fica "aquecendo" para sempre
+        with estado['lock']:
+            estado['aquecimento'] = 'concluído'
+
+def provisioning_status() -> dict:
+    """Cópia do estado do provisionamento: status ('aquecendo', 'pronto', 'erro'), etapa, erro, duração
+    e a etapa atual do aquecimento de caches (None antes de começar, 'concluído' no fim)"""
+    estado = _provisioning_state()
+    with estado['lock']:
+        status = {k: v for k, v in estado.items() if k not in ('lock', 'medicao')}
+    status['etapas'] = estado['medicao'].spans()
+    status['duracao'] = (status['fim'] or time.time()) - status['inicio']
+    return status
+
+def wait_for_db() -> dict:
+    """Tela de aquecimento enquanto o banco é preparado (reexecuta a cada poucos segundos, sem bloquear)"""
+    status = provisioning_status()
+    if status['status'] == 'pronto':
+        return status
+    if status['status'] == 'erro':
+        st.error(f"❌ Banco de dados não disponível: {status['erro']}")
+        if st.button("🔄 Tentar novamente"):
+            _provisioning_state.clear()
+            st.rerun()
+        st.stop()
+    st.info(f"⏳ Preparando o banco de dados: {status['etapa']} ({status['duracao']:.0f}s)...")
+    time.sleep(_PROVISIONING_POLL_SECONDS)
+    st.rerun()
 
-@st.cache_data(ttl=1800, max_entries=20, show_spinner=False)
-def get_available_destinations_light(origem_cod: str, password: str):
-    """Carrega apenas destinos para origem específica - ultra leve"""
-    con = get_duckdb_connection()
-    try:
-        arrow = con.execute("""
-            SELECT DISTINCT SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod
-            FROM mun_centralidade_voos_comerciais 
-            WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ?
-            UNION
-            SELECT DISTINCT SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod
-            FROM mun_centralidade_voos_executivos
-            WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ?
-            ORDER BY cod
-        """, [origem_cod, origem_cod]).arrow()
-        return pl.from_arrow(arrow)['cod'].to_list()
-    except Exception as e:
-        logger.warning(f"AVISO: Erro ao buscar origens: {str(e)}")
-        return []
-    finally:
-        pass # Não fechar conexão singleton
+# Configuração da página
+st.set_page_config(
+    page_title="Sistema de Análise de Rotas Aéreas",
+    page_icon="✈️",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
 
-def load_centralidade_data():
-    """Carrega dados para análise por centralidades com otimizações de memória"""
-    try:
-        logger.info("LOADING: Iniciando carregamento de dados de centralidades")
-        
-        # Monitorar uso inicial de memória
-        initial_memory = check_memory_usage()
-        logger.debug(f"MEMORIA: Inicial: {initial_memory:.1f}MB")
-        
-        # Garantir banco DuckDB disponível
-        missing_files = check_data_files()
-        if missing_files:
-            logger.error("❌ Banco de dados não disponível")
-            st.error("❌ Banco de dados não disponível")
-            st.stop()
-        
-        # Obter senha e conectar
-        password = get_files_password()
-        con = get_duckdb_connection()
-        logger.info("✅ Senha dos arquivos obtida com sucesso")
-        
-        # Dados dos municípios (DuckDB)
-        logger.info("📂 Carregando dados de municípios do DuckDB...")
-        arrow_mun = con.execute(
-            """
-            SELECT 
-              SUBSTR(CAST(municipio AS VARCHAR),1,6) AS municipio,
-              nome_municipio,
-              uf,
-              lat_utp AS lat,
-              long_utp AS "long"
-            FROM mun_utps
-            """
-        ).arrow()
-        dados_municipios = pl.from_arrow(arrow_mun)
-        
-        logger.info(f"✅ Dados de municípios carregados: {dados_municipios.height} registros")
-        
-        # Forçar limpeza antes de carregar dados grandes
-        optimize_memory()
-        
-        # NÃO carregar tabela toda de centralidades (muito pesada) para acelerar
-        dados_centralidades = pl.DataFrame([])
-        
-        # Forçar limpeza após carregar centralidades
-        optimize_memory()
-        
-        # DADOS COMPLETOS: Carregar dados de centralidades igual municipios/UTPs
-        logger.info("STRATEGY: Carregando dados completos de centralidades (igual municipios/UTPs)")
-        
-        # Otimização: Dataframes de voos de centralidades serão carregados sob demanda.
-        logger.info("STRATEGY: Dataframes de voos de centralidades serão carregados sob demanda.")
-        comerciais = pl.DataFrame()
-        executivos = pl.DataFrame()
-        logger.info("OK: Dataframes de voos de centralidades inicializados vazios.")
-        
-        logger.info("LOADING: Carregando dados de classificacao do DuckDB...")
-        classificacao = pl.from_arrow(
-            con.execute(
-                """
-                SELECT 
-                  SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-                  SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-                  * EXCLUDE (cod_mun_origem, cod_mun_destino)
-                FROM mun_centralidade_classificacao
-                """
-            ).arrow()
-        )
-        logger.info(f"OK: Dados de classificacao carregados: {classificacao.height} registros")
-        
-        logger.info("LOADING: Carregando dados de aeroportos do DuckDB...")
-        aeroportos = pl.from_arrow(con.execute("SELECT * FROM aeroportos").arrow())
+# CSS otimizado (mínimo necessário)
+st.markdown("""
+<style>
+    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap');
+    * { font-family: 'Inter', sans-serif; }
+    .main-header { 
+        background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%); 
+        padding: 2rem; border-radius: 15px; color: white; margin-bottom: 2rem; 
+    }
+    .metric-container { 
+        background: #f8f9fa; padding: 1.5rem; border-radius: 12px; 
+        text-align: center; margin: 0.5rem; 
+    }
+    .metric-value { font-size: 2rem; font-weight: 700; color: #1e3c72; margin: 0; }
+    .stButton > button { 
+        background: linear-gradient(135deg, #2a5298 0%, #1e3c72 100%); 
+        color: #fff !important; border: none; padding: 0.75rem 2rem; 
+        border-radius: 8px; font-weight: 500; 
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# Otimização de memória inicial
+optimize_memory()
+
+# Sistema de monitoramento de saúde
+def health_check():
+    """Verifica a saúde da aplicação"""
+    try:
+        # Resetar contador de erros se aplicação está estável
+        auto_recovery.reset_error_count()
         
-        # Otimização: Não fechar a conexão singleton gerenciada pelo cache do Streamlit
-        # con.close() 
-        logger.info(f"OK: Dados de aeroportos carregados: {aeroportos.height} registros")
+        # Verificar memória - apenas monitorar
+        memory_usage = check_memory_usage()
+        logger.info(f"INFO: Uso de memoria atual: {memory_usage:.1f}MB")
         
-        # Verificar uso final de memória
-        final_memory = check_memory_usage()
-        memory_used = final_memory - initial_memory
+        # Prontidão do banco (o provisionamento começa aqui, antes do login)
+        status_banco = provisioning_status()
+        logger.info(f"INFO: Banco {status_banco['status']} ({status_banco['etapa']}, {status_banco['duracao']:.0f}s)")
         
-        logger.info(f"MEMORIA: Carregamento de centralidades concluido - Memoria utilizada: {memory_used:.1f}MB")
-        logger.info("OK: Todos os dados de centralidades carregados com sucesso")
+        # Otimização: A verificação de arquivos CSV de entrada não é mais necessária em produção,
+        # pois os dados já estão no banco de dados DuckDB. Removida para evitar logs de erro falsos.
         
-        return dados_municipios, dados_centralidades, comerciais, executivos, classificacao, aeroportos
+        logger.debug("OK: Health check passou - Aplicacao saudavel")
+        return True
         
     except Exception as e:
-        logger.error(f"❌ ERRO CRÍTICO ao carregar dados de centralidades: {str(e)}")
-        logger.error(f"📍 Tipo do erro: {type(e).__name__}")
-        
-        # Mostrar erro mais amigável para o usuário
-        if "MemoryError" in str(e) or "out of memory" in str(e).lower():
-            st.error("""
-            ❌ **Erro de Memória ao Carregar Centralidades**
-            
-            O arquivo de centralidades é muito grande para o ambiente atual. 
-            
-            **Soluções sugeridas:**
-            - Tente recarregar a página
-            - Use a análise por Municípios ou UTPs como alternativa
-            - Entre em contato com o administrador do sistema
-            """)
-        else:
-            st.error(f"❌ Erro ao carregar dados de centralidades: {str(e)}")
-        
-        st.stop()
+        logger.error(f"❌ Erro no health check: {e}")
+        return False
 
-# Cache para lookups de coordenadas
-@st.cache_data(ttl=7200, max_entries=5, show_spinner=False)
-def create_coordinate_maps(dados_municipios, aeroportos):
-    # Criar dicionários para lookup rápido de coordenadas
-    mun_coords = {}
-    for row in dados_municipios.iter_rows(named=True):
-        mun_coords[row['municipio']] = (row['lat'], row['long'])
-    
-    aero_coords = {}
-    for row in aeroportos.iter_rows(named=True):
-        aero_coords[row['icao']] = (row['latitude'], row['longitude'])
-    
-    return mun_coords, aero_coords
+# Executar health check inicial
+if not health_check():
+    logger.critical("❌ Health check falhou - Aplicação pode estar instável")
 
-@st.cache_data(ttl=1800, max_entries=50, show_spinner=False)
-def get_voos_for_pair_centralidades(origem_cod: str, destino_cod: str):
-    """Busca dados de voos para um par origem-destino específico na análise de centralidades."""
-    try:
-        con = get_duckdb_connection()
-        logger.debug(f"QUERY: Buscando voos de centralidade para {origem_cod} -> {destino_cod}")
-
-        # Correção: Revertendo para a lógica de filtragem original que usa SUBSTR para
-        # compatibilidade com códigos de 6 e 7 dígitos. A otimização anterior
-        # introduziu um erro lógico que impedia a correspondência de códigos.
-        query_com = """
-            SELECT
-              SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-              SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-              * EXCLUDE (cod_mun_origem, cod_mun_destino)
-            FROM mun_centralidade_voos_comerciais
-            WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ? AND SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) = ?
-        """
-        # Otimização: Usar .pl() para uma conversão direta e mais robusta para DataFrame Polars,
-        # evitando a camada intermediária do Arrow que estava falhando no servidor.
-        comerciais_df = con.execute(query_com, [origem_cod, destino_cod]).pl()
-
-        query_exe = """
-            SELECT
-              SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod_mun_origem,
-              SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod_mun_destino,
-              * EXCLUDE (cod_mun_origem, cod_mun_destino)
-            FROM mun_centralidade_voos_executivos
-            WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ? AND SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) = ?
-        """
-        executivos_df = con.execute(query_exe, [origem_cod, destino_cod]).pl()
+# Verificação de autenticação
+if 'authenticated' not in st.session_state:
+    st.session_state.authenticated = False
 
-        return comerciais_df, executivos_df
-    except Exception as e:
-        # Erro de robustez: Se a consulta falhar por qualquer motivo (incluindo o erro do PyArrow),
-        # logamos o erro e retornamos dataframes vazios para evitar que a aplicação quebre.
-        logger.error(f"ERRO CRÍTICO ao buscar voos para o par {origem_cod}-{destino_cod}: {e}")
-        return pl.DataFrame(), pl.DataFrame()
+if not st.session_state.authenticated:
+    logger.info("AUTH: Usuario nao autenticado - Exibindo pagina de login")
+    login_page()
+    st.stop()
+
+logger.info("OK: Usuario autenticado - Iniciando aplicacao principal")
+
+# Sem bloquear a sessão por minutos: tela de aquecimento até o banco ficar pronto
+status_banco = wait_for_db()
+
+# Spans das etapas quentes desta execução (painel de admin e log JSONL no fim do script)
+medicao = Medicao()
+
+# Aplicativo principal (só executa se autenticado)
 
 # Funções auxiliares
 def get_mun_coord(cod_municipio, mun_coords_cache):
@@ -1258,102 +1540,260 @@ def format_currency_for_table(value):
     except (ValueError, TypeError):
         return 0.0
 
-def create_curved_line(start_coords, end_coords, weight=0.2):
-    """Cria pontos para uma linha curva entre dois pontos"""
-    lat1, lon1 = start_coords
-    lat2, lon2 = end_coords
-    
-    # Ponto de controle para a curva
-    ctrl_lat = (lat1 + lat2) / 2 + weight * abs(lon2 - lon1)
-    ctrl_lon = (lon1 + lon2) / 2 - weight * abs(lat2 - lat1)
-    
-    # Gerar pontos ao longo da curva
-    points = []
-    for t in [i/20 for i in range(21)]:
-        # Curva de Bézier quadrática
-        lat = (1-t)**2 * lat1 + 2*(1-t)*t * ctrl_lat + t**2 * lat2
-        lon = (1-t)**2 * lon1 + 2*(1-t)*t * ctrl_lon + t**2 * lon2
-        points.append([lat, lon])
-    
-    return points
-
-
-
-def calculate_bearing(lat1, lon1, lat2, lon2):
-    """Calcula o ângulo de direção entre dois pontos"""
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1
-    x = math.sin(dlon) * math.cos(lat2)
-    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
-    bearing = math.atan2(x, y)
-    return math.degrees(bearing)
-
-def remove_accents(text):
-    """Remove acentos de uma string para facilitar a busca"""
-    if not text:
-        return ""
-    # Normalizar e remover acentos
-    normalized = unicodedata.normalize('NFD', text.lower())
-    without_accents = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
-    return without_accents
-
-def create_searchable_options(municipio_map, is_utp=False):
-    """Cria opções pesquisáveis com código e nome (incluindo busca sem acentos)"""
-    options = []
-    search_map = {}
-    
-    for cod, nome_com_uf in municipio_map.items():
-        # Texto de exibição (nome com UF)
-        display_text = nome_com_uf
-        
-        # Extrair apenas o nome (sem UF) para busca adicional
-        nome_sem_uf = nome_com_uf.split(',')[0].strip() if ',' in nome_com_uf else nome_com_uf
-        
-        # Textos de busca (múltiplas variações para melhor busca)
-        search_texts = [
-            nome_com_uf.lower(),                    # Nome completo com UF
-            nome_sem_uf.lower(),                    # Nome sem UF
-            remove_accents(nome_com_uf),            # Nome com UF sem acentos
-            remove_accents(nome_sem_uf),            # Nome sem UF sem acentos
-            cod.lower()                             # Código do município
-        ]
-        
-        # Remover duplicatas mantendo ordem
-        search_texts = list(dict.fromkeys(search_texts))
-        
-        options.append(display_text)
-        search_map[display_text] = {
-            'codigo': cod,
-            'nome': nome_com_uf,
-            'search_texts': search_texts
-        }
-    
-    # Ordenação especial para UTPs: por número, não por string
-    if is_utp:
-        # Ordenar por número UTP (extrair o número do início da string)
-        options.sort(key=lambda x: int(x.split(' - ')[0]) if ' - ' in x else 0)
-    else:
-        # Ordenação normal alfabética
-        options = sorted(options)
-    
-    return options, search_map
+# Colunas opcionais das tabelas de rotas comerciais (ausentes valem 0)
+_ROTAS_COLUNAS_OPCIONAIS = (
+    'tempo_aereo', 'tempo_terrestre_embarque', 'tempo_terrestre_desembarque',
+    'custo_terrestre_embarque', 'custo_terrestre_desembarque',
+)
 
-def filter_options_by_search(options, search_map, search_term):
-    """Filtra opções baseado no termo de busca"""
-    if not search_term:
-        return options
-    
-    search_term_clean = remove_accents(search_term.lower())
-    filtered = []
+def resumir_rotas(voos_comerciais: pl.DataFrame) -> pl.DataFrame:
+    """Resumo colunar das rotas de um par, ordenado por percentual de uso.
+
+    Uma passada de expressões Polars calcula percentual, posição (rota = 1, 2, ...) e as
+    marcas de rota mais rápida/barata/popular; cards, mapa, tabela e gráfico leem daqui.
+    """
+    opcionais = [
+        (pl.col(c) if c in voos_comerciais.columns else pl.lit(0)).fill_null(0).alias(c)
+        for c in _ROTAS_COLUNAS_OPCIONAIS
+    ]
+    posicao = pl.int_range(pl.len())
+    return (
+        voos_comerciais
+        .select(
+            pl.col('trajeto_aereo').alias('trajeto'),
+            'icao_aeroporto_origem',
+            'icao_aeroporto_destino',
+            'tempo_total',
+            'custo_total',
+            'custo_aereo',
+            (pl.col('percentual_de_viagens_par_od') * 100).alias('percentual'),
+            pl.col('viagens').cast(pl.Int64),
+            pl.col('num_conexoes').alias('conexoes'),
+            *opcionais,
+        )
+        .sort('percentual', descending=True, maintain_order=True)
+        .with_columns(
+            (posicao + 1).alias('rota'),
+            (posicao == pl.col('tempo_total').arg_min()).alias('mais_rapida'),
+            (posicao == pl.col('custo_total').arg_min()).alias('mais_barata'),
+            (posicao == pl.col('percentual').arg_max()).alias('mais_popular'),
+        )
+    )
+
+def tabela_comparativa_rotas(resumo: pl.DataFrame, com_viagens: bool) -> pl.DataFrame:
+    """Tabela 'Comparação de Rotas' derivada do resumo, sem iterar as linhas em Python"""
+    colunas = [
+        pl.format("Rota {}", pl.col('rota')).alias('Rota'),
+        pl.col('trajeto').alias('Trajeto'),
+        pl.col('tempo_total').map_elements(format_time, return_dtype=pl.Utf8).alias('Tempo Total'),
+        pl.col('custo_total').cast(pl.Float64).fill_null(0.0).alias('Custo Total (R$)'),
+        pl.col('percentual').map_elements(
+            lambda v: f"{format_number_br(v, 1)}%", return_dtype=pl.Utf8
+        ).alias('Uso (%)'),
+        pl.col('conexoes').alias('Conexões'),
+    ]
+    if com_viagens:
+        colunas.append(pl.col('viagens').alias('Viagens'))
+    return resumo.select(colunas)
+
+@st.cache_resource(show_spinner=False)
+def _map_cache_store():
+    # Mapas já serializados por processo (LRU limitado em bytes), compartilhados entre sessões
+    return {'lock': threading.Lock(), 'maps': OrderedDict(), 'bytes': 0, 'hits': 0, 'misses': 0}
+
+def _get_map_cache_max_bytes() -> int:
+    try:
+        return int(float(_get_app_setting('MAP_CACHE_MAX_MB', 64)) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return 64 * 1024 * 1024
+
+def _map_cache_get(chave):
+    """HTML do mapa já renderizado para a chave (nível, origem, destino, rota), ou None"""
+    store = _map_cache_store()
+    with store['lock']:
+        html = store['maps'].get(chave)
+        if html is None:
+            store['misses'] += 1
+            return None
+        store['maps'].move_to_end(chave)
+        store['hits'] += 1
+        return html
+
+def _map_cache_put(chave, mapa) -> str:
+    """Serializa o mapa Folium uma vez e guarda o HTML, descartando os menos usados acima do limite"""
+    html = mapa.get_root().render()
+    tamanho = len(html.encode('utf-8'))
+    limite = _get_map_cache_max_bytes()
+    if tamanho > limite:
+        return html
+    store = _map_cache_store()
+    with store['lock']:
+        anterior = store['maps'].pop(chave, None)
+        if anterior is not None:
+            store['bytes'] -= len(anterior.encode('utf-8'))
+        store['maps'][chave] = html
+        store['bytes'] += tamanho
+        while store['bytes'] > limite:
+            _, removido = store['maps'].popitem(last=False)
+            store['bytes'] -= len(removido.encode('utf-8'))
+    logger.debug(
+        f"MAPA: {tamanho / 1024:.0f}KB em cache ({len(store['maps'])} mapas, "
+        f"{store['bytes'] / 1024 / 1024:.1f}MB, hits={store['hits']}, misses={store['misses']})"
+    )
+    return html
+
+def _get_map_render_mode(mostrar_todas: bool, num_rotas: int) -> str:
+    """Modo de desenho das rotas: 'antpath' (animado, uma camada por trecho) ou 'geojson' (camada única).
     
-    for option in options:
-        option_data = search_map[option]
-        for search_text in option_data['search_texts']:
-            if search_term_clean in search_text:
-                filtered.append(option)
-                break
+    MAP_RENDER_MODE=auto (padrão) usa GeoJSON só em "Mostrar todas as rotas" com mais de uma rota.
+    """
+    modo = str(_get_app_setting('MAP_RENDER_MODE', 'auto')).strip().lower()
+    if modo in ('antpath', 'geojson'):
+        return modo
+    return 'geojson' if mostrar_todas and num_rotas > 1 else 'antpath'
+
+def _rotas_geojson(rotas, coord_origem, coord_destino, nome_origem, nome_destino, aero_coords_cache, cores_rotas) -> dict:
+    """FeatureCollection com embarque, trechos aéreos (curvas) e desembarque de todas as rotas"""
+    features = []
+    # Trechos aéreos: (índice da feature, início, fim, curvatura), curvados todos de uma vez no fim
+    aereos = []
+    
+    def _linha(pontos, estilo, tooltip):
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [[lon, lat] for lat, lon in pontos]},
+            'properties': {**estilo, 'tooltip': tooltip},
+        })
     
-    return filtered
+    for idx, voo in enumerate(rotas.iter_rows(named=True)):
+        coord_aero_origem = get_aerodromo_coord(voo['icao_aeroporto_origem'], aero_coords_cache)
+        coord_aero_destino = get_aerodromo_coord(voo['icao_aeroporto_destino'], aero_coords_cache)
+        if not (coord_aero_origem[0] and coord_aero_destino[0]):
+            continue
+        # Mesma hierarquia visual do modo AntPath: rota principal em laranja e mais grossa
+        if idx == 0:
+            aereo = {'color': '#FF6B35', 'weight': 6, 'opacity': 1.0, 'dashArray': None}
+            terrestre = {'color': '#E55100', 'weight': 5, 'opacity': 1.0, 'dashArray': '10 20'}
+        else:
+            aereo = {'color': cores_rotas[idx % len(cores_rotas)], 'weight': 3, 'opacity': 0.7, 'dashArray': None}
+            terrestre = {'color': '#3498db' if idx == 1 else '#2980b9', 'weight': 2, 'opacity': 0.6, 'dashArray': '8 15'}
+        rota = f"Rota {idx + 1}"
+        
+        _linha(
+            [coord_origem, coord_aero_origem], terrestre,
+            f"{rota} | 🚗 {nome_origem} → {voo['icao_aeroporto_origem']} | "
+            f"{format_time(voo['tempo_terrestre_embarque'])} | {format_currency(voo['custo_terrestre_embarque'])}"
+        )
+        trecho = [icao.strip() for icao in voo['trajeto'].split(' -> ')]
+        if len(trecho) > 2:
+            # Conexões: curvas entre aeroportos consecutivos com coordenada conhecida
+            escalas = [(icao, get_aerodromo_coord(icao, aero_coords_cache)) for icao in trecho]
+            escalas = [(icao, coord) for icao, coord in escalas if coord[0]]
+            segmentos, curvatura = list(zip(escalas, escalas[1:])), 0.15
+        else:
+            segmentos = [((voo['icao_aeroporto_origem'], coord_aero_origem), (voo['icao_aeroporto_destino'], coord_aero_destino))]
+            curvatura = 0.2
+        for (icao_a, inicio), (icao_b, fim) in segmentos:
+            aereos.append((len(features), inicio, fim, curvatura))
+            _linha(
+                [], aereo,
+                f"{rota} | ✈️ {icao_a} → {icao_b} | Tempo Total: {format_time(voo['tempo_aereo'])} | "
+                f"Custo Total: {format_currency(voo['custo_aereo'])}"
+            )
+        _linha(
+            [coord_aero_destino, coord_destino], terrestre,
+            f"{rota} | 🚗 {voo['icao_aeroporto_destino']} → {nome_destino} | "
+            f"{format_time(voo['tempo_terrestre_desembarque'])} | {format_currency(voo['custo_terrestre_desembarque'])}"
+        )
+    if aereos:
+        indices, inicios, fins, curvaturas = zip(*aereos)
+        curvas = geometria.curvas_bezier(inicios, fins, curvaturas)
+        for indice, curva in zip(indices, curvas):
+            # GeoJSON usa (lon, lat)
+            features[indice]['geometry']['coordinates'] = curva[:, ::-1].tolist()
+    return {'type': 'FeatureCollection', 'features': features}
+
+def _estilo_feature_rota(feature):
+    props = feature['properties']
+    return {'color': props['color'], 'weight': props['weight'], 'opacity': props['opacity'], 'dashArray': props['dashArray']}
+
+def _map_render_stats_enabled() -> bool:
+    # Faz parte da chave do cache de mapas: o HTML muda com a medição ligada
+    return str(_get_app_setting('MAP_RENDER_STATS', '')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _anexar_medicao_mapa(mapa, modo: str):
+    """Mostra no canto do mapa o tamanho do HTML e o tempo de renderização no navegador (MAP_RENDER_STATS)"""
+    if not _map_render_stats_enabled():
+        return
+    mapa.get_root().html.add_child(folium.Element(f"""
+    <script>
+    window.addEventListener('load', function () {{
+        var kb = (document.documentElement.outerHTML.length / 1024).toFixed(0);
+        var ms = performance.now().toFixed(0);
+        var div = document.createElement('div');
+        div.style.cssText = 'position:fixed;bottom:4px;left:4px;z-index:9999;background:rgba(255,255,255,0.85);' +
+            'font:11px monospace;padding:2px 6px;border-radius:3px;';
+        div.textContent = '{modo}: ' + kb + ' KB | render ' + ms + ' ms';
+        document.body.appendChild(div);
+    }});
+    </script>
+    """))
+
+def filter_options_by_search(indice: IndiceBusca, search_term: str, codigos=None, k: int = 50):
+    """Opções mais relevantes para o termo de busca (top-k ranqueado pelo índice)"""
+    return indice.buscar(search_term, k=k, codigos=codigos)
+
+def opcoes_com_busca(indice: IndiceBusca, rotulo: str, chave: str, chave_select: str, opcoes_todas: list,
+                     codigos=None, disabled: bool = False) -> list:
+    """Campo de busca da barra lateral: com termo, o seletor mostra só os k melhores do índice"""
+    termo = st.sidebar.text_input(
+        rotulo, key=chave, placeholder="Nome, UF ou código", disabled=disabled
+    )
+    if not termo or not termo.strip():
+        return opcoes_todas
+    opcoes = filter_options_by_search(indice, termo, codigos=codigos)
+    # Seleção atual continua válida mesmo fora do top-k do novo termo
+    atual = st.session_state.get(chave_select)
+    if atual and atual not in opcoes and atual in opcoes_todas:
+        opcoes = [atual] + opcoes
+    return opcoes
+
+def _usuario_admin() -> bool:
+    """Usuário logado está em ADMIN_USERS (lista no secrets.toml ou nomes separados por vírgula)"""
+    admins = _get_app_setting('ADMIN_USERS', '') or ''
+    if isinstance(admins, str):
+        admins = admins.split(',')
+    return st.session_state.get('username') in {str(a).strip() for a in admins if str(a).strip()}
+
+def _tabela_spans(spans: list) -> pl.DataFrame:
+    return pl.DataFrame({
+        'Etapa': ['· ' * s['profundidade'] + s['etapa'] for s in spans],
+        'ms': [s['ms'] for s in spans],
+        'Linhas': [s['linhas'] for s in spans],
+    }, schema={'Etapa': pl.Utf8, 'ms': pl.Float64, 'Linhas': pl.Int64})
+
+def finalizar_medicao(medicao: Medicao, **contexto) -> None:
+    """Grava a execução no log JSONL (PERF_LOG_FILE, opcional) e mostra o painel de desempenho aos admins"""
+    registro = medicao.como_registro(
+        usuario=st.session_state.get('username'), memoria_mb=round(check_memory_usage(), 1), **contexto
+    )
+    try:
+        # Log desligado por padrão; ligado, gira ao passar de PERF_LOG_MAX_MB (mantém um .1)
+        gravar_jsonl(
+            _get_app_setting('PERF_LOG_FILE', ''), registro,
+            max_bytes=_get_int_setting('PERF_LOG_MAX_MB', 50) * 1024 * 1024,
+        )
+    except OSError as e:
+        logger.warning(f"AVISO: Falha ao gravar log de desempenho: {e}")
+    logger.debug(f"PERF: execução em {registro['total_ms']:.0f}ms ({len(registro['spans'])} etapas)")
+    if not _usuario_admin():
+        return
+    with st.sidebar.expander("⏱️ Desempenho desta interação"):
+        st.caption(f"Total {registro['total_ms']:.0f}ms · memória {registro['memoria_mb']:.0f}MB")
+        st.dataframe(_tabela_spans(registro['spans']), width='stretch', hide_index=True)
+        status = provisioning_status()
+        st.caption(f"Provisionamento do processo: {status['status']} em {status['duracao']:.1f}s")
+        st.dataframe(_tabela_spans(status['etapas']), width='stretch', hide_index=True)
 
 # Navegação principal
 st.markdown(f"""
@@ -1383,6 +1823,11 @@ with st.sidebar:
     if st.button("🚪 Sair", use_container_width=True, type="secondary"):
         logout()
     
+    st.caption(f"🟢 Banco pronto (preparado em {status_banco['duracao']:.0f}s)")
+    aquecimento = provisioning_status()['aquecimento']
+    if aquecimento != 'concluído':
+        st.caption(f"🔥 Aquecendo caches: {aquecimento or 'aguardando'}...")
+    
     # Ocultar botões e avisos de cache/memória
     current_memory = check_memory_usage()
     
@@ -1404,114 +1849,34 @@ elif "🗺️ Por UTP" in pagina_selecionada:
 else:
     pagina_atual = "centralidades"
 
-# Carregar dados baseado na página selecionada
-if pagina_atual == "municipios":
-    dados_municipios, comerciais, executivos, classificacao, aeroportos = load_municipios_data()
-    
-    # Criar dicionários de mapeamento código -> nome com UF para municípios
-    @st.cache_data(ttl=3600, max_entries=3, show_spinner=False)
-    def create_municipio_mappings(comerciais, executivos, dados_municipios):
-        mun_map = {}
-        uf_map = dict(zip(dados_municipios['municipio'].to_list(), dados_municipios['uf'].to_list()))
-        
-        comerciais_origem = comerciais.select(['cod_mun_origem', 'mun_origem']).rename({
-            'cod_mun_origem': 'codigo', 'mun_origem': 'nome'
-        })
-        comerciais_destino = comerciais.select(['cod_mun_destino', 'mun_destino']).rename({
-            'cod_mun_destino': 'codigo', 'mun_destino': 'nome'
-        })
-        executivos_origem = executivos.select(['cod_mun_origem', 'mun_origem']).rename({
-            'cod_mun_origem': 'codigo', 'mun_origem': 'nome'
-        })
-        executivos_destino = executivos.select(['cod_mun_destino', 'mun_destino']).rename({
-            'cod_mun_destino': 'codigo', 'mun_destino': 'nome'
-        })
-        
-        todos_municipios = pl.concat([
-            comerciais_origem, comerciais_destino,
-            executivos_origem, executivos_destino
-        ]).unique()
-        
-        for row in todos_municipios.iter_rows(named=True):
-            codigo = row['codigo']
-            nome = row['nome']
-            uf = uf_map.get(codigo, '')
-            nome_com_uf = f"{nome}, {uf}" if uf else nome
-            mun_map[codigo] = nome_com_uf
-        
-        return mun_map
-    
-    item_map = create_municipio_mappings(comerciais, executivos, dados_municipios)
-    mun_coords_cache, aero_coords_cache = create_coordinate_maps(dados_municipios, aeroportos)
-    
-elif pagina_atual == "utps":
-    dados_utps, utp_info, comerciais, executivos, classificacao, aeroportos = load_utp_data()
-    
-    # Criar dicionários de mapeamento UTP
-    @st.cache_data(ttl=3600, max_entries=3, show_spinner=False)
-    def create_utp_mappings(comerciais, executivos, dados_utps):
-        utp_map = {}
-        
-        # Primeiro, criar mapeamento UTP -> nome_UTP
-        utp_nomes = dict(zip(dados_utps['utp'].to_list(), dados_utps['nome_utp'].to_list()))
-        
-        # Coletar UTPs únicas de origem e destino
-        utps_origem = set(comerciais['UTP_origem'].unique().to_list())
-        utps_destino = set(comerciais['UTP_destino'].unique().to_list())
-        if executivos.height > 0:
-            utps_origem.update(executivos['UTP_origem'].unique().to_list())
-            utps_destino.update(executivos['UTP_destino'].unique().to_list())
-        
-        todas_utps = utps_origem.union(utps_destino)
-        
-        for utp_cod in todas_utps:
-            nome_utp = utp_nomes.get(utp_cod, f"UTP {utp_cod}")
-            utp_map[str(utp_cod)] = f"{utp_cod} - {nome_utp}"
-        
-        return utp_map
-    
-    item_map = create_utp_mappings(comerciais, executivos, dados_utps)
-    
-    # Para UTPs, usar coordenadas dos municípios sede
-    @st.cache_data(ttl=3600, max_entries=3, show_spinner=False)
-    def create_utp_coordinate_maps(dados_utps, aeroportos):
-        utp_coords = {}
-        
-        # Coordenadas das UTPs baseadas nos municípios sede
-        for row in dados_utps.filter(pl.col('sede') == True).iter_rows(named=True):
-            utp_coords[str(row['utp'])] = (row['lat_utp'], row['long_utp'])
-        
-        aero_coords = {}
-        for row in aeroportos.iter_rows(named=True):
-            aero_coords[row['icao']] = (row['latitude'], row['longitude'])
-        
-        return utp_coords, aero_coords
-    
-    mun_coords_cache, aero_coords_cache = create_utp_coordinate_maps(dados_utps, aeroportos)
-    
-else:  # centralidades
-    # Verificar memória antes de carregar centralidades - SEM LIMPEZA FORÇADA
+# Carregar dados baseado na página selecionada (caches chaveados pela versão, sem hash de frames)
+versao_dados = dataset_version()
+try:
+    if pagina_atual == "municipios":
+        with medicao.span("load_municipios_data") as span:
+            comerciais, executivos = load_municipios_data(versao_dados)
+            span['linhas'] = contar_linhas((comerciais, executivos))
+    elif pagina_atual == "utps":
+        with medicao.span("load_utp_data") as span:
+            comerciais, executivos = load_utp_data(versao_dados)
+            span['linhas'] = contar_linhas((comerciais, executivos))
+except RuntimeError as e:
+    st.error(f"❌ {e}")
+    st.stop()
+
+# Rótulos "Nome, UF" / "N - Nome" e coordenadas (UTPs: município sede) do dicionário compartilhado
+with medicao.span("mapeamentos (dicionário de entidades)") as span:
+    dicionario_entidades = get_entity_dictionary(versao_dados)
+    tipo_entidade = UTP if pagina_atual == "utps" else MUNICIPIO
+    item_map = dicionario_entidades.rotulos(tipo_entidade)
+    mun_coords_cache = dicionario_entidades.coords(tipo_entidade)
+    aero_coords_cache = dicionario_entidades.aeroportos
+    span['linhas'] = len(item_map)
+
+if pagina_atual == "centralidades":
+    # Rotas de centralidades são consultadas sob demanda no DuckDB (sem carregar tabelas inteiras)
     current_memory = check_memory_usage()
-    logger.info(f"MEMORIA: Antes de carregar centralidades: {current_memory:.1f}MB")
-    
-    # Mostrar aviso se memória ainda estiver alta
-   
-    # Carregamento super rápido sob demanda (evita carregar tabelas inteiras)
-    dados_municipios, dados_centralidades, _, _, classificacao, aeroportos = load_centralidade_data()
-    
-    # Mapeamento nome com UF a partir de dados_municipios (cobre todos os municípios)
-    @st.cache_data(ttl=3600, max_entries=3, show_spinner=False)
-    def create_centralidade_mappings_fast(dados_municipios):
-        mun_map = {}
-        for row in dados_municipios.iter_rows(named=True):
-            codigo = row['municipio']
-            nome = row['nome_municipio']
-            uf = row['uf'] or ''
-            nome_com_uf = f"{nome}, {uf}" if uf else nome
-            mun_map[codigo] = nome_com_uf
-        return mun_map
-    item_map = create_centralidade_mappings_fast(dados_municipios)
-    mun_coords_cache, aero_coords_cache = create_coordinate_maps(dados_municipios, aeroportos)
+    logger.info(f"MEMORIA: Antes de consultar centralidades: {current_memory:.1f}MB")
     
     # Consultas em memória para origens/destinos - IGUAL municipios/UTPs
     # Função para origens disponíveis - EM MEMÓRIA
@@ -1520,11 +1885,13 @@ else:  # centralidades
             # Otimização: Buscar origens diretamente do banco de dados para economizar memória
             logger.debug("QUERY: Buscando origens únicas de centralidades do DuckDB")
             con = get_duckdb_connection()
-            arrow = con.execute("""
-                SELECT DISTINCT SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod 
+            o_com, _, _ = _route_keys('mun_centralidade_voos_comerciais')
+            o_exe, _, _ = _route_keys('mun_centralidade_voos_executivos')
+            arrow = con.execute(f"""
+                SELECT DISTINCT CAST({o_com} AS VARCHAR) AS cod
                 FROM mun_centralidade_voos_comerciais
                 UNION
-                SELECT DISTINCT SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS cod
+                SELECT DISTINCT CAST({o_exe} AS VARCHAR) AS cod
                 FROM mun_centralidade_voos_executivos
                 ORDER BY cod
             """).arrow()
@@ -1539,16 +1906,18 @@ else:  # centralidades
             # Otimização: Buscar destinos diretamente do banco de dados
             logger.debug(f"QUERY: Buscando destinos de centralidades para a origem {origem_cod} do DuckDB")
             con = get_duckdb_connection()
-            arrow = con.execute("""
-                SELECT DISTINCT SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod
-                FROM mun_centralidade_voos_comerciais 
-                WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ?
+            o_com, d_com, _ = _route_keys('mun_centralidade_voos_comerciais')
+            o_exe, d_exe, _ = _route_keys('mun_centralidade_voos_executivos')
+            arrow = con.execute(f"""
+                SELECT DISTINCT CAST({d_com} AS VARCHAR) AS cod
+                FROM mun_centralidade_voos_comerciais
+                WHERE {o_com} = ?
                 UNION
-                SELECT DISTINCT SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS cod
+                SELECT DISTINCT CAST({d_exe} AS VARCHAR) AS cod
                 FROM mun_centralidade_voos_executivos
-                WHERE SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) = ?
+                WHERE {o_exe} = ?
                 ORDER BY cod
-            """, [origem_cod, origem_cod]).arrow()
+            """, [int(origem_cod), int(origem_cod)]).arrow()
             return pl.from_arrow(arrow)['cod'].to_list()
         except Exception as e:
             logger.warning(f"AVISO: Erro ao buscar destinos: {str(e)}")
@@ -1559,54 +1928,16 @@ else:  # centralidades
 
     @st.cache_data(ttl=600, max_entries=10, show_spinner=False)
     def centralidades_contar_pares_sql(password: str):
-        con = get_duckdb_connection()
-        try:
-            c = con.execute(
-                """
-                SELECT COUNT(*) FROM (
-                  SELECT DISTINCT 
-                    SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS o,
-                    SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS d
-                  FROM mun_centralidade_voos_comerciais
-                )
-                """
-            ).fetchone()[0]
-            e = con.execute(
-                """
-                SELECT COUNT(*) FROM (
-                  SELECT DISTINCT 
-                    SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS o,
-                    SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS d
-                  FROM mun_centralidade_voos_executivos
-                )
-                """
-            ).fetchone()[0]
-        except Exception:
-            try:
-                st.cache_resource.clear()
-            except Exception:
-                pass
-            con = get_duckdb_connection()
-            c = con.execute(
-                """
-                SELECT COUNT(*) FROM (
-                  SELECT DISTINCT 
-                    SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS o,
-                    SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS d
-                  FROM mun_centralidade_voos_comerciais
-                )
-                """
-            ).fetchone()[0]
-            e = con.execute(
-                """
-                SELECT COUNT(*) FROM (
-                  SELECT DISTINCT 
-                    SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS o,
-                    SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS d
-                  FROM mun_centralidade_voos_executivos
-                )
-                """
+        def _contar_pares(con, table: str) -> int:
+            o, d, _ = _route_keys(table)
+            return con.execute(
+                f"SELECT COUNT(*) FROM (SELECT DISTINCT {o} AS o, {d} AS d FROM {table})"
             ).fetchone()[0]
+        
+        # Fallback para bancos sem dashboard_stats
+        con = get_duckdb_connection()
+        c = _contar_pares(con, 'mun_centralidade_voos_comerciais')
+        e = _contar_pares(con, 'mun_centralidade_voos_executivos')
         return int(c), int(e)
 
     @st.cache_data(ttl=600, max_entries=5, show_spinner=False)
@@ -1617,26 +1948,16 @@ else:  # centralidades
         except Exception:
             return 0
 
-# Criar opções pesquisáveis
-@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)
-def get_unique_origins_by_page(comerciais, executivos, pagina):
-    if pagina == "utps":
-        origins_comerciais = set(comerciais['UTP_origem'].unique().to_list())
-        origins_executivos = set(executivos['UTP_origem'].unique().to_list()) if executivos.height > 0 else set()
-        return {str(x) for x in origins_comerciais.union(origins_executivos)}
+with medicao.span("origens e índice de busca") as span:
+    if pagina_atual == "centralidades":
+        _pwd = get_files_password()
+        unique_origins = set(centralidades_unique_origins_sql(_pwd))
     else:
-        origins_comerciais = set(comerciais['cod_mun_origem'].unique().to_list())
-        origins_executivos = set(executivos['cod_mun_origem'].unique().to_list()) if executivos.height > 0 else set()
-        return origins_comerciais.union(origins_executivos)
-
-if pagina_atual == "centralidades":
-    _pwd = get_files_password()
-    unique_origins = set(centralidades_unique_origins_sql(_pwd))
-else:
-    unique_origins = get_unique_origins_by_page(comerciais, executivos, pagina_atual)
-opcoes_origem_todas, search_map_origem = create_searchable_options({k: v for k, v in item_map.items() 
-                                                                   if k in unique_origins}, 
-                                                                   is_utp=(pagina_atual == "utps"))
+        unique_origins = get_unique_origins_by_page(versao_dados, pagina_atual, comerciais, executivos)
+    # Índice de busca do nível (construído uma vez); opções de origem/destino são recortes dele
+    indice_busca = get_indice_busca(versao_dados, pagina_atual, item_map)
+    opcoes_origem_todas = indice_busca.opcoes(unique_origins)
+    span['linhas'] = len(opcoes_origem_todas)
 
 # Inicializar contador de limpeza se não existir
 if 'clear_counter' not in st.session_state:
@@ -1659,23 +1980,34 @@ else:  # centralidades
     placeholder_origem = "Digite para buscar centralidade de origem..."
     placeholder_destino = "Digite para buscar centralidade de destino..."
 
+# Busca ranqueada no servidor (prefixo/trigramas) restringe as opções do seletor a cada termo
+chave_origem = f"origem_select_{st.session_state.clear_counter}_{pagina_atual}"
+opcoes_origem = opcoes_com_busca(
+    indice_busca, f"🔎 Buscar {origem_label.lower()}", f"origem_busca_{st.session_state.clear_counter}_{pagina_atual}",
+    chave_origem, opcoes_origem_todas, codigos=unique_origins,
+)
 origem_selecionada_nome = st.sidebar.selectbox(
     origem_label,
-    options=opcoes_origem_todas,
+    options=opcoes_origem,
     index=None,
     placeholder=placeholder_origem,
-    key=f"origem_select_{st.session_state.clear_counter}_{pagina_atual}",
+    key=chave_origem,
     label_visibility="visible"
 )
 
 # Obter código da origem selecionada
 origem_selecionada = ""
 if origem_selecionada_nome:
-    origem_selecionada = search_map_origem[origem_selecionada_nome]['codigo']
+    origem_selecionada = indice_busca.codigo(origem_selecionada_nome)
 
 # Filtrar destinos baseado na origem selecionada e página atual
 if origem_selecionada:
-    if pagina_atual == "utps":
+    inicio_destinos = time.perf_counter()
+    destinos_adjacencia = get_destinos_adjacencia(_db_state()['path'], pagina_atual, origem_selecionada)
+    if destinos_adjacencia is not None:
+        # Lista pré-computada no build (od_adjacency): uma consulta por chave
+        destinos_disponiveis_cod = set(destinos_adjacencia)
+    elif pagina_atual == "utps":
         # Para UTPs, filtrar por UTP_origem e UTP_destino
         destinos_comerciais = comerciais.filter(pl.col('UTP_origem') == int(origem_selecionada))['UTP_destino'].unique().to_list()
         destinos_executivos = executivos.filter(pl.col('UTP_origem') == int(origem_selecionada))['UTP_destino'].unique().to_list() if executivos.height > 0 else []
@@ -1691,19 +2023,23 @@ if origem_selecionada:
             destinos_executivos = executivos.filter(pl.col('cod_mun_origem').cast(pl.Utf8) == str(origem_selecionada))['cod_mun_destino'].cast(pl.Utf8).unique().to_list() if executivos.height > 0 else []
             destinos_disponiveis_cod = set(destinos_comerciais + destinos_executivos)
     
-    opcoes_destino_filtradas, search_map_destino = create_searchable_options({k: v for k, v in item_map.items() 
-                                                                             if k in destinos_disponiveis_cod}, 
-                                                                             is_utp=(pagina_atual == "utps"))
+    opcoes_destino_filtradas = indice_busca.opcoes(destinos_disponiveis_cod)
+    medicao.registrar("filtrar destinos", inicio_destinos, linhas=len(opcoes_destino_filtradas))
 else:
     opcoes_destino_filtradas = []
-    search_map_destino = {}
 
+chave_destino = f"destino_select_{st.session_state.clear_counter}_{pagina_atual}"
+opcoes_destino = opcoes_com_busca(
+    indice_busca, f"🔎 Buscar {destino_label.lower()}", f"destino_busca_{st.session_state.clear_counter}_{pagina_atual}",
+    chave_destino, opcoes_destino_filtradas,
+    codigos=destinos_disponiveis_cod if origem_selecionada else [], disabled=not origem_selecionada_nome,
+)
 destino_selecionado_nome = st.sidebar.selectbox(
     destino_label,
-    options=opcoes_destino_filtradas,
+    options=opcoes_destino,
     index=None,
     placeholder=placeholder_destino,
-    key=f"destino_select_{st.session_state.clear_counter}_{pagina_atual}",
+    key=chave_destino,
     label_visibility="visible",
     disabled=not origem_selecionada_nome
 )
@@ -1722,35 +2058,19 @@ mostrar_todas_rotas = st.sidebar.checkbox("Mostrar todas as rotas simultaneament
 # Obter códigos das seleções
 origem_selecionada = ""
 if origem_selecionada_nome:
-    origem_selecionada = search_map_origem[origem_selecionada_nome]['codigo']
+    origem_selecionada = indice_busca.codigo(origem_selecionada_nome)
 
 destino_selecionado = ""
-if destino_selecionado_nome and destino_selecionado_nome in search_map_destino:
-    destino_selecionado = search_map_destino[destino_selecionado_nome]['codigo']
+if destino_selecionado_nome and destino_selecionado_nome in opcoes_destino_filtradas:
+    destino_selecionado = indice_busca.codigo(destino_selecionado_nome)
 
 st.sidebar.markdown("---")
 
 if origem_selecionada and destino_selecionado:
-    # Verificar tipo de voo baseado na página
-    if pagina_atual == "utps":
-        # Para UTPs, buscar municípios da UTP e depois verificar na classificação
-        municipios_origem = dados_utps.filter(pl.col('utp') == int(origem_selecionada))['municipio'].unique().to_list()
-        municipios_destino = dados_utps.filter(pl.col('utp') == int(destino_selecionado))['municipio'].unique().to_list()
-        
-        # Buscar qualquer combinação de municípios entre as UTPs na classificação
-        tipo_voo = classificacao.filter(
-            (pl.col('cod_mun_origem').cast(pl.Utf8).is_in([str(m) for m in municipios_origem])) & 
-            (pl.col('cod_mun_destino').cast(pl.Utf8).is_in([str(m) for m in municipios_destino]))
-        )
-    else:
-        # Para municípios e centralidades - ✨ CORREÇÃO: Garantir tipos compatíveis
-        tipo_voo = classificacao.filter(
-            (pl.col('cod_mun_origem').cast(pl.Utf8) == str(origem_selecionada)) & 
-            (pl.col('cod_mun_destino').cast(pl.Utf8) == str(destino_selecionado))
-        )
+    # Tipo de voo do par consultado direto na classificação do nível (UTPs: via municípios membros)
+    tipo = get_tipo_voo_par(_db_state()['path'], pagina_atual, origem_selecionada, destino_selecionado)
     
-    if tipo_voo.height > 0:
-        tipo = tipo_voo['tipo_voo'][0]
+    if tipo is not None:
         st.sidebar.markdown(f"""
         <div class="info-card">
             <strong>Tipo de Voo:</strong> {tipo}
@@ -1768,17 +2088,15 @@ if origem_selecionada_nome and destino_selecionado_nome:
         coord_orig = get_mun_coord(origem_selecionada, mun_coords_cache)
         coord_dest = get_mun_coord(destino_selecionado, mun_coords_cache)
         
-    if coord_orig[0] and coord_dest[0]:
-        # Calcular distância em linha reta (fórmula de Haversine simplificada)
-        lat1, lon1 = coord_orig
-        lat2, lon2 = coord_dest
-        import math
-        
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        distancia_km = int(6371 * c)  # Raio da Terra em km
+    # Distância, faixa e UFs do par pré-calculadas no build; sem a tabela, calcula aqui
+    distancia_par = get_distancia_par(_db_state()['path'], pagina_atual, origem_selecionada, destino_selecionado)
+    
+    if distancia_par is not None or (coord_orig[0] and coord_dest[0]):
+        if distancia_par is not None:
+            distancia_km = int(distancia_par['distancia_km'])
+        else:
+            # Distância em linha reta (Haversine)
+            distancia_km = int(geometria.haversine_km(coord_orig[0], coord_orig[1], coord_dest[0], coord_dest[1]))
         
         # Determinar regiões baseado no tipo de página
         if pagina_atual == "utps":
@@ -1792,17 +2110,25 @@ if origem_selecionada_nome and destino_selecionado_nome:
             # Para municípios e centralidades
             origem_nome_display = origem_selecionada_nome.split(',')[0] if ',' in origem_selecionada_nome else origem_selecionada_nome
             destino_nome_display = destino_selecionado_nome.split(',')[0] if ',' in destino_selecionado_nome else destino_selecionado_nome
-            origem_uf = origem_selecionada_nome.split(', ')[-1] if ', ' in origem_selecionada_nome else ""
-            destino_uf = destino_selecionado_nome.split(', ')[-1] if ', ' in destino_selecionado_nome else ""
+            if distancia_par is not None:
+                origem_uf = distancia_par['uf_origem'] or ""
+                destino_uf = distancia_par['uf_destino'] or ""
+                mesmo_estado = bool(distancia_par['mesmo_estado'])
+            else:
+                origem_uf = origem_selecionada_nome.split(', ')[-1] if ', ' in origem_selecionada_nome else ""
+                destino_uf = destino_selecionado_nome.split(', ')[-1] if ', ' in destino_selecionado_nome else ""
+                mesmo_estado = origem_uf == destino_uf
             
             # Classificar tipo de viagem
-            if origem_uf == destino_uf:
+            if mesmo_estado:
                 tipo_viagem = "🏠 Viagem Estadual"
             else:
                 tipo_viagem = "🌎 Viagem Interestadual"
         
         # Classificar distância
-        if distancia_km < 300:
+        if distancia_par is not None:
+            categoria_dist = _ICONES_CATEGORIA_DISTANCIA.get(distancia_par['categoria'], distancia_par['categoria'])
+        elif distancia_km < 300:
             categoria_dist = "📍 Curta Distância"
         elif distancia_km < 800:
             categoria_dist = "🛣️ Média Distância"
@@ -1865,34 +2191,10 @@ if origem_selecionada and destino_selecionado:
     
     st.markdown(f"## Rota: {nome_origem} → {nome_destino}")
     
-    # Verificar se é voo executivo ou comercial baseado na página
-    if pagina_atual == "utps":
-        # Para UTPs, filtrar por UTP_origem e UTP_destino
-        voos_executivos = executivos.filter(
-            (pl.col('UTP_origem') == int(origem_selecionada)) & 
-            (pl.col('UTP_destino') == int(destino_selecionado))
-        )
-        
-        voos_comerciais = comerciais.filter(
-            (pl.col('UTP_origem') == int(origem_selecionada)) & 
-            (pl.col('UTP_destino') == int(destino_selecionado))
-        )
-    else:
-        # Para municípios e centralidades - USAR MESMA ABORDAGEM
-        if pagina_atual == "centralidades":
-            # Otimização: Carregar dados sob demanda para o par selecionado
-            voos_comerciais, voos_executivos = get_voos_for_pair_centralidades(origem_selecionada, destino_selecionado)
-        else:
-            # ✨ CORREÇÃO: Garantir compatibilidade de tipos (string vs string)
-            voos_executivos = executivos.filter(
-                (pl.col('cod_mun_origem').cast(pl.Utf8) == str(origem_selecionada)) & 
-                (pl.col('cod_mun_destino').cast(pl.Utf8) == str(destino_selecionado))
-            )
-            
-            voos_comerciais = comerciais.filter(
-                (pl.col('cod_mun_origem').cast(pl.Utf8) == str(origem_selecionada)) & 
-                (pl.col('cod_mun_destino').cast(pl.Utf8) == str(destino_selecionado))
-            )
+    # Linhas completas apenas do par selecionado, filtradas no DuckDB
+    with medicao.span("consulta do par") as span:
+        voos_comerciais, voos_executivos = get_voos_for_pair(pagina_atual, origem_selecionada, destino_selecionado)
+        span['linhas'] = contar_linhas((voos_comerciais, voos_executivos))
     
     if voos_executivos.height > 0:
         # Voo executivo - Display especial e prominente
@@ -1964,79 +2266,71 @@ if origem_selecionada and destino_selecionado:
                 </div>
                 """, unsafe_allow_html=True)
         
-        # Criar mapa
-        if pagina_atual == "utps":
-            coord_origem = mun_coords_cache.get(origem_selecionada, (None, None))
-            coord_destino = mun_coords_cache.get(destino_selecionado, (None, None))
-        else:
-            coord_origem = get_mun_coord(origem_selecionada, mun_coords_cache)
-            coord_destino = get_mun_coord(destino_selecionado, mun_coords_cache)
+        # Mapa já serializado para este par é reaproveitado sem reconstruir o Folium
+        chave_mapa = (_db_state()['path'], pagina_atual, origem_selecionada, destino_selecionado, 'executivo')
+        mapa_html = _map_cache_get(chave_mapa)
+        if mapa_html is None:
+            inicio_mapa = time.perf_counter()
+            # Criar mapa
+            if pagina_atual == "utps":
+                coord_origem = mun_coords_cache.get(origem_selecionada, (None, None))
+                coord_destino = mun_coords_cache.get(destino_selecionado, (None, None))
+            else:
+                coord_origem = get_mun_coord(origem_selecionada, mun_coords_cache)
+                coord_destino = get_mun_coord(destino_selecionado, mun_coords_cache)
         
-        if coord_origem[0] and coord_destino[0]:
-            # Calcular centro do mapa
-            center_lat = (coord_origem[0] + coord_destino[0]) / 2
-            center_lon = (coord_origem[1] + coord_destino[1]) / 2
+            if coord_origem[0] and coord_destino[0]:
+                # Calcular centro do mapa
+                center_lat = (coord_origem[0] + coord_destino[0]) / 2
+                center_lon = (coord_origem[1] + coord_destino[1]) / 2
             
-            # Criar mapa
-            m = folium.Map(
-                location=[center_lat, center_lon],
-                zoom_start=6,
-                tiles='CartoDB positron',
-                control_scale=True
-            )
+                # Criar mapa
+                m = folium.Map(
+                    location=[center_lat, center_lon],
+                    zoom_start=6,
+                    tiles='CartoDB positron',
+                    control_scale=True
+                )
             
-            # Adicionar marcadores
-            folium.Marker(
-                coord_origem,
-                popup=f"<b>{nome_origem}</b><br>Origem",
-                tooltip=nome_origem,
-                icon=folium.Icon(color='green', icon='play', prefix='fa')
-            ).add_to(m)
+                # Adicionar marcadores
+                folium.Marker(
+                    coord_origem,
+                    popup=f"<b>{nome_origem}</b><br>Origem",
+                    tooltip=nome_origem,
+                    icon=folium.Icon(color='green', icon='play', prefix='fa')
+                ).add_to(m)
             
-            folium.Marker(
-                coord_destino,
-                popup=f"<b>{nome_destino}</b><br>Destino",
-                tooltip=nome_destino,
-                icon=folium.Icon(color='red', icon='stop', prefix='fa')
-            ).add_to(m)
+                folium.Marker(
+                    coord_destino,
+                    popup=f"<b>{nome_destino}</b><br>Destino",
+                    tooltip=nome_destino,
+                    icon=folium.Icon(color='red', icon='stop', prefix='fa')
+                ).add_to(m)
             
-            # Linha direta para voo executivo
-            folium.PolyLine(
-                locations=[coord_origem, coord_destino],
-                color='#ff6b6b',
-                weight=4,
-                opacity=0.8,
-                dash_array='10',
-                popup=f"Voo Executivo Direto<br>Tempo: {format_time(voo['tempo_terrestre_direto'])}",
-            ).add_to(m)
+                # Linha direta para voo executivo
+                folium.PolyLine(
+                    locations=[coord_origem, coord_destino],
+                    color='#ff6b6b',
+                    weight=4,
+                    opacity=0.8,
+                    dash_array='10',
+                    popup=f"Voo Executivo Direto<br>Tempo: {format_time(voo['tempo_terrestre_direto'])}",
+                ).add_to(m)
             
-            # Animação agora é feita via CSS na linha tracejada
+                # Animação agora é feita via CSS na linha tracejada
             
+                medicao.registrar("construir mapa Folium", inicio_mapa, linhas=1)
+                with medicao.span("serializar mapa (HTML)"):
+                    mapa_html = _map_cache_put(chave_mapa, m)
+
+        if mapa_html is not None:
             # Exibir mapa
-            st_folium(m, height=600, width=None, returned_objects=[])
+            with medicao.span("enviar mapa"):
+                components.html(mapa_html, height=600)
             
     elif voos_comerciais.height > 0:
-        # Preparar dados das rotas
-        rotas = []
-        for i in range(voos_comerciais.height):
-            voo = voos_comerciais.row(i, named=True)
-            rotas.append({
-                'index': i,
-                'trajeto': voo['trajeto_aereo'],
-                'tempo_total': voo['tempo_total'],
-                'custo_total': voo['custo_total'],
-                'percentual': voo['percentual_de_viagens_par_od'] * 100,
-                'viagens': int(voo['viagens']),
-                'conexoes': voo['num_conexoes'],
-                'tempo_aereo': voo.get('tempo_aereo', 0),
-                'tempo_terrestre_embarque': voo.get('tempo_terrestre_embarque', 0),
-                'tempo_terrestre_desembarque': voo.get('tempo_terrestre_desembarque', 0),
-                'custo_terrestre_embarque': voo.get('custo_terrestre_embarque', 0),
-                'custo_terrestre_desembarque': voo.get('custo_terrestre_desembarque', 0)
-            })
-        
-        # Ordenar por percentual
-        rotas.sort(key=lambda x: x['percentual'], reverse=True)
+        # Resumo colunar das rotas (ordenado por percentual) usado por cards, mapa, tabela e gráfico
+        rotas = resumir_rotas(voos_comerciais)
         
         # Layout principal com duas colunas
         col_mapa, col_info = st.columns([2, 1])
@@ -2061,20 +2355,20 @@ if origem_selecionada and destino_selecionado:
             if not mostrar_todas_rotas:
                 st.markdown("**Rota Específica:**")
                 if pagina_atual != "centralidades":
-                    opcoes_rotas = [f"Rota {i+1} - {format_number_br(r['percentual'], 1)}% das viagens" for i, r in enumerate(rotas)]
+                    opcoes_rotas = [f"Rota {i+1} - {format_number_br(p, 1)}% das viagens" for i, p in enumerate(rotas['percentual'])]
                 else:
-                    opcoes_rotas = [f"Rota {i+1} - {format_number_br(r['percentual'], 1)}% do tráfego" for i, r in enumerate(rotas)]
+                    opcoes_rotas = [f"Rota {i+1} - {format_number_br(p, 1)}% do tráfego" for i, p in enumerate(rotas['percentual'])]
                 rota_selecionada = st.selectbox(
                     "Selecionar rota:",
                     opcoes_rotas,
                     label_visibility="collapsed"
                 )
                 indice_rota = opcoes_rotas.index(rota_selecionada)
-                rotas_para_mostrar = [rotas[indice_rota]]
-                rota_atual = rotas[indice_rota]
+                rotas_para_mostrar = rotas.slice(indice_rota, 1)
+                rota_atual = rotas.row(indice_rota, named=True)
             else:
                 rotas_para_mostrar = rotas
-                rota_atual = rotas[0]
+                rota_atual = rotas.row(0, named=True)
                 
                 # Mostrar indicador de rota principal
                 st.markdown("**Rota Principal (maior percentual):**")
@@ -2190,142 +2484,190 @@ if origem_selecionada and destino_selecionado:
             </div>
             """, unsafe_allow_html=True)
             
-            # Criar mapa
-            if pagina_atual == "utps":
-                coord_origem = mun_coords_cache.get(origem_selecionada, (None, None))
-                coord_destino = mun_coords_cache.get(destino_selecionado, (None, None))
-            else:
-                coord_origem = get_mun_coord(origem_selecionada, mun_coords_cache)
-                coord_destino = get_mun_coord(destino_selecionado, mun_coords_cache)
+            # Cores para diferentes rotas - paleta mais diversificada
+            cores_rotas = [
+                '#1e3c72',  # Azul escuro principal
+                '#e74c3c',  # Vermelho
+                '#27ae60',  # Verde
+                '#f39c12',  # Laranja
+                '#9b59b6',  # Roxo
+                '#3498db',  # Azul claro
+                '#e67e22',  # Laranja escuro
+                '#2ecc71',  # Verde claro
+                '#8e44ad',  # Roxo escuro
+                '#34495e'   # Cinza azulado
+            ]
             
-            if coord_origem[0] and coord_destino[0]:
-                # Calcular centro e zoom do mapa
-                lats = [coord_origem[0], coord_destino[0]]
-                lons = [coord_origem[1], coord_destino[1]]
-                center_lat = sum(lats) / len(lats)
-                center_lon = sum(lons) / len(lons)
+            modo_mapa = _get_map_render_mode(mostrar_todas_rotas, rotas_para_mostrar.height)
+            
+            # Mapa já serializado para este par/rota é reaproveitado sem reconstruir o Folium
+            chave_mapa = (
+                _db_state()['path'], pagina_atual, origem_selecionada, destino_selecionado,
+                'todas' if mostrar_todas_rotas else indice_rota, modo_mapa, _map_render_stats_enabled(),
+            )
+            mapa_html = _map_cache_get(chave_mapa)
+            if mapa_html is None:
+                inicio_mapa = time.perf_counter()
+                # Criar mapa
+                if pagina_atual == "utps":
+                    coord_origem = mun_coords_cache.get(origem_selecionada, (None, None))
+                    coord_destino = mun_coords_cache.get(destino_selecionado, (None, None))
+                else:
+                    coord_origem = get_mun_coord(origem_selecionada, mun_coords_cache)
+                    coord_destino = get_mun_coord(destino_selecionado, mun_coords_cache)
+            
+                if coord_origem[0] and coord_destino[0]:
+                    # Calcular centro e zoom do mapa
+                    lats = [coord_origem[0], coord_destino[0]]
+                    lons = [coord_origem[1], coord_destino[1]]
+                    center_lat = sum(lats) / len(lats)
+                    center_lon = sum(lons) / len(lons)
                 
-                # Calcular zoom baseado na distância
-                lat_diff = max(lats) - min(lats)
-                lon_diff = max(lons) - min(lons)
-                max_diff = max(lat_diff, lon_diff)
-                zoom = 5 if max_diff > 10 else 6 if max_diff > 5 else 7
+                    # Calcular zoom baseado na distância
+                    lat_diff = max(lats) - min(lats)
+                    lon_diff = max(lons) - min(lons)
+                    max_diff = max(lat_diff, lon_diff)
+                    zoom = 5 if max_diff > 10 else 6 if max_diff > 5 else 7
                 
-                # Criar mapa
-                m = folium.Map(
-                    location=[center_lat, center_lon],
-                    zoom_start=zoom,
-                    tiles='CartoDB positron',
-                    control_scale=True
-                )
+                    # Criar mapa
+                    m = folium.Map(
+                        location=[center_lat, center_lon],
+                        zoom_start=zoom,
+                        tiles='CartoDB positron',
+                        control_scale=True
+                    )
                 
-                # Cores para diferentes rotas - paleta mais diversificada
-                cores_rotas = [
-                    '#1e3c72',  # Azul escuro principal
-                    '#e74c3c',  # Vermelho
-                    '#27ae60',  # Verde
-                    '#f39c12',  # Laranja
-                    '#9b59b6',  # Roxo
-                    '#3498db',  # Azul claro
-                    '#e67e22',  # Laranja escuro
-                    '#2ecc71',  # Verde claro
-                    '#8e44ad',  # Roxo escuro
-                    '#34495e'   # Cinza azulado
-                ]
                 
-                                # Adicionar cada rota
-                for idx, rota in enumerate(rotas_para_mostrar):
-                    i = rota['index']
-                    voo = voos_comerciais.row(i, named=True)
+                    if modo_mapa == 'geojson':
+                        # Todas as rotas numa única camada GeoJSON, com o estilo de cada trecho nas propriedades
+                        folium.GeoJson(
+                            _rotas_geojson(
+                                rotas_para_mostrar, coord_origem, coord_destino,
+                                nome_origem, nome_destino, aero_coords_cache, cores_rotas
+                            ),
+                            name="Rotas",
+                            style_function=_estilo_feature_rota,
+                            tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+                        ).add_to(m)
+                    else:
+                        # Adicionar cada rota (AntPath animado por trecho)
+                        for idx, voo in enumerate(rotas_para_mostrar.iter_rows(named=True)):
                     
-                    # Coordenadas
-                    coord_aeroporto_origem = get_aerodromo_coord(voo['icao_aeroporto_origem'], aero_coords_cache)
-                    coord_aeroporto_destino = get_aerodromo_coord(voo['icao_aeroporto_destino'], aero_coords_cache)
+                            # Coordenadas
+                            coord_aeroporto_origem = get_aerodromo_coord(voo['icao_aeroporto_origem'], aero_coords_cache)
+                            coord_aeroporto_destino = get_aerodromo_coord(voo['icao_aeroporto_destino'], aero_coords_cache)
                     
-                    if not (coord_aeroporto_origem[0] and coord_aeroporto_destino[0]):
-                        continue
+                            if not (coord_aeroporto_origem[0] and coord_aeroporto_destino[0]):
+                                continue
 
-                    # Configurações especiais para rota principal (idx == 0)
-                    is_rota_principal = idx == 0
+                            # Configurações especiais para rota principal (idx == 0)
+                            is_rota_principal = idx == 0
                     
-                    # Cor e opacidade baseadas na posição da rota
-                    if is_rota_principal:
-                        # Rota principal: dourada/laranja para destaque
-                        cor = '#FF6B35'  # Laranja vibrante para destaque
-                        opacidade = 1.0
-                        peso = 6  # Mais grosso
+                            # Cor e opacidade baseadas na posição da rota
+                            if is_rota_principal:
+                                # Rota principal: dourada/laranja para destaque
+                                cor = '#FF6B35'  # Laranja vibrante para destaque
+                                opacidade = 1.0
+                                peso = 6  # Mais grosso
                         
-                        # Animação especial para rota principal
-                        delay_aereo = 400  # Mais rápido para chamar atenção
-                        dash_array_aereo = [15, 30]  # Tracejado mais proeminente
+                                # Animação especial para rota principal
+                                delay_aereo = 400  # Mais rápido para chamar atenção
+                                dash_array_aereo = [15, 30]  # Tracejado mais proeminente
                         
-                        # Terrestre da rota principal também destacado
-                        cor_terrestre = '#E55100'  # Laranja escuro
-                        peso_terrestre = 5
-                        opacidade_terrestre = 1.0
-                        delay_terrestre = 1000  # Terrestre um pouco mais rápido para principal
-                        dash_array_terrestre = [10, 20]
-                    else:
-                        # Rotas secundárias: cores normais
-                        cor = cores_rotas[idx % len(cores_rotas)]
-                        opacidade = 0.7
-                        peso = 3
+                                # Terrestre da rota principal também destacado
+                                cor_terrestre = '#E55100'  # Laranja escuro
+                                peso_terrestre = 5
+                                opacidade_terrestre = 1.0
+                                delay_terrestre = 1000  # Terrestre um pouco mais rápido para principal
+                                dash_array_terrestre = [10, 20]
+                            else:
+                                # Rotas secundárias: cores normais
+                                cor = cores_rotas[idx % len(cores_rotas)]
+                                opacidade = 0.7
+                                peso = 3
                         
-                        # Animação normal para rotas secundárias
-                        delay_aereo = 600
-                        dash_array_aereo = [12, 25]
+                                # Animação normal para rotas secundárias
+                                delay_aereo = 600
+                                dash_array_aereo = [12, 25]
                         
-                        # Terrestre das rotas secundárias
-                        cor_terrestre = '#3498db' if idx == 1 else '#2980b9'
-                        peso_terrestre = 2
-                        opacidade_terrestre = 0.6
-                        delay_terrestre = 1500
-                        dash_array_terrestre = [8, 15]
+                                # Terrestre das rotas secundárias
+                                cor_terrestre = '#3498db' if idx == 1 else '#2980b9'
+                                peso_terrestre = 2
+                                opacidade_terrestre = 0.6
+                                delay_terrestre = 1500
+                                dash_array_terrestre = [8, 15]
                     
-                    # Grupo para esta rota
-                    route_group = folium.FeatureGroup(name=f"Rota {idx+1}")
+                            # Grupo para esta rota
+                            route_group = folium.FeatureGroup(name=f"Rota {idx+1}")
                     
-                    # Trajeto terrestre de embarque com animação
-                    AntPath(
-                        locations=[coord_origem, coord_aeroporto_origem],
-                        color=cor_terrestre,
-                        weight=peso_terrestre,
-                        opacity=opacidade_terrestre,
-                        delay=delay_terrestre,
-                        dash_array=dash_array_terrestre,
-                        pulse_color=cor_terrestre,
-                        popup=f"""
-                        <b>Trajeto Terrestre - Embarque</b><br>
-                        Origem: {nome_origem}<br>
-                        Aeroporto: {voo['icao_aeroporto_origem']}<br>
-                        Tempo: {format_time(voo['tempo_terrestre_embarque'])}<br>
-                        Custo: {format_currency(voo['custo_terrestre_embarque'])}
-                        """,
-                        tooltip=f"🚗 {nome_origem} → {voo['icao_aeroporto_origem']} | {format_time(voo['tempo_terrestre_embarque'])} | {format_currency(voo['custo_terrestre_embarque'])}"
-                    ).add_to(route_group)
+                            # Trajeto terrestre de embarque com animação
+                            AntPath(
+                                locations=[coord_origem, coord_aeroporto_origem],
+                                color=cor_terrestre,
+                                weight=peso_terrestre,
+                                opacity=opacidade_terrestre,
+                                delay=delay_terrestre,
+                                dash_array=dash_array_terrestre,
+                                pulse_color=cor_terrestre,
+                                popup=f"""
+                                <b>Trajeto Terrestre - Embarque</b><br>
+                                Origem: {nome_origem}<br>
+                                Aeroporto: {voo['icao_aeroporto_origem']}<br>
+                                Tempo: {format_time(voo['tempo_terrestre_embarque'])}<br>
+                                Custo: {format_currency(voo['custo_terrestre_embarque'])}
+                                """,
+                                tooltip=f"🚗 {nome_origem} → {voo['icao_aeroporto_origem']} | {format_time(voo['tempo_terrestre_embarque'])} | {format_currency(voo['custo_terrestre_embarque'])}"
+                            ).add_to(route_group)
                     
-                    # Processar trajeto aéreo
-                    aeroportos_trajeto = voo['trajeto_aereo'].split(' -> ')
+                            # Processar trajeto aéreo
+                            aeroportos_trajeto = voo['trajeto'].split(' -> ')
                     
-                    if len(aeroportos_trajeto) > 2:
-                        # Múltiplas conexões
-                        coords_aeroportos = []
-                        for icao in aeroportos_trajeto:
-                            coord = get_aerodromo_coord(icao.strip(), aero_coords_cache)
-                            if coord[0]:
-                                coords_aeroportos.append(coord)
+                            if len(aeroportos_trajeto) > 2:
+                                # Múltiplas conexões
+                                coords_aeroportos = []
+                                for icao in aeroportos_trajeto:
+                                    coord = get_aerodromo_coord(icao.strip(), aero_coords_cache)
+                                    if coord[0]:
+                                        coords_aeroportos.append(coord)
                         
-                        # Desenhar conexões em zigzag
-                        if len(coords_aeroportos) >= 2:
-                            for j in range(len(coords_aeroportos) - 1):
-                                # Curva suave entre aeroportos
-                                pontos_curva = create_curved_line(
-                                    coords_aeroportos[j], 
-                                    coords_aeroportos[j+1],
-                                    weight=0.15
-                                )
+                                # Desenhar conexões em zigzag
+                                if len(coords_aeroportos) >= 2:
+                                    for j in range(len(coords_aeroportos) - 1):
+                                        # Curva suave entre aeroportos
+                                        pontos_curva = geometria.curva(
+                                            coords_aeroportos[j], 
+                                            coords_aeroportos[j+1],
+                                            weight=0.15
+                                        )
                                                             
-                                                                # Linha aérea com animação fluida AntPath
+                                                                        # Linha aérea com animação fluida AntPath
+                                        AntPath(
+                                            locations=pontos_curva,
+                                            color=cor,
+                                            weight=peso,
+                                            opacity=opacidade,
+                                            delay=delay_aereo,
+                                            dash_array=dash_array_aereo,
+                                            pulse_color=cor,
+                                            popup=f"""
+                                            <b>Trajeto Aéreo - Segmento {j+1}</b><br>
+                                            Trecho: {aeroportos_trajeto[j]} → {aeroportos_trajeto[j+1]}<br>
+                                            Rota Completa: {voo['trajeto']}<br>
+                                            Tempo Total: {format_time(voo['tempo_aereo'])}<br>
+                                            Custo Total: {format_currency(voo['custo_aereo'])}<br>
+                                            Conexões: {voo['conexoes']}
+                                            """,
+                                            tooltip=f"✈️ {aeroportos_trajeto[j]} → {aeroportos_trajeto[j+1]} | Tempo Total: {format_time(voo['tempo_aereo'])} | Custo Total: {format_currency(voo['custo_aereo'])}"
+                                        ).add_to(route_group)
+                            else:
+                                # Voo direto
+                                pontos_curva = geometria.curva(
+                                    coord_aeroporto_origem,
+                                    coord_aeroporto_destino,
+                                    weight=0.2
+                                )
+                                            
+                                # Voo direto com animação fluida AntPath
                                 AntPath(
                                     locations=pontos_curva,
                                     color=cor,
@@ -2335,133 +2677,96 @@ if origem_selecionada and destino_selecionado:
                                     dash_array=dash_array_aereo,
                                     pulse_color=cor,
                                     popup=f"""
-                                    <b>Trajeto Aéreo - Segmento {j+1}</b><br>
-                                    Trecho: {aeroportos_trajeto[j]} → {aeroportos_trajeto[j+1]}<br>
-                                    Rota Completa: {voo['trajeto_aereo']}<br>
-                                    Tempo Total: {format_time(voo['tempo_aereo'])}<br>
-                                    Custo Total: {format_currency(voo['custo_aereo'])}<br>
-                                    Conexões: {voo['num_conexoes']}
+                                    <b>Voo Direto</b><br>
+                                    Trecho: {voo['icao_aeroporto_origem']} → {voo['icao_aeroporto_destino']}<br>
+                                    Rota: {voo['trajeto']}<br>
+                                    Tempo: {format_time(voo['tempo_aereo'])}<br>
+                                    Custo: {format_currency(voo['custo_aereo'])}
                                     """,
-                                    tooltip=f"✈️ {aeroportos_trajeto[j]} → {aeroportos_trajeto[j+1]} | Tempo Total: {format_time(voo['tempo_aereo'])} | Custo Total: {format_currency(voo['custo_aereo'])}"
+                                    tooltip=f"✈️ {voo['icao_aeroporto_origem']} → {voo['icao_aeroporto_destino']} | {format_time(voo['tempo_aereo'])} | {format_currency(voo['custo_aereo'])}"
                                 ).add_to(route_group)
-                    else:
-                        # Voo direto
-                        pontos_curva = create_curved_line(
-                            coord_aeroporto_origem,
-                            coord_aeroporto_destino,
-                            weight=0.2
-                        )
-                                            
-                        # Voo direto com animação fluida AntPath
-                        AntPath(
-                            locations=pontos_curva,
-                            color=cor,
-                            weight=peso,
-                            opacity=opacidade,
-                            delay=delay_aereo,
-                            dash_array=dash_array_aereo,
-                            pulse_color=cor,
-                            popup=f"""
-                            <b>Voo Direto</b><br>
-                            Trecho: {voo['icao_aeroporto_origem']} → {voo['icao_aeroporto_destino']}<br>
-                            Rota: {voo['trajeto_aereo']}<br>
-                            Tempo: {format_time(voo['tempo_aereo'])}<br>
-                            Custo: {format_currency(voo['custo_aereo'])}
-                            """,
-                            tooltip=f"✈️ {voo['icao_aeroporto_origem']} → {voo['icao_aeroporto_destino']} | {format_time(voo['tempo_aereo'])} | {format_currency(voo['custo_aereo'])}"
-                        ).add_to(route_group)
                     
-                    # Trajeto terrestre de desembarque com animação
-                    AntPath(
-                        locations=[coord_aeroporto_destino, coord_destino],
-                        color=cor_terrestre,
-                        weight=peso_terrestre,
-                        opacity=opacidade_terrestre,
-                        delay=delay_terrestre,
-                        dash_array=dash_array_terrestre,
-                        pulse_color=cor_terrestre,
-                                            popup=f"""
-                        <b>Trajeto Terrestre - Desembarque</b><br>
-                        Aeroporto: {voo['icao_aeroporto_destino']}<br>
-                        Destino: {nome_destino}<br>
-                        Tempo: {format_time(voo['tempo_terrestre_desembarque'])}<br>
-                        Custo: {format_currency(voo['custo_terrestre_desembarque'])}
-                        """,
-                        tooltip=f"🚗 {voo['icao_aeroporto_destino']} → {nome_destino} | {format_time(voo['tempo_terrestre_desembarque'])} | {format_currency(voo['custo_terrestre_desembarque'])}"
-                    ).add_to(route_group)
+                            # Trajeto terrestre de desembarque com animação
+                            AntPath(
+                                locations=[coord_aeroporto_destino, coord_destino],
+                                color=cor_terrestre,
+                                weight=peso_terrestre,
+                                opacity=opacidade_terrestre,
+                                delay=delay_terrestre,
+                                dash_array=dash_array_terrestre,
+                                pulse_color=cor_terrestre,
+                                                    popup=f"""
+                                <b>Trajeto Terrestre - Desembarque</b><br>
+                                Aeroporto: {voo['icao_aeroporto_destino']}<br>
+                                Destino: {nome_destino}<br>
+                                Tempo: {format_time(voo['tempo_terrestre_desembarque'])}<br>
+                                Custo: {format_currency(voo['custo_terrestre_desembarque'])}
+                                """,
+                                tooltip=f"🚗 {voo['icao_aeroporto_destino']} → {nome_destino} | {format_time(voo['tempo_terrestre_desembarque'])} | {format_currency(voo['custo_terrestre_desembarque'])}"
+                            ).add_to(route_group)
                     
-                    # Adicionar grupo ao mapa
-                    route_group.add_to(m)
+                            # Adicionar grupo ao mapa
+                            route_group.add_to(m)
             
-            # Adicionar marcadores principais
-            folium.Marker(
-                coord_origem,
-                popup=f"<b>{nome_origem}</b><br>Município de Origem",
-                tooltip=nome_origem,
-                icon=folium.Icon(color='green', icon='home', prefix='fa')
-            ).add_to(m)
+                # Adicionar marcadores principais
+                folium.Marker(
+                    coord_origem,
+                    popup=f"<b>{nome_origem}</b><br>Município de Origem",
+                    tooltip=nome_origem,
+                    icon=folium.Icon(color='green', icon='home', prefix='fa')
+                ).add_to(m)
             
-            folium.Marker(
-                coord_destino,
-                popup=f"<b>{nome_destino}</b><br>Município de Destino",
-                tooltip=nome_destino,
-                icon=folium.Icon(color='red', icon='flag-checkered', prefix='fa')
-            ).add_to(m)
+                folium.Marker(
+                    coord_destino,
+                    popup=f"<b>{nome_destino}</b><br>Município de Destino",
+                    tooltip=nome_destino,
+                    icon=folium.Icon(color='red', icon='flag-checkered', prefix='fa')
+                ).add_to(m)
             
-            # Adicionar marcadores de aeroportos
-            aeroportos_unicos = set()
-            for i in range(voos_comerciais.height):
-                if not mostrar_todas_rotas and i != rotas_para_mostrar[0]['index']:
-                    continue
-                    
-                voo = voos_comerciais.row(i, named=True)
-                aeroportos_unicos.add(voo['icao_aeroporto_origem'])
-                aeroportos_unicos.add(voo['icao_aeroporto_destino'])
-                
+                # Adicionar marcadores de aeroportos
+                aeroportos_unicos = set(rotas_para_mostrar['icao_aeroporto_origem'].to_list())
+                aeroportos_unicos.update(rotas_para_mostrar['icao_aeroporto_destino'].to_list())
                 # Aeroportos de conexão
-                for icao in voo['trajeto_aereo'].split(' -> '):
-                    aeroportos_unicos.add(icao.strip())
+                aeroportos_unicos.update(
+                    rotas_para_mostrar['trajeto'].str.split(' -> ').explode().str.strip_chars().to_list()
+                )
             
-            for icao in aeroportos_unicos:
-                coord = get_aerodromo_coord(icao, aero_coords_cache)
-                if coord[0]:
-                    folium.Marker(
-                        coord,
-                        popup=f"<b>Aeroporto {icao}</b>",
-                        tooltip=icao,
-                        icon=folium.Icon(color='blue', icon='plane', prefix='fa')
-                    ).add_to(m)
+                # No modo GeoJSON os aeroportos ficam numa única camada agrupada
+                camada_aeroportos = MarkerCluster(name="Aeroportos").add_to(m) if modo_mapa == 'geojson' else m
+                for icao in aeroportos_unicos:
+                    coord = get_aerodromo_coord(icao, aero_coords_cache)
+                    if coord[0]:
+                        folium.Marker(
+                            coord,
+                            popup=f"<b>Aeroporto {icao}</b>",
+                            tooltip=icao,
+                            icon=folium.Icon(color='blue', icon='plane', prefix='fa')
+                        ).add_to(camada_aeroportos)
             
-            # Adicionar controle de camadas se mostrar todas as rotas
-            if mostrar_todas_rotas and len(rotas_para_mostrar) > 1:
-                folium.LayerControl().add_to(m)
+                # Adicionar controle de camadas se mostrar todas as rotas
+                if mostrar_todas_rotas and rotas_para_mostrar.height > 1:
+                    folium.LayerControl().add_to(m)
             
-            # Exibir mapa
-            st_folium(m, height=600, width=None, returned_objects=[])
+                _anexar_medicao_mapa(m, modo_mapa)
+                medicao.registrar("construir mapa Folium", inicio_mapa, linhas=rotas_para_mostrar.height)
+                with medicao.span("serializar mapa (HTML)"):
+                    mapa_html = _map_cache_put(chave_mapa, m)
+                logger.info(
+                    f"MAPA: modo={modo_mapa}, {rotas_para_mostrar.height} rotas, "
+                    f"{len(mapa_html.encode('utf-8')) / 1024:.0f}KB em {(time.perf_counter() - inicio_mapa) * 1000:.0f}ms"
+                )
+
+            if mapa_html is not None:
+                # Exibir mapa
+                with medicao.span("enviar mapa"):
+                    components.html(mapa_html, height=600)
             
         # Tabela comparativa de rotas (sempre exibida quando há múltiplas rotas)
-        if len(rotas) > 1:
+        if rotas.height > 1:
             st.markdown("---")
             st.markdown("### Comparação de Rotas")
             
-            dados_tabela = []
-            for i, rota in enumerate(rotas):
-                linha_dados = {
-                    'Rota': f"Rota {i+1}",
-                    'Trajeto': rota['trajeto'],
-                    'Tempo Total': format_time(rota['tempo_total']),
-                    'Custo Total (R$)': format_currency_for_table(rota['custo_total']),
-                    'Uso (%)': f"{format_number_br(rota['percentual'], 1)}%",
-                    'Conexões': rota['conexoes']
-                }
-                
-                # Só adicionar coluna de viagens se não for centralidades
-                if pagina_atual != "centralidades":
-                    linha_dados['Viagens'] = rota['viagens']
-                
-                dados_tabela.append(linha_dados)
-            
-            df_tabela = pl.DataFrame(dados_tabela)
+            df_tabela = tabela_comparativa_rotas(rotas, com_viagens=pagina_atual != "centralidades")
             
             # Configuração das colunas dinâmica
             column_config = {
@@ -2494,19 +2799,13 @@ if origem_selecionada and destino_selecionado:
             st.markdown("---")
             
         # Insights inteligentes sobre as rotas
-        if len(rotas) > 1:
+        if rotas.height > 1:
             st.markdown("### Insights da Análise")
             
             # Calcular insights
-            rota_mais_rapida = min(rotas, key=lambda x: x['tempo_total'])
-            rota_mais_barata = min(rotas, key=lambda x: x['custo_total'])
-            rota_mais_popular = max(rotas, key=lambda x: x['percentual'])
-            
-            # Estatísticas comparativas
-            tempo_min = min(r['tempo_total'] for r in rotas)
-            tempo_max = max(r['tempo_total'] for r in rotas)
-            custo_min = min(r['custo_total'] for r in rotas)
-            custo_max = max(r['custo_total'] for r in rotas)
+            rota_mais_rapida = rotas.filter(pl.col('mais_rapida')).row(0, named=True)
+            rota_mais_barata = rotas.filter(pl.col('mais_barata')).row(0, named=True)
+            rota_mais_popular = rotas.filter(pl.col('mais_popular')).row(0, named=True)
             
             # Criar colunas para insights
             col_insight1, col_insight2, col_insight3 = st.columns(3)
@@ -2525,7 +2824,7 @@ if origem_selecionada and destino_selecionado:
                     <p style="margin: 0.5rem 0 0 0; font-size: 1.1rem; font-weight: bold;">
                         {format_time(rota_mais_rapida['tempo_total'])}
                     </p>
-                    <small>Rota {rotas.index(rota_mais_rapida) + 1}</small>
+                    <small>Rota {rota_mais_rapida['rota']}</small>
                 </div>
                 """, unsafe_allow_html=True)
             
@@ -2543,7 +2842,7 @@ if origem_selecionada and destino_selecionado:
                     <p style="margin: 0.5rem 0 0 0; font-size: 1.1rem; font-weight: bold;">
                         {format_currency(rota_mais_barata['custo_total'])}
                     </p>
-                    <small>Rota {rotas.index(rota_mais_barata) + 1}</small>
+                    <small>Rota {rota_mais_barata['rota']}</small>
                 </div>
                 """, unsafe_allow_html=True)
             
@@ -2561,14 +2860,14 @@ if origem_selecionada and destino_selecionado:
                     <p style="margin: 0.5rem 0 0 0; font-size: 1.1rem; font-weight: bold;">
                         {format_number_br(rota_mais_popular['percentual'], 1)}%
                     </p>
-                    <small>Rota {rotas.index(rota_mais_popular) + 1}</small>
+                    <small>Rota {rota_mais_popular['rota']}</small>
                 </div>
                 """, unsafe_allow_html=True)
             
             
         
         # Gráfico de distribuição (sempre visível para múltiplas rotas)
-        if len(rotas) > 1:
+        if rotas.height > 1:
             st.markdown("---")
             
             st.markdown("### Distribuição de Uso das Rotas")
@@ -2580,27 +2879,27 @@ if origem_selecionada and destino_selecionado:
                                'Uso: %{percent}<br>' +
                                'Viagens: %{customdata}<br>' +
                                'Trajeto: %{text}<extra></extra>')
-                customdata_formatted = [format_number_br(r['viagens']) for r in rotas]
-                texto_central = f"Total<br>{format_number_br(sum(r['viagens'] for r in rotas))}<br>viagens"
+                customdata_formatted = [format_number_br(v) for v in rotas['viagens']]
+                texto_central = f"Total<br>{format_number_br(rotas['viagens'].sum())}<br>viagens"
             else:
                 hover_template = ('<b>%{label}</b><br>' +
                                'Uso: %{percent}<br>' +
                                'Fluxo: %{customdata}<br>' +
                                'Trajeto: %{text}<extra></extra>')
-                customdata_formatted = [format_number_br(r['viagens']) for r in rotas]
-                texto_central = f"Total<br>{format_number_br(sum(r['viagens'] for r in rotas))}<br>fluxo"
+                customdata_formatted = [format_number_br(v) for v in rotas['viagens']]
+                texto_central = f"Total<br>{format_number_br(rotas['viagens'].sum())}<br>fluxo"
             
             fig = go.Figure(data=[
                 go.Pie(
-                    labels=[f"Rota {i+1}" for i in range(len(rotas))],
-                    values=[r['percentual'] for r in rotas],
+                    labels=[f"Rota {n}" for n in rotas['rota']],
+                    values=rotas['percentual'].to_list(),
                     hole=.4,
-                    marker_colors=cores_rotas[:len(rotas)],
+                    marker_colors=cores_rotas[:rotas.height],
                     textinfo='label+percent',
                     textposition='inside',
                     hovertemplate=hover_template,
                     customdata=customdata_formatted,
-                    text=[r['trajeto'] for r in rotas]
+                    text=rotas['trajeto'].to_list()
                 )
             ])
             
@@ -2646,34 +2945,48 @@ else:
     if pagina_atual == "municipios":
         st.markdown("### 📈 Panorama Geral - Análise por Municípios")
         titulo_total = "Total de Municípios"
-        total_entidades = len(dados_municipios)
     elif pagina_atual == "utps":
         st.markdown("### 📈 Panorama Geral - Análise por UTPs")
         titulo_total = "Total de UTPs"
-        total_entidades = len(dados_utps['utp'].unique())
     else:
         st.markdown("### 📈 Panorama Geral - Análise por Centralidades")
         titulo_total = "Total de Centralidades"
-        total_entidades = centralidades_total_sql()
     
     # Estatísticas nacionais impressionantes
     col_stat1, col_stat2, col_stat3 = st.columns(3)
     
-    # Calcular pares únicos ao invés de rotas individuais
-    if pagina_atual == "utps":
-        # Para UTPs, contar pares únicos UTP_origem x UTP_destino
-        pares_comerciais = comerciais.select(['UTP_origem', 'UTP_destino']).unique().height
-        pares_executivos = executivos.select(['UTP_origem', 'UTP_destino']).unique().height if executivos.height > 0 else 0
+    stats_panorama = get_dashboard_stats(_db_state()['path'], pagina_atual)
+    if stats_panorama is not None:
+        # Linha pré-computada no build (dashboard_stats): tempo constante
+        total_entidades = stats_panorama['total_entidades']
+        pares_comerciais = stats_panorama['pares_comerciais']
+        pares_executivos = stats_panorama['pares_executivos']
+        total_viagens = stats_panorama['total_viagens']
+        total_rotas = stats_panorama['total_rotas']
     else:
-        # Para municípios e centralidades, contar pares únicos cod_mun_origem x cod_mun_destino
-        if pagina_atual == "centralidades":
-            _pwd = get_files_password()
-            c, e = centralidades_contar_pares_sql(_pwd)
-            pares_comerciais = c
-            pares_executivos = e
+        if pagina_atual in ("municipios", "utps"):
+            total_entidades = dicionario_entidades.total(tipo_entidade)
         else:
-            pares_comerciais = comerciais.select(['cod_mun_origem', 'cod_mun_destino']).unique().height
-            pares_executivos = executivos.select(['cod_mun_origem', 'cod_mun_destino']).unique().height if executivos.height > 0 else 0
+            total_entidades = centralidades_total_sql()
+        
+        # Calcular pares únicos ao invés de rotas individuais
+        if pagina_atual == "utps":
+            # Para UTPs, contar pares únicos UTP_origem x UTP_destino
+            pares_comerciais = comerciais.select(['UTP_origem', 'UTP_destino']).unique().height
+            pares_executivos = executivos.select(['UTP_origem', 'UTP_destino']).unique().height if executivos.height > 0 else 0
+        else:
+            # Para municípios e centralidades, contar pares únicos cod_mun_origem x cod_mun_destino
+            if pagina_atual == "centralidades":
+                _pwd = get_files_password()
+                c, e = centralidades_contar_pares_sql(_pwd)
+                pares_comerciais = c
+                pares_executivos = e
+            else:
+                pares_comerciais = comerciais.select(['cod_mun_origem', 'cod_mun_destino']).unique().height
+                pares_executivos = executivos.select(['cod_mun_origem', 'cod_mun_destino']).unique().height if executivos.height > 0 else 0
+        
+        # As tabelas carregadas têm só as chaves dos pares: viagens e rotas são somadas no DuckDB
+        total_viagens, total_rotas = get_totais_rotas(_db_state()['path'], pagina_atual)
     
     total_pares = pares_comerciais + pares_executivos
     percentual_comercial = (pares_comerciais / total_pares) * 100 if total_pares > 0 else 0
@@ -2725,11 +3038,18 @@ else:
                 st.metric("Pares Executivos", format_number_br(pares_executivos))
             
             with col3:
-                if 'viagens' in comerciais.columns and 'viagens' in executivos.columns:
-                    total_viagens = comerciais['viagens'].sum() + executivos['viagens'].sum()
+                if total_viagens is not None:
                     st.metric("Total de Viagens", format_number_br(int(total_viagens)))
                 else:
-                    st.metric("Rotas Totais", format_number_br(comerciais.height + executivos.height))
+                    st.metric("Rotas Totais", format_number_br(total_rotas))
+
+# Tempo de cada etapa desta execução: log JSONL e painel de admin
+finalizar_medicao(
+    medicao, pagina=pagina_atual, origem=origem_selecionada or None, destino=destino_selecionado or None
+)
+
+# Cursor DuckDB da execução volta ao pool para a próxima sessão
+release_duckdb_connection()
 
 # Limpeza final de memória para otimização contínua
 optimize_memory()
\ No newline at end of file
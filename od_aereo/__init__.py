@@ -0,0 +1 @@
+"""Módulos compartilhados do painel de rotas aéreas OD"""
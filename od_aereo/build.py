@@ -0,0 +1,675 @@
+"""Build do banco DuckDB do app: importação das fontes de Dados/, tabelas derivadas e criptografia"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+
+from od_aereo.crypto import encrypt_file_stream, key_fingerprint
+from od_aereo.entities import ENTITY_DICTIONARY_SQL, REGIOES_UF
+
+logger = logging.getLogger(__name__)
+
+DADOS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Dados')
+
+
+# Código IBGE normalizado para 6 dígitos (aceita códigos de 6 ou 7 dígitos na origem)
+_KEY_O6 = "CAST(SUBSTR(CAST(cod_mun_origem AS VARCHAR),1,6) AS INTEGER)"
+_KEY_D6 = "CAST(SUBSTR(CAST(cod_mun_destino AS VARCHAR),1,6) AS INTEGER)"
+
+
+def _has_municipio_keys(con, caminho: str) -> bool:
+    colunas = {
+        row[0] for row in con.execute("DESCRIBE SELECT * FROM read_parquet(?)", [caminho]).fetchall()
+    }
+    return {'cod_mun_origem', 'cod_mun_destino'} <= colunas
+
+
+# Modo cluster (--cluster): row groups menores + todas as tabelas de rotas ordenadas pela
+# chave origem/destino, para que os zone maps (min/max) do DuckDB descartem quase todos
+# os row groups numa consulta de um único par
+CLUSTER_ROW_GROUP_SIZE = 16384
+_ZONE_MAP_SAMPLE_PAIRS = 20
+# Só chaves numéricas: estatísticas de VARCHAR são prefixos truncados (e podem conter vírgulas)
+_STATS_MIN_MAX = re.compile(r'\[Min: ([^,\]]+), Max: ([^,\]]+)')
+_TIPOS_NUMERICOS = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT',
+                    'UINTEGER', 'UBIGINT', 'FLOAT', 'DOUBLE')
+
+
+def _connect_build_db(db_path: str, row_group_size: int = None):
+    if not row_group_size:
+        return duckdb.connect(db_path)
+    # O tamanho de row group só pode ser definido ao anexar o arquivo
+    con = duckdb.connect()
+    escaped = db_path.replace("'", "''")
+    con.execute(f"ATTACH '{escaped}' AS od_aereo (ROW_GROUP_SIZE {int(row_group_size)})")
+    con.execute("USE od_aereo")
+    return con
+
+
+def _od_key_columns(con, tabela: str) -> list:
+    colunas = {row[0] for row in con.execute(f"DESCRIBE {tabela}").fetchall()}
+    for chaves in (['o6', 'd6'], ['UTP_origem', 'UTP_destino'], ['mun_origem', 'mun_destino']):
+        if set(chaves) <= colunas:
+            return chaves
+    return []
+
+
+# Tabelas de rotas (comerciais, executivos) de cada nível de análise do app
+_NIVEIS_ROTAS = {
+    'municipios': ('por_municipio_voos_comerciais', 'por_municipio_voos_executivos'),
+    'utps': ('utp_voos_comerciais', 'utp_voos_executivos'),
+    'centralidades': ('mun_centralidade_voos_comerciais', 'mun_centralidade_voos_executivos'),
+}
+
+
+def _existing_tables(con) -> set:
+    return {row[0] for row in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+
+
+def _od_pairs_sql(con) -> str:
+    """UNION ALL (nivel, origem, destino, comercial, executivo) de todas as tabelas de rotas; '' se nenhuma"""
+    existentes = _existing_tables(con)
+    partes = []
+    for nivel, (comerciais, executivos) in _NIVEIS_ROTAS.items():
+        for tabela, comercial in ((comerciais, True), (executivos, False)):
+            if tabela not in existentes:
+                continue
+            chaves = _od_key_columns(con, tabela)
+            if len(chaves) != 2:
+                continue
+            partes.append(
+                f"SELECT '{nivel}' AS nivel, CAST({chaves[0]} AS INTEGER) AS origem, "
+                f"CAST({chaves[1]} AS INTEGER) AS destino, {comercial} AS comercial, "
+                f"{not comercial} AS executivo FROM {tabela}"
+            )
+    return ' UNION ALL '.join(partes)
+
+
+def _create_od_adjacency(con) -> None:
+    """od_adjacency: origem -> lista ordenada de destinos (+ flags comercial/executivo) por nível"""
+    pares_sql = _od_pairs_sql(con)
+    if not pares_sql:
+        return
+    con.execute("DROP TABLE IF EXISTS od_adjacency")
+    con.execute(f"""
+        CREATE TABLE od_adjacency AS
+        WITH pares AS (
+            SELECT nivel, origem, destino, bool_or(comercial) AS comercial, bool_or(executivo) AS executivo
+            FROM ({pares_sql})
+            GROUP BY nivel, origem, destino
+        )
+        SELECT
+          nivel,
+          origem,
+          list(destino ORDER BY destino) AS destinos,
+          list(comercial ORDER BY destino) AS comercial,
+          list(executivo ORDER BY destino) AS executivo
+        FROM pares
+        GROUP BY nivel, origem
+        ORDER BY nivel, origem
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_od_adjacency ON od_adjacency(nivel, origem)")
+
+
+# Coordenadas e UF por código de entidade de cada nível (UTPs: município sede)
+_ENTIDADES_COORD_SQL = """
+    SELECT 'municipios' AS nivel, CAST(SUBSTR(CAST(municipio AS VARCHAR),1,6) AS INTEGER) AS cod,
+           any_value(lat_utp) AS lat, any_value(long_utp) AS lon, any_value(uf) AS uf
+    FROM mun_utps GROUP BY ALL
+    UNION ALL
+    SELECT 'centralidades', CAST(SUBSTR(CAST(municipio AS VARCHAR),1,6) AS INTEGER),
+           any_value(lat_utp), any_value(long_utp), any_value(uf)
+    FROM mun_utps GROUP BY ALL
+    UNION ALL
+    SELECT 'utps', CAST(utp AS INTEGER), any_value(lat_utp), any_value(long_utp), any_value(uf)
+    FROM mun_utps WHERE sede GROUP BY ALL
+"""
+
+# Faixas de distância do cabeçalho do app: < 300 km curta, < 800 km média, demais longa
+_CATEGORIA_DISTANCIA_SQL = """
+    CASE WHEN distancia_km < 300 THEN 'Curta Distância'
+         WHEN distancia_km < 800 THEN 'Média Distância'
+         ELSE 'Longa Distância' END
+"""
+
+
+def _create_od_distancias(con) -> None:
+    """od_distancias: distância em linha reta, faixa e mesmo-estado de cada par OD das tabelas de rotas"""
+    pares_sql = _od_pairs_sql(con)
+    if not pares_sql or 'mun_utps' not in _existing_tables(con):
+        return
+    con.execute("DROP TABLE IF EXISTS od_distancias")
+    con.execute(f"""
+        CREATE TABLE od_distancias AS
+        WITH pares AS (SELECT DISTINCT nivel, origem, destino FROM ({pares_sql})),
+        coords AS ({_ENTIDADES_COORD_SQL}),
+        dist AS (
+            SELECT
+              p.nivel, p.origem, p.destino,
+              2 * 6371 * asin(sqrt(
+                pow(sin(radians(d.lat - o.lat) / 2), 2) +
+                cos(radians(o.lat)) * cos(radians(d.lat)) * pow(sin(radians(d.lon - o.lon) / 2), 2)
+              )) AS distancia_km,
+              o.uf AS uf_origem,
+              d.uf AS uf_destino
+            FROM pares p
+            JOIN coords o ON o.nivel = p.nivel AND o.cod = p.origem
+            JOIN coords d ON d.nivel = p.nivel AND d.cod = p.destino
+        )
+        SELECT
+          nivel, origem, destino, distancia_km,
+          {_CATEGORIA_DISTANCIA_SQL} AS categoria,
+          uf_origem = uf_destino AS mesmo_estado,
+          uf_origem, uf_destino
+        FROM dist
+        ORDER BY nivel, origem, destino
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_od_distancias ON od_distancias(nivel, origem, destino)")
+
+
+def _create_entity_dictionary(con) -> None:
+    """entity_dictionary: rótulo, UF, coordenadas, UTP e sede de cada município e UTP (lookup do app)"""
+    if 'mun_utps' not in _existing_tables(con):
+        return
+    con.execute("DROP TABLE IF EXISTS entity_dictionary")
+    con.execute(f"CREATE TABLE entity_dictionary AS {ENTITY_DICTIONARY_SQL}")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_entity_dictionary ON entity_dictionary(tipo, codigo)")
+
+
+# Tabelas de rotas com partições físicas por região da UF de origem ({tabela}_{regiao}).
+# Opcionais (--region-partitions): as partições são cópias ao lado da tabela completa, então as
+# rotas de centralidades ficam duas vezes no banco (e no .enc, no cache descriptografado e no
+# tempo de provisionamento); sem elas o app lê a tabela completa pelo índice (o6, d6)
+_TABELAS_PARTICIONADAS = ('mun_centralidade_voos_comerciais', 'mun_centralidade_voos_executivos')
+
+
+def _tamanho_tabela(con, tabela: str) -> tuple:
+    """(linhas, bytes aproximados pelos blocos ocupados) de uma tabela do banco"""
+    linhas = con.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    blocos = con.execute(
+        f"SELECT COUNT(DISTINCT block_id) FROM pragma_storage_info('{tabela}') WHERE block_id >= 0"
+    ).fetchone()[0]
+    tamanho_bloco = con.execute("SELECT block_size FROM pragma_database_size() LIMIT 1").fetchone()[0]
+    return linhas, blocos * int(tamanho_bloco)
+
+
+def _create_region_partitions(con, ativo: bool = False) -> None:
+    """Uma tabela por região com as linhas cuja origem é de UF da região, ordenada e indexada por (o6, d6).
+
+    Partições antigas são sempre descartadas; só são recriadas com `ativo` (e o tamanho é logado).
+    """
+    existentes = _existing_tables(con)
+    criadas = {}
+    for tabela in _TABELAS_PARTICIONADAS:
+        for regiao, ufs in REGIOES_UF.items():
+            particao = f"{tabela}_{regiao}"
+            con.execute(f"DROP TABLE IF EXISTS {particao}")
+            if not ativo:
+                continue
+            if 'mun_utps' not in existentes or tabela not in existentes or _od_key_columns(con, tabela) != ['o6', 'd6']:
+                continue
+            con.execute(f"""
+                CREATE TABLE {particao} AS
+                SELECT * FROM {tabela}
+                WHERE o6 IN (
+                    SELECT CAST(SUBSTR(CAST(municipio AS VARCHAR),1,6) AS INTEGER)
+                    FROM mun_utps WHERE uf IN ({', '.join('?' * len(ufs))})
+                )
+                ORDER BY o6, d6
+            """, list(ufs))
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{particao}_par ON {particao}(o6, d6)")
+            criadas.setdefault(tabela, []).append(particao)
+    if not criadas:
+        return
+    # Tamanho em disco só é conhecido depois de gravar os blocos
+    con.execute("CHECKPOINT")
+    for tabela, particoes in criadas.items():
+        total_linhas, total_bytes = 0, 0
+        for particao in particoes:
+            linhas, tamanho = _tamanho_tabela(con, particao)
+            total_linhas += linhas
+            total_bytes += tamanho
+            logger.info(f'    {particao}: {linhas} linhas, ~{tamanho / 1024 / 1024:.1f}MB')
+        linhas, tamanho = _tamanho_tabela(con, tabela)
+        logger.info(
+            f'    {tabela}: partições somam {total_linhas} linhas e ~{total_bytes / 1024 / 1024:.1f}MB '
+            f'além dos ~{tamanho / 1024 / 1024:.1f}MB da tabela completa'
+        )
+
+
+# Contagem de entidades exibida no panorama de cada nível
+_ENTIDADES_SQL = {
+    'municipios': ('mun_utps', "SELECT COUNT(*) FROM mun_utps"),
+    'utps': ('mun_utps', "SELECT COUNT(DISTINCT utp) FROM mun_utps"),
+    'centralidades': ('centralidades', "SELECT COUNT(*) FROM centralidades"),
+}
+
+
+def _create_dashboard_stats(con) -> None:
+    """dashboard_stats: uma linha por nível com os números do panorama inicial do app"""
+    existentes = _existing_tables(con)
+    linhas = []
+    for nivel, (comerciais, executivos) in _NIVEIS_ROTAS.items():
+        if comerciais not in existentes:
+            continue
+        pares = {}
+        rotas = {}
+        viagens = {}
+        for tabela in (comerciais, executivos):
+            if tabela not in existentes:
+                pares[tabela], rotas[tabela], viagens[tabela] = 0, 0, 0.0
+                continue
+            chaves = _od_key_columns(con, tabela)
+            if chaves:
+                pares[tabela] = con.execute(
+                    f"SELECT COUNT(*) FROM (SELECT DISTINCT {', '.join(chaves)} FROM {tabela})"
+                ).fetchone()[0]
+            else:
+                logger.warning(f'AVISO: {tabela} sem colunas de chave origem/destino - pares contados como 0')
+                pares[tabela] = 0
+            rotas[tabela] = con.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+            colunas = {row[0] for row in con.execute(f"DESCRIBE {tabela}").fetchall()}
+            viagens[tabela] = (
+                con.execute(f"SELECT COALESCE(SUM(viagens), 0) FROM {tabela}").fetchone()[0]
+                if 'viagens' in colunas else None
+            )
+        tabela_entidades, sql_entidades = _ENTIDADES_SQL[nivel]
+        total_entidades = con.execute(sql_entidades).fetchone()[0] if tabela_entidades in existentes else 0
+        total_pares = pares[comerciais] + pares[executivos]
+        total_viagens = (
+            float(viagens[comerciais] + viagens[executivos])
+            if viagens[comerciais] is not None and viagens[executivos] is not None else None
+        )
+        linhas.append((
+            nivel,
+            total_entidades,
+            pares[comerciais],
+            pares[executivos],
+            total_pares,
+            (pares[comerciais] / total_pares) * 100 if total_pares > 0 else 0.0,
+            total_viagens,
+            rotas[comerciais] + rotas[executivos],
+        ))
+    con.execute("DROP TABLE IF EXISTS dashboard_stats")
+    con.execute("""
+        CREATE TABLE dashboard_stats (
+          nivel VARCHAR PRIMARY KEY,
+          total_entidades BIGINT,
+          pares_comerciais BIGINT,
+          pares_executivos BIGINT,
+          total_pares BIGINT,
+          percentual_comercial DOUBLE,
+          total_viagens DOUBLE,
+          total_rotas BIGINT
+        )
+    """)
+    if linhas:
+        con.executemany("INSERT INTO dashboard_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?)", linhas)
+
+
+def _zone_map_ranges(con, tabela: str, chaves: list) -> list:
+    """[(min, max) por chave] de cada row group, lidos de pragma_storage_info"""
+    grupos = {}
+    rows = con.execute(
+        f"SELECT row_group_id, column_name, stats FROM pragma_storage_info('{tabela}') "
+        "WHERE segment_type <> 'VALIDITY'"
+    ).fetchall()
+    for row_group_id, coluna, stats in rows:
+        if coluna not in chaves:
+            continue
+        match = _STATS_MIN_MAX.search(stats or '')
+        if not match:
+            continue
+        try:
+            minimo, maximo = float(match.group(1)), float(match.group(2))
+        except ValueError:
+            continue
+        atual = grupos.setdefault(row_group_id, {}).get(coluna)
+        if atual:
+            minimo, maximo = min(minimo, atual[0]), max(maximo, atual[1])
+        grupos[row_group_id][coluna] = (minimo, maximo)
+    return [tuple(g.get(c, (float('-inf'), float('inf'))) for c in chaves) for g in grupos.values()]
+
+
+def _row_groups_lidos(ranges: list, par: tuple) -> int:
+    # Row group só é lido se todas as chaves do par caem dentro do seu min/max
+    return sum(
+        all(lo <= valor <= hi for valor, (lo, hi) in zip(par, faixas))
+        for faixas in ranges
+    )
+
+
+def _zone_map_report(con, clusterizadas: list, row_group_size: int, work_dir: str) -> None:
+    """Compara row groups lidos por consulta de par: ordem do arquivo (antes) vs clusterizado (depois)"""
+    baseline_path = os.path.join(work_dir, 'zone_map_baseline.duckdb')
+    baseline_db = baseline_path.replace("'", "''")
+    con.execute(f"ATTACH '{baseline_db}' AS zm_baseline (ROW_GROUP_SIZE {int(row_group_size)})")
+    try:
+        logger.info('Relatório de zone maps (row groups lidos por consulta de par):')
+        for tabela, caminho, chaves in clusterizadas:
+            tipos = {row[0]: row[1] for row in con.execute(f"DESCRIBE {tabela}").fetchall()}
+            nao_numericas = [c for c in chaves if not str(tipos.get(c, '')).upper().startswith(_TIPOS_NUMERICOS)]
+            if nao_numericas:
+                logger.info(f'  {tabela}: ignorada (chaves não numéricas: {", ".join(nao_numericas)})')
+                continue
+            if chaves == ['o6', 'd6']:
+                projecao = f"{_KEY_O6} AS o6, {_KEY_D6} AS d6"
+            else:
+                projecao = ', '.join(chaves)
+            con.execute(f"CREATE OR REPLACE TABLE zm_baseline.antes AS SELECT {projecao} FROM read_parquet(?)", [caminho])
+            colunas = ', '.join(chaves)
+            pares = con.execute(
+                f"SELECT {colunas} FROM (SELECT DISTINCT {colunas} FROM {tabela}) "
+                f"ORDER BY hash({colunas}) LIMIT {_ZONE_MAP_SAMPLE_PAIRS}"
+            ).fetchall()
+            if not pares:
+                continue
+            antes = _zone_map_ranges(con, 'zm_baseline.antes', chaves)
+            depois = _zone_map_ranges(con, tabela, chaves)
+            if not antes or not depois:
+                logger.info(f'  {tabela}: ignorada (sem estatísticas min/max legíveis para {colunas})')
+                continue
+            media_antes = sum(_row_groups_lidos(antes, par) for par in pares) / len(pares)
+            media_depois = sum(_row_groups_lidos(depois, par) for par in pares) / len(pares)
+            logger.info(
+                f'  {tabela} ({colunas}): {len(pares)} pares | '
+                f'antes {media_antes:.1f}/{len(antes)} row groups -> '
+                f'depois {media_depois:.1f}/{len(depois)} row groups'
+            )
+    finally:
+        con.execute("DETACH zm_baseline")
+        # No build incremental o diretório de trabalho é persistente
+        for caminho in (baseline_path, f"{baseline_path}.wal"):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+
+# Fontes do build: (tabela, caminho relativo a Dados, formato)
+_FONTES_ENTRADA = [
+    ('mun_utps', os.path.join('Entrada', 'mun_UTPs.csv'), 'csv'),
+    ('centralidades', os.path.join('Entrada', 'centralidades.csv'), 'csv'),
+    ('aeroportos', os.path.join('Entrada', 'aeroportos.parquet'), 'parquet'),
+]
+_PASTAS_RESULTADOS = [
+    (
+        'Pares OD - Por Municipio - Matriz Infra S.A. - 2019',
+        {
+            'Voos Comerciais.parquet': 'por_municipio_voos_comerciais',
+            'Voos Executivos.parquet': 'por_municipio_voos_executivos',
+            'classificacao_pares.parquet': 'por_municipio_classificacao',
+        },
+    ),
+    (
+        'Pares OD - Agregação UTP - Matriz Infra S.A. - 2019',
+        {
+            'Voos Comerciais.parquet': 'utp_voos_comerciais',
+            'Voos Executivos.parquet': 'utp_voos_executivos',
+            'classificacao_pares.parquet': 'utp_classificacao',
+        },
+    ),
+    (
+        'Pares OD - Municipio x Centralidade',
+        {
+            'Voos Comerciais.parquet': 'mun_centralidade_voos_comerciais',
+            'Voos Executivos.parquet': 'mun_centralidade_voos_executivos',
+            'classificacao_pares.parquet': 'mun_centralidade_classificacao',
+        },
+    ),
+]
+_MANIFEST_VERSION = 1
+
+
+def _fontes(dados_base: str) -> list:
+    """[(tabela, caminho absoluto, formato)] de todas as entradas conhecidas, existindo ou não"""
+    fontes = [(tabela, os.path.join(dados_base, rel), formato) for tabela, rel, formato in _FONTES_ENTRADA]
+    for pasta, nomes in _PASTAS_RESULTADOS:
+        for arquivo, tabela in nomes.items():
+            fontes.append((tabela, os.path.join(dados_base, 'Resultados', pasta, arquivo), 'parquet'))
+    return fontes
+
+
+def _sha256_arquivo(caminho: str) -> str:
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _read_manifest(manifest_path: str) -> dict:
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('versao') == _MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _write_manifest(manifest_path: str, manifest: dict) -> None:
+    tmp = f"{manifest_path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, manifest_path)
+
+
+def _build_cursor(con, row_group_size: int = None):
+    # Cursores não herdam o USE do banco anexado (modo com row group customizado)
+    cursor = con.cursor()
+    if row_group_size:
+        cursor.execute("USE od_aereo")
+    return cursor
+
+
+def _import_table(con, tabela: str, caminho: str, formato: str, cluster: bool):
+    """Importa uma fonte para sua tabela (com chaves o6/d6 e índices); devolve a entrada de cluster ou None"""
+    con.execute(f"DROP TABLE IF EXISTS {tabela}")
+    if formato == 'csv':
+        con.execute(f"CREATE TABLE {tabela} AS SELECT * FROM read_csv_auto(?, header=true)", [caminho])
+        if tabela == 'centralidades':
+            # Criar índices para otimização de consultas por UF e município
+            con.execute("CREATE INDEX IF NOT EXISTS idx_centralidades_uf ON centralidades(uf)")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_centralidades_municipio ON centralidades(municipio)")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_centralidades_utp ON centralidades(utp)")
+        return None
+    if tabela == 'aeroportos':
+        con.execute("CREATE TABLE aeroportos AS SELECT * FROM read_parquet(?)", [caminho])
+        return None
+
+    if _has_municipio_keys(con, caminho):
+        # Chaves normalizadas de 6 dígitos (o6, d6) materializadas como INTEGER e
+        # tabela ordenada por elas: filtros viram sondagem de índice + zone maps,
+        # sem SUBSTR(CAST(...)) sobre a tabela inteira
+        con.execute(f"""
+            CREATE TABLE {tabela} AS
+            SELECT *,
+              {_KEY_O6} AS o6,
+              {_KEY_D6} AS d6
+            FROM read_parquet(?)
+            ORDER BY o6, d6
+        """, [caminho])
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(o6)")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(d6)")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(o6, d6)")
+    else:
+        con.execute(f"CREATE TABLE {tabela} AS SELECT * FROM read_parquet(?)", [caminho])
+
+    clusterizada = None
+    if cluster:
+        chaves = _od_key_columns(con, tabela)
+        if chaves and chaves != ['o6', 'd6']:
+            # Tabelas com o6/d6 já saem ordenadas; as demais são reordenadas aqui
+            con.execute(f"CREATE OR REPLACE TABLE {tabela} AS SELECT * FROM {tabela} ORDER BY {', '.join(chaves)}")
+        if chaves:
+            clusterizada = (tabela, caminho, chaves)
+
+    # Adicionar índices para otimização de consultas - especialmente importante para as tabelas grandes
+    # (partições por região das tabelas de centralidades: _create_region_partitions)
+    if 'utp' in tabela:
+        # Para as tabelas UTP - verificar se é tabela de voos ou classificação
+        if 'classificacao' in tabela:
+            # Tabela de classificação UTP usa nomes diferentes
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(mun_origem)")
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(mun_destino)")
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(mun_origem, mun_destino)")
+        else:
+            # Tabelas de voos UTP
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(UTP_origem)")
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(UTP_destino)")
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(UTP_origem, UTP_destino)")
+    return clusterizada
+
+
+def create_duckdb_and_import_all_data(temp_db_path: str, dados_base: str = DADOS_DIR, cluster: bool = False,
+                                      row_group_size: int = None, jobs: int = None,
+                                      manifest_path: str = None, region_partitions: bool = False) -> bool:
+    """Importa as fontes em paralelo (um cursor por tabela) e recria as tabelas derivadas.
+
+    Com manifest_path, o banco é de trabalho persistente: só as tabelas cujo SHA-256 da fonte
+    mudou (ou cujas opções de build mudaram) são reimportadas. Devolve False se nada mudou.
+    """
+    if cluster and not row_group_size:
+        row_group_size = CLUSTER_ROW_GROUP_SIZE
+    opcoes = {'cluster': bool(cluster), 'row_group_size': row_group_size}
+    if region_partitions:
+        opcoes['region_partitions'] = True
+
+    manifest = _read_manifest(manifest_path) if manifest_path else {}
+    if manifest and manifest.get('opcoes') != opcoes:
+        # Row groups/ordenação de tabelas antigas não mudam in-place: refaz do zero
+        logger.info('Opções de build mudaram: reconstrução completa')
+        manifest = {}
+    if manifest_path and not manifest and os.path.exists(temp_db_path):
+        os.remove(temp_db_path)
+    anteriores = manifest.get('tabelas', {})
+
+    fontes = [(t, c, f) for t, c, f in _fontes(dados_base) if os.path.exists(c)]
+    hashes = {tabela: _sha256_arquivo(caminho) for tabela, caminho, _ in fontes} if manifest_path else {}
+    pendentes = [
+        (tabela, caminho, formato) for tabela, caminho, formato in fontes
+        if not manifest_path or anteriores.get(tabela, {}).get('sha256') != hashes[tabela]
+    ]
+    removidas = sorted(set(anteriores) - {tabela for tabela, _, _ in fontes})
+    if manifest_path and not pendentes and not removidas and os.path.exists(temp_db_path):
+        logger.info('Nenhuma entrada mudou desde o último build')
+        return False
+
+    con = _connect_build_db(temp_db_path, row_group_size)
+    clusterizadas = []
+    tempos = {}
+    try:
+        for tabela in removidas:
+            con.execute(f"DROP TABLE IF EXISTS {tabela}")
+            logger.info(f'  {tabela}: fonte removida, tabela descartada')
+
+        def _importar(fonte):
+            tabela, caminho, formato = fonte
+            inicio = time.perf_counter()
+            cursor = _build_cursor(con, row_group_size)
+            try:
+                clusterizada = _import_table(cursor, tabela, caminho, formato, cluster)
+                linhas = cursor.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+            finally:
+                cursor.close()
+            return tabela, clusterizada, linhas, time.perf_counter() - inicio
+
+        workers = max(1, min(jobs or os.cpu_count() or 1, len(pendentes) or 1))
+        logger.info(f'Importando {len(pendentes)} de {len(fontes)} tabelas ({workers} em paralelo)')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for tabela, clusterizada, linhas, segundos in executor.map(_importar, pendentes):
+                tempos[tabela] = segundos
+                logger.info(f'  {tabela}: {linhas} linhas em {segundos:.2f}s')
+                if clusterizada:
+                    clusterizadas.append(clusterizada)
+
+        # Tabelas derivadas para o app (consultas por chave em vez de varreduras)
+        for etapa in (_create_od_adjacency, _create_od_distancias, _create_entity_dictionary,
+                      _create_region_partitions, _create_dashboard_stats):
+            inicio = time.perf_counter()
+            if etapa is _create_region_partitions:
+                etapa(con, ativo=region_partitions)
+            else:
+                etapa(con)
+            logger.info(f'  {etapa.__name__[len("_create_"):]}: {time.perf_counter() - inicio:.2f}s')
+
+        con.commit()
+        
+        if clusterizadas:
+            _zone_map_report(con, clusterizadas, row_group_size, os.path.dirname(temp_db_path))
+    finally:
+        con.close()
+
+    if manifest_path:
+        _write_manifest(manifest_path, {
+            'versao': _MANIFEST_VERSION,
+            'opcoes': opcoes,
+            'tabelas': {
+                tabela: {
+                    'arquivo': os.path.relpath(caminho, dados_base),
+                    'sha256': hashes[tabela],
+                    'segundos': round(tempos.get(tabela, anteriores.get(tabela, {}).get('segundos', 0.0)), 3),
+                }
+                for tabela, caminho, _ in fontes
+            },
+        })
+    return True
+
+
+def build_encrypted_db(enc_path: str, key: bytes, dados_base: str = DADOS_DIR, cluster: bool = False,
+                       row_group_size: int = None, incremental: bool = False, jobs: int = None,
+                       region_partitions: bool = False) -> str:
+    """Gera enc_path (container em frames) a partir das fontes de dados_base; devolve enc_path"""
+    os.makedirs(os.path.dirname(os.path.abspath(enc_path)), exist_ok=True)
+    inicio = time.perf_counter()
+    if incremental:
+        # Banco de trabalho persistente + manifesto com o SHA-256 de cada fonte
+        work_dir = os.path.join(dados_base, '.build')
+        os.makedirs(work_dir, exist_ok=True)
+        work_db = os.path.join(work_dir, 'od_aereo.duckdb')
+        manifest_path = os.path.join(work_dir, 'manifest.json')
+        alterado = create_duckdb_and_import_all_data(
+            work_db, dados_base, cluster=cluster, row_group_size=row_group_size, jobs=jobs,
+            manifest_path=manifest_path, region_partitions=region_partitions,
+        )
+        # Mesmas entradas não bastam: o .enc existente precisa ter sido gerado com a chave atual
+        # (troca de FILES_PASSWORD/CRYPTO_* exige recriptografar)
+        impressao = key_fingerprint(key)
+        manifest = _read_manifest(manifest_path)
+        if not alterado and os.path.exists(enc_path) and manifest.get('chave') == impressao:
+            logger.info(f'DB criptografado já atualizado: {enc_path}')
+            return enc_path
+        if not alterado:
+            logger.info('Chave de criptografia mudou (ou .enc ausente): recriptografando')
+        _encrypt_db(work_db, enc_path, key)
+        if manifest:
+            manifest['chave'] = impressao
+            _write_manifest(manifest_path, manifest)
+    else:
+        with tempfile.TemporaryDirectory() as td:
+            tmp_db = os.path.join(td, 'od_aereo.duckdb')
+            create_duckdb_and_import_all_data(tmp_db, dados_base, cluster=cluster,
+                                              row_group_size=row_group_size, jobs=jobs,
+                                              region_partitions=region_partitions)
+            _encrypt_db(tmp_db, enc_path, key)
+    logger.info(f'DB criptografado gerado em: {enc_path} ({time.perf_counter() - inicio:.1f}s)')
+    return enc_path
+
+
+def _encrypt_db(db_path: str, enc_path: str, key: bytes) -> None:
+    # Criptografia em frames direto do arquivo: memória limitada a um frame
+    inicio = time.perf_counter()
+    tmp_enc = f"{enc_path}.{os.getpid()}.tmp"
+    try:
+        encrypt_file_stream(db_path, tmp_enc, key)
+        os.replace(tmp_enc, enc_path)
+    finally:
+        if os.path.exists(tmp_enc):
+            os.remove(tmp_enc)
+    logger.info(f'  criptografia: {time.perf_counter() - inicio:.2f}s')
@@ -0,0 +1,210 @@
+"""Criptografia do banco: chave multicamada (PBKDF2 -> Scrypt -> HKDF) e container em frames AES-GCM"""
+import base64
+import gzip
+import hashlib
+import os
+import struct
+import zlib
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+# Identifica os parâmetros do KDF: mudar qualquer camada invalida os caches de chave
+KDF_VERSION = "pbkdf2-sha512-200000/scrypt-2^14-8-1/hkdf-sha256/v1"
+
+# Container em frames: cabeçalho + frames AES-GCM independentes (zlib por frame).
+# Permite descriptografar direto para o disco com memória limitada a um frame.
+_STREAM_MAGIC = b'ODAEFRM1'
+_STREAM_HEADER = struct.Struct('>8sI8s')       # magic, tamanho do frame, prefixo do nonce
+_STREAM_FRAME_HEADER = struct.Struct('>I?')    # tamanho do ciphertext, frame final
+STREAM_FRAME_SIZE = 4 * 1024 * 1024
+_STREAM_MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# Nome no secrets.toml/ambiente de cada parâmetro criptográfico
+SECRETS_CONFIG = {
+    'salt_primary': 'CRYPTO_SALT_PRIMARY',
+    'salt_secondary': 'CRYPTO_SALT_SECONDARY',
+    'pepper': 'CRYPTO_PEPPER',
+    'entropy_factor': 'SYSTEM_ENTROPY_FACTOR',
+    'integrity_key': 'INTEGRITY_CHECK_KEY',
+}
+
+
+def config_from_secrets(secrets: dict) -> dict:
+    """Configuração criptográfica (salt_primary, pepper, ...) a partir dos nomes do secrets.toml"""
+    return {chave: secrets.get(nome) or '' for chave, nome in SECRETS_CONFIG.items()}
+
+
+def decode_b64_value(value) -> bytes:
+    """Decodifica valores 'b64:...' do secrets.toml; demais valores viram bytes UTF-8"""
+    if isinstance(value, str) and value.startswith('b64:'):
+        return base64.b64decode(value[4:])
+    return (value or '').encode()
+
+
+def _fixed_entropy(config: dict) -> bytes:
+    # Entropia determinística derivada das configurações: mesma chave em todos os ambientes
+    componentes = [config['entropy_factor'], config['salt_primary'], config['salt_secondary'],
+                   "od_aero_fixed_entropy_2024"]
+    return hashlib.sha256("_".join(c or '' for c in componentes).encode()).digest()
+
+
+def compute_multilayer_key(password: str, config: dict) -> bytes:
+    """Chave Fernet (base64) derivada da senha; ValueError se a configuração não decodifica"""
+    if not password:
+        raise ValueError('FILES_PASSWORD não definido')
+    salt_primary = decode_b64_value(config['salt_primary'])
+    salt_secondary = decode_b64_value(config['salt_secondary'])
+    pepper = decode_b64_value(config['pepper'])
+    integrity_key = decode_b64_value(config['integrity_key'])
+
+    fixed_entropy = _fixed_entropy(config)
+    enhanced_password = f"{password}_{config['entropy_factor'] or ''}"
+
+    # PBKDF2 -> Scrypt (resistente a ataques de hardware) -> HKDF
+    intermediate_key1 = PBKDF2HMAC(
+        algorithm=hashes.SHA512(),
+        length=64,
+        salt=salt_primary + fixed_entropy[:16],
+        iterations=200000,
+    ).derive(enhanced_password.encode())
+    intermediate_key2 = Scrypt(
+        length=32,
+        salt=salt_secondary + pepper[:16],
+        n=2**14,
+        r=8,
+        p=1,
+    ).derive(intermediate_key1[:32])
+    final_key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=integrity_key + fixed_entropy[16:],
+        info=b"od_aero_final_key_derivation_2024",
+    ).derive(intermediate_key2 + pepper)
+    return base64.urlsafe_b64encode(final_key)
+
+
+def encrypt_bytes(data: bytes, key: bytes) -> bytes:
+    """Formato legado: blob único gzip + Fernet"""
+    return Fernet(key).encrypt(gzip.compress(data))
+
+
+def decrypt_bytes(encrypted_data: bytes, key: bytes) -> bytes:
+    decrypted = Fernet(key).decrypt(encrypted_data)
+    try:
+        return gzip.decompress(decrypted)
+    except OSError:
+        return decrypted
+
+
+def _derive_stream_key(fernet_key: bytes) -> bytes:
+    """Subchave AES-256-GCM dos frames a partir da chave multicamada"""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"od_aero_stream_frames_v1",
+    ).derive(base64.urlsafe_b64decode(fernet_key))
+
+
+def key_fingerprint(fernet_key: bytes) -> str:
+    """Identificador não reversível da chave (HKDF próprio): detecta troca de chave sem expô-la"""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=16,
+        salt=None,
+        info=b"od_aero_key_fingerprint_v1",
+    ).derive(base64.urlsafe_b64decode(fernet_key)).hex()
+
+
+def _frame_nonce(nonce_prefix: bytes, index: int) -> bytes:
+    return nonce_prefix + struct.pack('>I', index)
+
+
+def _frame_aad(header: bytes, index: int, is_last: bool) -> bytes:
+    # Índice e flag de frame final autenticados: impede reordenação e truncamento
+    return header + struct.pack('>I?', index, is_last)
+
+
+def is_stream_container(enc_path: str) -> bool:
+    with open(enc_path, 'rb') as f:
+        return f.read(len(_STREAM_MAGIC)) == _STREAM_MAGIC
+
+
+def encrypt_file_stream(src_path: str, dst_path: str, key: bytes, frame_size: int = STREAM_FRAME_SIZE) -> int:
+    """Criptografa src_path em frames, lendo um frame por vez. Retorna bytes escritos."""
+    aesgcm = AESGCM(_derive_stream_key(key))
+    nonce_prefix = os.urandom(8)
+    header = _STREAM_HEADER.pack(_STREAM_MAGIC, frame_size, nonce_prefix)
+
+    written = 0
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        dst.write(header)
+        written += len(header)
+        index = 0
+        chunk = src.read(frame_size)
+        while True:
+            next_chunk = src.read(frame_size)
+            is_last = not next_chunk
+            ciphertext = aesgcm.encrypt(
+                _frame_nonce(nonce_prefix, index),
+                zlib.compress(chunk, 6),
+                _frame_aad(header, index, is_last),
+            )
+            dst.write(_STREAM_FRAME_HEADER.pack(len(ciphertext), is_last))
+            dst.write(ciphertext)
+            written += _STREAM_FRAME_HEADER.size + len(ciphertext)
+            if is_last:
+                break
+            chunk = next_chunk
+            index += 1
+    return written
+
+
+def decrypt_file_stream(enc_path: str, dst_path: str, key: bytes) -> int:
+    """Descriptografa o container frame a frame direto para dst_path. Retorna bytes escritos."""
+    aesgcm = AESGCM(_derive_stream_key(key))
+
+    written = 0
+    with open(enc_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        header = src.read(_STREAM_HEADER.size)
+        if len(header) != _STREAM_HEADER.size:
+            raise ValueError('Container criptografado truncado (cabeçalho)')
+        magic, frame_size, nonce_prefix = _STREAM_HEADER.unpack(header)
+        if magic != _STREAM_MAGIC:
+            raise ValueError('Arquivo não está no formato de container em frames')
+        if not 0 < frame_size <= _STREAM_MAX_FRAME_SIZE:
+            raise ValueError(f'Tamanho de frame inválido: {frame_size}')
+
+        index = 0
+        while True:
+            frame_header = src.read(_STREAM_FRAME_HEADER.size)
+            if len(frame_header) != _STREAM_FRAME_HEADER.size:
+                raise ValueError('Container criptografado truncado (frame final ausente)')
+            length, is_last = _STREAM_FRAME_HEADER.unpack(frame_header)
+            if length > frame_size + 1024 + frame_size // 100:
+                raise ValueError(f'Frame {index} com tamanho inválido: {length}')
+            ciphertext = src.read(length)
+            if len(ciphertext) != length:
+                raise ValueError(f'Container criptografado truncado (frame {index})')
+            compressed = aesgcm.decrypt(
+                _frame_nonce(nonce_prefix, index),
+                ciphertext,
+                _frame_aad(header, index, is_last),
+            )
+            decompressor = zlib.decompressobj()
+            plain = decompressor.decompress(compressed, frame_size)
+            if decompressor.unconsumed_tail or not decompressor.eof:
+                raise ValueError(f'Frame {index} excede o tamanho declarado')
+            dst.write(plain)
+            written += len(plain)
+            if is_last:
+                break
+            index += 1
+        if src.read(1):
+            raise ValueError('Dados inesperados após o frame final')
+    return written
@@ -0,0 +1,87 @@
+"""Dicionário de entidades (municípios e UTPs) em colunas: rótulo, UF, coordenadas, UTP e sede por código"""
+import polars as pl
+
+MUNICIPIO = 'municipio'
+UTP = 'utp'
+
+# Regiões por UF: as rotas de centralidades têm uma partição física por região da UF de origem
+REGIOES_UF = {
+    'norte': ('AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'),
+    'nordeste': ('AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'),
+    'centro_oeste': ('DF', 'GO', 'MS', 'MT'),
+    'sudeste': ('ES', 'MG', 'RJ', 'SP'),
+    'sul': ('PR', 'RS', 'SC'),
+}
+_REGIAO_POR_UF = {uf: regiao for regiao, ufs in REGIOES_UF.items() for uf in ufs}
+
+
+def regiao_da_uf(uf) -> str:
+    """Região da UF, ou None se a UF é desconhecida"""
+    return _REGIAO_POR_UF.get(str(uf or '').strip().upper())
+
+# Uma linha por município e por UTP a partir de mun_utps (UTPs: UF e coordenadas do município sede)
+ENTITY_DICTIONARY_SQL = """
+    SELECT
+      'municipio' AS tipo,
+      CAST(SUBSTR(CAST(municipio AS VARCHAR),1,6) AS INTEGER) AS codigo,
+      any_value(nome_municipio) || COALESCE(', ' || NULLIF(any_value(uf), ''), '') AS rotulo,
+      any_value(nome_municipio) AS nome,
+      any_value(uf) AS uf,
+      any_value(lat_utp) AS lat,
+      any_value(long_utp) AS lon,
+      any_value(CAST(utp AS INTEGER)) AS utp,
+      bool_or(COALESCE(sede, false)) AS sede
+    FROM mun_utps
+    GROUP BY 2
+    UNION ALL
+    SELECT
+      'utp',
+      CAST(utp AS INTEGER),
+      CAST(CAST(utp AS INTEGER) AS VARCHAR) || ' - ' || COALESCE(any_value(nome_utp), 'UTP ' || CAST(utp AS INTEGER)),
+      any_value(nome_utp),
+      any_value(uf) FILTER (WHERE sede),
+      any_value(lat_utp) FILTER (WHERE sede),
+      any_value(long_utp) FILTER (WHERE sede),
+      CAST(utp AS INTEGER),
+      true
+    FROM mun_utps
+    GROUP BY 2
+    ORDER BY 1, 2
+"""
+
+
+class DicionarioEntidades:
+    """Lookup compartilhado por todas as páginas, montado uma vez a partir de entity_dictionary.
+
+    Os dicionários código -> rótulo / (lat, lon) de cada tipo são montados direto das colunas
+    (códigos como texto, na mesma forma usada pela barra lateral), sem laço por linha.
+    """
+
+    def __init__(self, entidades: pl.DataFrame, aeroportos: pl.DataFrame):
+        self._rotulos = {}
+        self._coords = {}
+        self._ufs = {}
+        for tipo in (MUNICIPIO, UTP):
+            df = entidades.filter(pl.col('tipo') == tipo).with_columns(pl.col('codigo').cast(pl.Utf8))
+            colunas = {nome: df[nome].to_list() for nome in df.columns if nome != 'tipo'}
+            self._rotulos[tipo] = dict(zip(colunas['codigo'], colunas['rotulo']))
+            self._coords[tipo] = dict(zip(colunas['codigo'], zip(colunas['lat'], colunas['lon'])))
+            self._ufs[tipo] = dict(zip(colunas['codigo'], colunas['uf']))
+        self.aeroportos = dict(zip(
+            aeroportos['icao'].to_list(),
+            zip(aeroportos['latitude'].to_list(), aeroportos['longitude'].to_list()),
+        ))
+
+    def total(self, tipo: str) -> int:
+        return len(self._rotulos[tipo])
+
+    def rotulos(self, tipo: str) -> dict:
+        """{código: rótulo de exibição} ("Nome, UF" para municípios, "N - Nome" para UTPs)"""
+        return self._rotulos[tipo]
+
+    def ufs(self, tipo: str) -> dict:
+        return self._ufs[tipo]
+
+    def coords(self, tipo: str) -> dict:
+        """{código: (lat, lon)}; UTPs usam as coordenadas do município sede"""
+        return self._coords[tipo]
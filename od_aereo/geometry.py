@@ -0,0 +1,54 @@
+"""Geometria vetorizada (NumPy): distâncias, rumos e curvas de Bézier para os mapas de rotas"""
+from functools import lru_cache
+
+import numpy as np
+
+RAIO_TERRA_KM = 6371.0
+PONTOS_CURVA = 21
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distância em linha reta (km) entre pares de pontos; aceita escalares ou arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(a))
+
+
+def bearing_graus(lat1, lon1, lat2, lon2):
+    """Rumo inicial (graus, -180..180) de cada origem para o destino; aceita escalares ou arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y))
+
+
+def curvas_bezier(inicios, fins, weight=0.2, pontos: int = PONTOS_CURVA) -> np.ndarray:
+    """Curvas de Bézier quadráticas para N segmentos de uma vez.
+
+    inicios/fins: arrays (N, 2) de (lat, lon); weight escalar ou (N,). Retorna (N, pontos, 2).
+    """
+    inicios = np.asarray(inicios, dtype=np.float64).reshape(-1, 2)
+    fins = np.asarray(fins, dtype=np.float64).reshape(-1, 2)
+    weight = np.broadcast_to(np.asarray(weight, dtype=np.float64), (len(inicios),))[:, None]
+
+    # Ponto de controle deslocado proporcionalmente à extensão do segmento
+    delta = np.abs(fins - inicios)
+    controle = (inicios + fins) / 2 + weight * np.column_stack((delta[:, 1], -delta[:, 0]))
+
+    t = np.linspace(0.0, 1.0, pontos)[None, :, None]
+    return (
+        (1 - t) ** 2 * inicios[:, None, :]
+        + 2 * (1 - t) * t * controle[:, None, :]
+        + t ** 2 * fins[:, None, :]
+    )
+
+
+@lru_cache(maxsize=4096)
+def _curva_memo(lat1: float, lon1: float, lat2: float, lon2: float, weight: float) -> tuple:
+    return tuple(map(tuple, curvas_bezier([(lat1, lon1)], [(lat2, lon2)], weight)[0].tolist()))
+
+
+def curva(inicio, fim, weight: float = 0.2) -> tuple:
+    """Vértices (lat, lon) da curva entre dois pontos, memorizados para pares de aeroportos recorrentes"""
+    return _curva_memo(float(inicio[0]), float(inicio[1]), float(fim[0]), float(fim[1]), float(weight))
@@ -0,0 +1,164 @@
+"""Cache de resultados por par OD compartilhado entre sessões: limite em bytes, LRU + frequência"""
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+
+# Entradas mais antigas (LRU) avaliadas a cada despejo; sai a de menor frequência por byte
+_AMOSTRA_DESPEJO = 8
+# Pedidos acumulados entre gravações da contagem em disco
+_PEDIDOS_POR_GRAVACAO = 50
+# Pares mantidos na contagem quando não informado; a memória poda ao passar do dobro
+_MAX_PARES_CONTADOS = 1000
+
+
+def tamanho_frames(valor) -> int:
+    """Bytes estimados de um frame Polars ou de uma tupla de frames"""
+    frames = valor if isinstance(valor, tuple) else (valor,)
+    return sum(int(df.estimated_size()) for df in frames if hasattr(df, 'estimated_size'))
+
+
+def _chave_texto(chave: tuple) -> str:
+    return '|'.join(str(parte) for parte in chave)
+
+
+def _podar(contagem: Counter, n: int) -> Counter:
+    """Só os n pares mais pedidos"""
+    if len(contagem) <= n:
+        return contagem
+    return Counter(dict(contagem.most_common(n)))
+
+
+class CachePares:
+    """Resultados por chave (nível, origem, destino) com orçamento de bytes e contadores.
+
+    A ordem de uso é LRU; no despejo, entre as entradas mais antigas sai a com menos acessos por
+    byte, para um par grande e raro não expulsar vários pares pequenos e populares. A contagem de
+    pedidos por par é persistida em JSON e alimenta o pré-aquecimento (`mais_pedidos`); ela guarda
+    só os `max_pares` mais pedidos, e cada gravação soma ao arquivo os pedidos desde a última, para
+    processos que compartilham o arquivo não apagarem a contagem uns dos outros.
+    """
+
+    def __init__(self, max_bytes: int, caminho_contagem: str = None, tamanho=tamanho_frames,
+                 max_pares: int = _MAX_PARES_CONTADOS):
+        self.max_bytes = max_bytes
+        self._tamanho = tamanho
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # chave -> (valor, bytes)
+        self._acessos = Counter()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._caminho_contagem = caminho_contagem
+        self.max_pares = max(1, max_pares)
+        self._pedidos = _podar(Counter(self._ler_contagem()), self.max_pares)
+        self._novos = Counter()  # pedidos ainda não somados ao arquivo
+        self._pendentes = 0
+
+    def _ler_contagem(self) -> dict:
+        if not self._caminho_contagem or not os.path.exists(self._caminho_contagem):
+            return {}
+        try:
+            with open(self._caminho_contagem, 'r', encoding='utf-8') as f:
+                return {k: int(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def gravar_contagem(self) -> None:
+        """Soma ao arquivo os pedidos desde a última gravação, poda aos max_pares (escrita atômica)"""
+        if not self._caminho_contagem:
+            return
+        with self._lock:
+            novos, self._novos = self._novos, Counter()
+            self._pendentes = 0
+        try:
+            dados = _podar(Counter(self._ler_contagem()) + novos, self.max_pares)
+            tmp = f"{self._caminho_contagem}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(dict(dados), f)
+            os.replace(tmp, self._caminho_contagem)
+        except OSError:
+            with self._lock:
+                # Os pedidos voltam para a próxima gravação
+                self._novos = _podar(self._novos + novos, self.max_pares)
+            raise
+        with self._lock:
+            # Arquivo (com os pedidos dos outros processos) + o que chegou durante a escrita
+            self._pedidos = _podar(dados + self._novos, self.max_pares)
+
+    def mais_pedidos(self, n: int) -> list:
+        """As n chaves mais pedidas, como tuplas de texto (nível, origem, destino)"""
+        with self._lock:
+            return [tuple(chave.split('|')) for chave, _ in self._pedidos.most_common(n)]
+
+    def _despejar(self) -> None:
+        # Chamar com o lock
+        while self._bytes > self.max_bytes and self._itens:
+            candidatos = []
+            for i, chave in enumerate(self._itens):
+                if i >= _AMOSTRA_DESPEJO:
+                    break
+                candidatos.append(chave)
+            vitima = min(candidatos, key=lambda c: self._acessos[c] / max(self._itens[c][1], 1))
+            _, tamanho = self._itens.pop(vitima)
+            self._acessos.pop(vitima, None)
+            self._bytes -= tamanho
+            self.evictions += 1
+
+    def get(self, chave: tuple, contar: bool = True):
+        """Valor em cache ou None; `contar` registra o pedido na contagem persistida"""
+        gravar = False
+        with self._lock:
+            if contar:
+                texto = _chave_texto(chave)
+                self._pedidos[texto] += 1
+                self._novos[texto] += 1
+                if len(self._pedidos) > 2 * self.max_pares:
+                    self._pedidos = _podar(self._pedidos, self.max_pares)
+                self._pendentes += 1
+                gravar = self._pendentes >= _PEDIDOS_POR_GRAVACAO
+            item = self._itens.get(chave)
+            if item is None:
+                self.misses += 1
+            else:
+                self._itens.move_to_end(chave)
+                self._acessos[chave] += 1
+                self.hits += 1
+        if gravar:
+            try:
+                self.gravar_contagem()
+            except OSError:
+                pass
+        return None if item is None else item[0]
+
+    def put(self, chave: tuple, valor) -> None:
+        tamanho = self._tamanho(valor)
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._itens[chave] = (valor, tamanho)
+            self._acessos[chave] += 1
+            self._bytes += tamanho
+            self._despejar()
+
+    def get_or_load(self, chave: tuple, carregar, contar: bool = True):
+        valor = self.get(chave, contar=contar)
+        if valor is None:
+            valor = carregar()
+            self.put(chave, valor)
+        return valor
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                'entradas': len(self._itens),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
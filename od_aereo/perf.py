@@ -0,0 +1,93 @@
+"""Medição das etapas quentes: spans com duração e linhas por execução do script, log em JSONL"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_LOCK_LOG = threading.Lock()
+
+
+def contar_linhas(valor):
+    """Linhas de um frame, de uma tupla/lista de frames, de uma coleção ou contagem pronta; senão None"""
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor
+    if hasattr(valor, 'height'):
+        return int(valor.height)
+    if isinstance(valor, (tuple, list)) and valor and all(hasattr(v, 'height') for v in valor):
+        return sum(int(v.height) for v in valor)
+    if hasattr(valor, '__len__'):
+        return len(valor)
+    return None
+
+
+class Medicao:
+    """Spans de uma execução (rerun ou provisionamento), na ordem de abertura.
+
+    Cada span tem etapa, duração em ms (None enquanto aberto), linhas (opcional) e profundidade de
+    aninhamento; trechos de `registrar` entram ao terminar. Uma instância é usada por uma única
+    thread; leituras de outras threads usam `spans()` (cópia).
+    """
+
+    def __init__(self):
+        self.inicio = time.time()
+        self._t0 = time.perf_counter()
+        self._spans = []
+        self._profundidade = 0
+
+    @contextmanager
+    def span(self, etapa: str, linhas=None):
+        """Mede o bloco; o dict produzido aceita `linhas` preenchido dentro do bloco"""
+        registro = {'etapa': etapa, 'ms': None, 'linhas': linhas, 'profundidade': self._profundidade}
+        self._spans.append(registro)
+        self._profundidade += 1
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            self._profundidade -= 1
+            registro['ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+    def registrar(self, etapa: str, inicio: float, linhas=None) -> None:
+        """Span de um trecho iniciado em `inicio` (time.perf_counter) e que termina agora"""
+        self._spans.append({
+            'etapa': etapa,
+            'ms': round((time.perf_counter() - inicio) * 1000, 2),
+            'linhas': linhas,
+            'profundidade': self._profundidade,
+        })
+
+    def spans(self) -> list:
+        return [dict(s) for s in self._spans]
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def como_registro(self, **contexto) -> dict:
+        """Registro estruturado da execução (uma linha do JSONL)"""
+        return {
+            'ts': round(self.inicio, 3),
+            **contexto,
+            'total_ms': self.total_ms(),
+            'spans': self.spans(),
+        }
+
+
+def gravar_jsonl(caminho: str, registro: dict, max_bytes: int = 0) -> None:
+    """Acrescenta o registro como uma linha JSON (um lock por processo serializa as sessões).
+
+    Com `max_bytes`, um arquivo que já passou do limite vira `<caminho>.1` (substituindo o anterior)
+    e a gravação recomeça num arquivo novo.
+    """
+    if not caminho:
+        return
+    linha = json.dumps(registro, ensure_ascii=False, default=str)
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    with _LOCK_LOG:
+        os.makedirs(pasta, exist_ok=True)
+        if max_bytes > 0 and os.path.exists(caminho) and os.path.getsize(caminho) >= max_bytes:
+            os.replace(caminho, f"{caminho}.1")
+        with open(caminho, 'a', encoding='utf-8') as f:
+            f.write(linha + '\n')
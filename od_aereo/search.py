@@ -0,0 +1,117 @@
+"""Índice de busca das entidades da barra lateral (municípios/UTPs): prefixos ordenados + trigramas"""
+import bisect
+import heapq
+import re
+import unicodedata
+
+_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+# Faixas de relevância (menor = melhor)
+_EXATO, _PREFIXO_ROTULO, _PREFIXO_PALAVRA, _SUBSTRING = range(4)
+
+
+def normalizar(texto) -> str:
+    """Minúsculas, sem acentos e com pontuação trocada por espaço"""
+    if not texto:
+        return ""
+    decomposto = unicodedata.normalize('NFD', str(texto).lower())
+    sem_acentos = ''.join(c for c in decomposto if unicodedata.category(c) != 'Mn')
+    return _NAO_ALFANUMERICO.sub(' ', sem_acentos).strip()
+
+
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceBusca:
+    """Índice imutável de {código: rótulo}, construído uma vez por nível de análise.
+
+    Rótulos ficam na ordem de exibição da barra lateral; `buscar` devolve os k melhores
+    rótulos (exato > início do rótulo > início de palavra > trecho) usando busca binária
+    sobre as palavras ordenadas e listas de trigramas para os trechos.
+    """
+
+    def __init__(self, entradas: dict, is_utp: bool = False):
+        if is_utp:
+            # UTPs ordenadas pelo número do início do rótulo ("12 - Nome")
+            chave = lambda item: int(item[1].split(' - ')[0]) if ' - ' in item[1] else 0
+        else:
+            chave = lambda item: item[1]
+        itens = sorted(((str(cod), rotulo) for cod, rotulo in entradas.items()), key=chave)
+
+        self.codigos = [cod for cod, _ in itens]
+        self.rotulos = [rotulo for _, rotulo in itens]
+        self._codigo_por_rotulo = {rotulo: cod for cod, rotulo in itens}
+        self._posicao_codigo = {cod: i for i, cod in enumerate(self.codigos)}
+        # Texto pesquisável de cada entrada: rótulo normalizado + código
+        self._textos = [f"{normalizar(rotulo)} {cod}" for cod, rotulo in itens]
+
+        palavras = []
+        trigramas = {}
+        for i, texto in enumerate(self._textos):
+            for palavra in set(texto.split()):
+                palavras.append((palavra, i))
+            for tri in _trigramas(texto):
+                trigramas.setdefault(tri, []).append(i)
+        palavras.sort()
+        self._palavras = [p for p, _ in palavras]
+        self._palavras_idx = [i for _, i in palavras]
+        self._trigramas = {tri: frozenset(ids) for tri, ids in trigramas.items()}
+
+    def __len__(self) -> int:
+        return len(self.rotulos)
+
+    def codigo(self, rotulo: str) -> str:
+        return self._codigo_por_rotulo.get(rotulo, "")
+
+    def opcoes(self, codigos=None) -> list:
+        """Rótulos na ordem de exibição, opcionalmente restritos a um conjunto de códigos"""
+        if codigos is None:
+            return list(self.rotulos)
+        posicoes = sorted(self._posicao_codigo[c] for c in map(str, codigos) if c in self._posicao_codigo)
+        return [self.rotulos[i] for i in posicoes]
+
+    def _por_prefixo(self, termo: str) -> set:
+        inicio = bisect.bisect_left(self._palavras, termo)
+        fim = bisect.bisect_left(self._palavras, termo + '\uffff', lo=inicio)
+        return set(self._palavras_idx[inicio:fim])
+
+    def _por_trecho(self, termo: str) -> set:
+        listas = sorted((self._trigramas.get(tri, frozenset()) for tri in _trigramas(termo)), key=len)
+        if not listas:
+            return set()
+        candidatos = set(listas[0]).intersection(*listas[1:])
+        return {i for i in candidatos if termo in self._textos[i]}
+
+    def buscar(self, termo: str, k: int = 20, codigos=None) -> list:
+        """Até k rótulos mais relevantes para o termo (opcionalmente só entre os códigos dados)"""
+        termo = normalizar(termo)
+        permitidos = None
+        if codigos is not None:
+            permitidos = {self._posicao_codigo[c] for c in map(str, codigos) if c in self._posicao_codigo}
+        if not termo:
+            return self.opcoes(codigos)[:k]
+
+        # A primeira palavra do termo restringe por prefixo; termos com 3+ letras também por trecho
+        primeira = termo.split()[0]
+        candidatos = self._por_prefixo(primeira)
+        if len(termo) >= 3:
+            candidatos |= self._por_trecho(termo)
+        if permitidos is not None:
+            candidatos &= permitidos
+
+        ranqueados = []
+        for i in candidatos:
+            texto = self._textos[i]
+            if termo not in texto:
+                continue
+            if texto.startswith(termo + ' ') or texto == termo:
+                faixa = _EXATO
+            elif texto.startswith(termo):
+                faixa = _PREFIXO_ROTULO
+            elif f" {termo}" in texto:
+                faixa = _PREFIXO_PALAVRA
+            else:
+                faixa = _SUBSTRING
+            ranqueados.append((faixa, len(texto), i))
+        return [self.rotulos[i] for _, _, i in heapq.nsmallest(k, ranqueados)]
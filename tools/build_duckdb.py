@@ -1,14 +1,13 @@
+"""Gera Dados/od_aereo.duckdb.enc a partir de Dados/Entrada e Dados/Resultados (pipeline em od_aereo.build)"""
 import os
-import base64
-import hashlib
-import tempfile
-import duckdb
+import sys
+import argparse
+import logging
 
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+# Raiz do repositório no path para os módulos compartilhados com o app (od_aereo)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from od_aereo.build import DADOS_DIR, CLUSTER_ROW_GROUP_SIZE, build_encrypted_db
+from od_aereo.crypto import compute_multilayer_key, config_from_secrets
 
 
 def _read_secrets():
@@ -36,207 +35,38 @@ def _read_secrets():
     return data
 
 
-def _decode_b64_value(value: str) -> bytes:
-    if isinstance(value, str) and value.startswith('b64:'):
-        return base64.b64decode(value[4:])
-    return (value or '').encode()
+def main():
+    parser = argparse.ArgumentParser(description='Gera Dados/od_aereo.duckdb.enc a partir de Dados/Entrada e Dados/Resultados')
+    parser.add_argument('--cluster', action='store_true',
+                        help='ordena todas as tabelas de rotas por origem/destino e imprime relatório de zone maps')
+    parser.add_argument('--row-group-size', type=int, default=None,
+                        help=f'linhas por row group (padrão com --cluster: {CLUSTER_ROW_GROUP_SIZE})')
+    parser.add_argument('--incremental', action='store_true',
+                        help='mantém o banco em Dados/.build e reimporta só as tabelas cujas fontes mudaram')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='tabelas importadas em paralelo (padrão: número de CPUs)')
+    parser.add_argument('--region-partitions', action='store_true',
+                        help='cria cópias por região das rotas de centralidades (consultas por par menores; '
+                             'essas rotas passam a ocupar o dobro no banco)')
+    parser.add_argument('--if-missing', action='store_true',
+                        help='só gera se o .enc não existir (passo de provisionamento no deploy, antes de subir o app)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    enc_path = os.path.join(DADOS_DIR, 'od_aereo.duckdb.enc')
+    if args.if_missing and os.path.exists(enc_path):
+        logging.info(f"OK: {enc_path} já existe - nada a gerar")
+        return
 
-
-def _generate_fixed_entropy(config: dict) -> bytes:
-    entropy_components = [
-        config.get('SYSTEM_ENTROPY_FACTOR', ''),
-        config.get('CRYPTO_SALT_PRIMARY', ''),
-        config.get('CRYPTO_SALT_SECONDARY', ''),
-        'od_aero_fixed_entropy_2024',
-    ]
-    combined = '_'.join(entropy_components)
-    return hashlib.sha256(combined.encode()).digest()
-
-
-def _derive_multilayer_key(password: str, config: dict) -> bytes:
-    if not password:
-        raise RuntimeError('FILES_PASSWORD não definido')
-
-    salt_primary = _decode_b64_value(config.get('CRYPTO_SALT_PRIMARY', ''))
-    salt_secondary = _decode_b64_value(config.get('CRYPTO_SALT_SECONDARY', ''))
-    pepper = _decode_b64_value(config.get('CRYPTO_PEPPER', ''))
-    integrity_key = _decode_b64_value(config.get('INTEGRITY_CHECK_KEY', ''))
-
-    fixed_entropy = _generate_fixed_entropy(config)
-    enhanced_password = f"{password}_{config.get('SYSTEM_ENTROPY_FACTOR','')}"
-
-    kdf1 = PBKDF2HMAC(
-        algorithm=hashes.SHA512(),
-        length=64,
-        salt=salt_primary + fixed_entropy[:16],
-        iterations=200000,
-    )
-    intermediate_key1 = kdf1.derive(enhanced_password.encode())
-
-    kdf2 = Scrypt(
-        length=32,
-        salt=salt_secondary + pepper[:16],
-        n=2**14,
-        r=8,
-        p=1,
-    )
-    intermediate_key2 = kdf2.derive(intermediate_key1[:32])
-
-    hkdf = HKDF(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=integrity_key + fixed_entropy[16:],
-        info=b"od_aero_final_key_derivation_2024",
-    )
-    final_key = hkdf.derive(intermediate_key2 + pepper)
-    return base64.urlsafe_b64encode(final_key)
-
-
-def _encrypt_bytes(data: bytes, password: str, config: dict) -> bytes:
-    key = _derive_multilayer_key(password, config)
-    fernet = Fernet(key)
-    try:
-        import gzip
-        compressed = gzip.compress(data)
-    except Exception:
-        compressed = data
-    return fernet.encrypt(compressed)
-
-
-def _create_duckdb_and_import_all_data(temp_db_path: str) -> None:
-    con = duckdb.connect(temp_db_path)
-    try:
-        dados_base = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Dados')
-
-        # CSVs
-        csv_mun_utps = os.path.join(dados_base, 'Entrada', 'mun_UTPs.csv')
-        if os.path.exists(csv_mun_utps):
-            con.execute("DROP TABLE IF EXISTS mun_utps")
-            con.execute("CREATE TABLE mun_utps AS SELECT * FROM read_csv_auto(?, header=true)", [csv_mun_utps])
-
-        csv_centralidades = os.path.join(dados_base, 'Entrada', 'centralidades.csv')
-        if os.path.exists(csv_centralidades):
-            con.execute("DROP TABLE IF EXISTS centralidades")
-            con.execute("CREATE TABLE centralidades AS SELECT * FROM read_csv_auto(?, header=true)", [csv_centralidades])
-            
-            # Criar índices para otimização de consultas por UF e município
-            con.execute("CREATE INDEX IF NOT EXISTS idx_centralidades_uf ON centralidades(uf)")
-            con.execute("CREATE INDEX IF NOT EXISTS idx_centralidades_municipio ON centralidades(municipio)")
-            con.execute("CREATE INDEX IF NOT EXISTS idx_centralidades_utp ON centralidades(utp)")
-
-        # Parquet aeroportos
-        pq_aeroportos = os.path.join(dados_base, 'Entrada', 'aeroportos.parquet')
-        if os.path.exists(pq_aeroportos):
-            con.execute("DROP TABLE IF EXISTS aeroportos")
-            con.execute("CREATE TABLE aeroportos AS SELECT * FROM read_parquet(?)", [pq_aeroportos])
-
-        # Resultados parquet
-        mapas = [
-            (
-                os.path.join(dados_base, 'Resultados', 'Pares OD - Por Municipio - Matriz Infra S.A. - 2019'),
-                {
-                    'Voos Comerciais.parquet': 'por_municipio_voos_comerciais',
-                    'Voos Executivos.parquet': 'por_municipio_voos_executivos',
-                    'classificacao_pares.parquet': 'por_municipio_classificacao',
-                },
-            ),
-            (
-                os.path.join(dados_base, 'Resultados', 'Pares OD - Agregação UTP - Matriz Infra S.A. - 2019'),
-                {
-                    'Voos Comerciais.parquet': 'utp_voos_comerciais',
-                    'Voos Executivos.parquet': 'utp_voos_executivos',
-                    'classificacao_pares.parquet': 'utp_classificacao',
-                },
-            ),
-            (
-                os.path.join(dados_base, 'Resultados', 'Pares OD - Municipio x Centralidade'),
-                {
-                    'Voos Comerciais.parquet': 'mun_centralidade_voos_comerciais',
-                    'Voos Executivos.parquet': 'mun_centralidade_voos_executivos',
-                    'classificacao_pares.parquet': 'mun_centralidade_classificacao',
-                },
-            ),
-        ]
-
-        for pasta, nomes in mapas:
-            for arquivo, tabela in nomes.items():
-                caminho = os.path.join(pasta, arquivo)
-                if os.path.exists(caminho):
-                    con.execute(f"DROP TABLE IF EXISTS {tabela}")
-                    con.execute(f"CREATE TABLE {tabela} AS SELECT * FROM read_parquet(?)", [caminho])
-                    
-                    # Adicionar índices para otimização de consultas - especialmente importante para as tabelas grandes
-                    if 'mun_centralidade' in tabela:
-                        # Para as tabelas de centralidade que são as mais pesadas (125MB)
-                        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(cod_mun_origem)")
-                        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(cod_mun_destino)")
-                        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(cod_mun_origem, cod_mun_destino)")
-                        
-                        # Criar views materializadas particionadas por região para reduzir drasticamente uso de memória
-                        regioes = {
-                            'norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
-                            'nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
-                            'centro_oeste': ['DF', 'GO', 'MS', 'MT'],
-                            'sudeste': ['ES', 'MG', 'RJ', 'SP'],
-                            'sul': ['PR', 'RS', 'SC']
-                        }
-                        
-                        for regiao, ufs in regioes.items():
-                            ufs_str = "', '".join(ufs)
-                            con.execute(f"""
-                                CREATE VIEW IF NOT EXISTS {tabela}_{regiao} AS 
-                                SELECT v.* FROM {tabela} v
-                                INNER JOIN centralidades c_orig ON v.cod_mun_origem = c_orig.municipio
-                                INNER JOIN centralidades c_dest ON v.cod_mun_destino = c_dest.municipio
-                                WHERE c_orig.uf IN ('{ufs_str}') OR c_dest.uf IN ('{ufs_str}')
-                            """)
-                    
-                    elif 'por_municipio' in tabela:
-                        # Para as tabelas municipais também
-                        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(cod_mun_origem)")
-                        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(cod_mun_destino)")
-                        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(cod_mun_origem, cod_mun_destino)")
-                    
-                    elif 'utp' in tabela:
-                        # Para as tabelas UTP - verificar se é tabela de voos ou classificação
-                        if 'classificacao' in tabela:
-                            # Tabela de classificação UTP usa nomes diferentes
-                            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(mun_origem)")
-                            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(mun_destino)")
-                            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(mun_origem, mun_destino)")
-                        else:
-                            # Tabelas de voos UTP
-                            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_origem ON {tabela}(UTP_origem)")
-                            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_destino ON {tabela}(UTP_destino)")
-                            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_par ON {tabela}(UTP_origem, UTP_destino)")
-
-        con.commit()
-    finally:
-        con.close()
-
-
-def build_encrypted_db():
     secrets = _read_secrets()
     password = secrets.get('FILES_PASSWORD')
     if not password:
         raise RuntimeError('FILES_PASSWORD ausente em secrets.toml ou variáveis de ambiente')
-
-    enc_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Dados')
-    os.makedirs(enc_dir, exist_ok=True)
-    enc_path = os.path.join(enc_dir, 'od_aereo.duckdb.enc')
-
-    with tempfile.TemporaryDirectory() as td:
-        tmp_db = os.path.join(td, 'od_aereo.duckdb')
-        _create_duckdb_and_import_all_data(tmp_db)
-        with open(tmp_db, 'rb') as f:
-            plain = f.read()
-    enc = _encrypt_bytes(plain, password, secrets)
-    with open(enc_path, 'wb') as f:
-        f.write(enc)
-    print(f'DB criptografado gerado em: {enc_path}')
+    key = compute_multilayer_key(password, config_from_secrets(secrets))
+    build_encrypted_db(enc_path, key, cluster=args.cluster,
+                       row_group_size=args.row_group_size, incremental=args.incremental, jobs=args.jobs,
+                       region_partitions=args.region_partitions)
 
 
 if __name__ == '__main__':
-    build_encrypted_db()
-
-
+    main()